@@ -0,0 +1,293 @@
+"""fake WebDriver rendering a generated money page for ZaimCrawler.
+
+The driver answers the calls of the three extraction modes of ZaimCrawler
+('script', 'html' and 'webdriver') from an in-memory list of rows, shows only
+'window' rows at a time and advances by half a window on each scroll, like the
+lazily loaded list of zaim.net. The login form is emulated as well.
+
+    crawler = ZaimCrawler("user", "password", driver_factory=lambda: FakeWebDriver(1000))
+"""
+import datetime
+import html
+import random
+import re
+import time
+
+from selenium.webdriver.common.keys import Keys
+
+from pyzaim.crawler import (
+    ZAIM_EXTRACT_ROWS_SCRIPT,
+    ZAIM_RESULT_LIST_XPATH,
+    ZAIM_RESULT_ROW_XPATH,
+    ZAIM_ROW_BOUNDS_SCRIPT,
+    ZAIM_SCROLL_SCRIPT,
+)
+
+WEEKDAYS = "月火水木金土日"
+
+_MONTH_URL = re.compile(r"month=(\d{4})(\d{2})")
+
+
+def generate_rows(n, year, month, seed=0):
+    """return n raw rows of the money page of the month, from the newest.
+    """
+    rnd = random.Random(seed)
+    days = (datetime.date(year + month // 12, month % 12 + 1, 1) - datetime.timedelta(days=1)).day
+    rows = []
+    for i in range(n):
+        day = days - i * days // n
+        weekday = WEEKDAYS[datetime.date(year, month, day).weekday()]
+        kind = rnd.choices(("payment", "income", "transfer"), weights=(8, 1, 1))[0]
+        rows.append({
+            "data_url": "/money/{}/edit".format(year * 10 ** 9 + month * 10 ** 7 + n - i),
+            "count": "{}（回）".format(rnd.randrange(1, 10)),
+            "date": "{}月{}日（{}）".format(month, day, weekday),
+            "category": "category{}".format(rnd.randrange(10)),
+            "genre": "genre{}".format(rnd.randrange(50)),
+            "amount": "¥{:,}".format(rnd.randrange(100, 100000)),
+            "from_account": "account{}".format(rnd.randrange(5)) if kind != "income" else None,
+            "to_account": "account{}".format(rnd.randrange(5)) if kind != "payment" else None,
+            "place": "shop{}".format(rnd.randrange(100)),
+            "name": "item{}".format(rnd.randrange(1000)),
+            "comment": "",
+        })
+    return rows
+
+
+def render_row(row):
+    """return the HTML of a row of the result list.
+    """
+    def img(title):
+        return '<img data-title="{}">'.format(html.escape(title)) if title else ""
+
+    e = html.escape
+    return (
+        '<div class="SearchResult-module__body___fake">'
+        '<div><i data-url="{data_url}"></i></div>'
+        '<div><i title="{count}"></i></div>'
+        '<div>{date}</div>'
+        '<div><span data-title="{category}">icon</span><span>{genre}</span></div>'
+        '<div><span>{amount}</span></div>'
+        '<div>{from_account}</div>'
+        '<div>{to_account}</div>'
+        '<div><span>{place}</span></div>'
+        '<div><span>{name}</span></div>'
+        '<div><span>{comment}</span></div>'
+        '</div>'
+    ).format(
+        data_url=e(row["data_url"]),
+        count=e(row["count"]),
+        date=e(row["date"]),
+        category=e(row["category"]),
+        genre=e(row["genre"]),
+        amount=e(row["amount"]),
+        from_account=img(row["from_account"]),
+        to_account=img(row["to_account"]),
+        place=e(row["place"]),
+        name=e(row["name"]),
+        comment=e(row["comment"]),
+    )
+
+
+class FakeElement:
+    """minimal WebElement with the tag names, attributes and text of a node.
+    """
+
+    def __init__(self, tag, attrs=None, text="", children=(), driver=None):
+        self.tag_name = tag
+        self._attrs = attrs or {}
+        self._text = text
+        self._children = list(children)
+        self._driver = driver
+
+    def _descendants(self):
+        for child in self._children:
+            yield child
+            yield from child._descendants()
+
+    def find_elements_by_tag_name(self, tag):
+        self._driver._round_trip()
+        return [e for e in self._descendants() if e.tag_name == tag]
+
+    def find_element_by_tag_name(self, tag):
+        found = self.find_elements_by_tag_name(tag)
+        if not found:
+            raise LookupError(tag)
+        return found[0]
+
+    def find_elements_by_xpath(self, xpath):
+        return self._driver.find_elements_by_xpath(xpath)
+
+    def get_attribute(self, name):
+        self._driver._round_trip()
+        return self._attrs.get(name)
+
+    @property
+    def text(self):
+        self._driver._round_trip()
+        return (self._text + "".join(c._text for c in self._descendants())).strip()
+
+    def send_keys(self, *values):
+        self._driver._round_trip()
+        if self._attrs.get("id") == "UserPassword" and Keys.ENTER in "".join(values):
+            self._driver._logged_in = True
+            self._driver.current_url = "https://zaim.net/home"
+
+
+def _row_element(row, driver):
+    def node(tag, attrs=None, text="", children=()):
+        return FakeElement(tag, attrs, text, children, driver)
+
+    def account(title):
+        return [node("img", {"data-title": title})] if title else []
+
+    cells = [
+        node("div", children=[node("i", {"data-url": row["data_url"]})]),
+        node("div", children=[node("i", {"title": row["count"]})]),
+        node("div", text=row["date"]),
+        node("div", children=[
+            node("span", {"data-title": row["category"]}, "icon"),
+            node("span", text=row["genre"]),
+        ]),
+        node("div", children=[node("span", text=row["amount"])]),
+        node("div", children=account(row["from_account"])),
+        node("div", children=account(row["to_account"])),
+        node("div", children=[node("span", text=row["place"])]),
+        node("div", children=[node("span", text=row["name"])]),
+        node("div", children=[node("span", text=row["comment"])]),
+    ]
+    return node("div", {"class": "SearchResult-module__body___fake"}, children=cells)
+
+
+class FakeWebDriver:
+    """fake WebDriver of the money pages.
+
+    Parameters
+    ==========
+    rows : int
+        number of the rows of each month.
+    window : int
+        number of the rows shown at a time.
+    latency : float
+        seconds slept on each call, to emulate the round trips to a real browser.
+    load_latency : float
+        seconds before the rows of a scroll are shown, with no loading indicator meanwhile.
+    """
+
+    def __init__(self, rows=100, window=20, latency=0.0, load_latency=0.0):
+        self.rows = rows
+        self.window = window
+        self.latency = latency
+        self.load_latency = load_latency
+        self.current_url = "about:blank"
+        self.calls = 0
+        self._logged_in = False
+        self._cookies = []
+        self._month_rows = []
+        self._position = 0
+        self._loading = None
+
+    def _round_trip(self):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _visible(self):
+        if self._loading is not None and time.monotonic() >= self._loading[1]:
+            self._position = self._loading[0]
+            self._loading = None
+        return self._month_rows[self._position:self._position + self.window]
+
+    def get(self, url):
+        self._round_trip()
+        self.current_url = url
+        self._position = 0
+        self._loading = None
+        self._month_rows = []
+        if "auth.zaim.net" in url:
+            return
+        if not self._logged_in:
+            self.current_url = "https://auth.zaim.net/"
+            return
+        match = _MONTH_URL.search(url)
+        if match is not None:
+            year, month = int(match.group(1)), int(match.group(2))
+            self._month_rows = generate_rows(self.rows, year, month, seed=year * 100 + month)
+
+    def _on_money_page(self):
+        return self._logged_in and "zaim.net/money" in self.current_url
+
+    def find_elements_by_id(self, element_id):
+        self._round_trip()
+        if "auth.zaim.net" in self.current_url and element_id in ("UserEmail", "UserPassword"):
+            return [FakeElement("input", {"id": element_id}, driver=self)]
+        return []
+
+    def find_element_by_id(self, element_id):
+        found = self.find_elements_by_id(element_id)
+        if not found:
+            raise LookupError(element_id)
+        return found[0]
+
+    def find_elements_by_xpath(self, xpath):
+        self._round_trip()
+        if not self._on_money_page():
+            return []
+        if xpath == ZAIM_RESULT_LIST_XPATH:
+            rows = [_row_element(row, self) for row in self._visible()]
+            return [FakeElement("div", {"class": "SearchResult-module__list___fake"},
+                                children=rows, driver=self)]
+        if xpath == ZAIM_RESULT_ROW_XPATH:
+            return [_row_element(row, self) for row in self._visible()]
+        return []
+
+    def find_element_by_xpath(self, xpath):
+        found = self.find_elements_by_xpath(xpath)
+        if not found:
+            raise LookupError(xpath)
+        return found[0]
+
+    @property
+    def page_source(self):
+        self._round_trip()
+        rows = "".join(render_row(row) for row in self._visible())
+        return (
+            '<html><body><div class="SearchResult-module__list___fake">{}</div></body></html>'
+        ).format(rows)
+
+    def execute_script(self, script, *args):
+        self._round_trip()
+        visible = self._visible()
+        if script == ZAIM_EXTRACT_ROWS_SCRIPT:
+            return [dict(row) for row in visible]
+        if script == ZAIM_ROW_BOUNDS_SCRIPT:
+            if not visible:
+                return [None, None]
+            return [visible[0]["data_url"], visible[-1]["data_url"]]
+        if script == ZAIM_SCROLL_SCRIPT or script.startswith("arguments[0].scrollIntoView"):
+            last = max(len(self._month_rows) - self.window, 0)
+            position = min(self._position + max(self.window // 2, 1), last)
+            self._loading = (position, time.monotonic() + self.load_latency)
+            return None
+        raise NotImplementedError(script)
+
+    def add_cookie(self, cookie):
+        self._round_trip()
+        self._cookies.append(cookie)
+        if cookie.get("name") == "session":
+            self._logged_in = True
+
+    def get_cookies(self):
+        self._round_trip()
+        if self._logged_in:
+            return [{"name": "session", "value": "fake", "domain": "zaim.net"}]
+        return []
+
+    def set_window_size(self, width, height):
+        pass
+
+    def close(self):
+        pass
+
+    def quit(self):
+        pass
@@ -0,0 +1,232 @@
+"""benchmarks of pyzaim against the local stub server and the fake WebDriver.
+
+The results are written as JSON lines, one per measurement:
+
+    python benchmarks/run.py --sizes 100,1000,10000 --output results.jsonl
+    python benchmarks/run.py --benchmarks read,crawl --latency 0.005 --throttle-every 50
+
+Benchmarks
+==========
+import
+    time to import pyzaim and to access its clients in a fresh interpreter,
+    and the heavy dependencies loaded by each of them.
+cold_start
+    time from the construction of ZaimAPI to the first name-based call,
+    with and without the on-disk ID table cache.
+bulk_write
+    ZaimAPI.bulk_insert of 'size' payments (up to --max-write-rows).
+read
+    ZaimAPI.iter_money over a history of 'size' records, with and without prefetch.
+crawl
+    ZaimCrawler.iter_data over a month of 'size' rows, for each extraction mode
+    ('webdriver' up to --max-webdriver-rows).
+"""
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from pyzaim import ZaimAPI, ZaimCrawler  # noqa: E402
+from pyzaim.cache import IdTableCache  # noqa: E402
+from pyzaim.transport import RetryPolicy, Transport  # noqa: E402
+
+from fake_webdriver import FakeWebDriver  # noqa: E402
+from stub_server import StubZaimServer, generate_id_tables, generate_records  # noqa: E402
+
+BENCHMARKS = ("import", "cold_start", "bulk_write", "read", "crawl")
+DEFAULT_SIZES = (100, 1000, 10000, 100000)
+CREDENTIALS = ("consumer_id", "consumer_secret", "access_token", "access_token_secret", "verifier")
+
+
+def _api(server, **kwargs):
+    transport = Transport(retry=RetryPolicy(max_retries=5, backoff=0.01))
+    return ZaimAPI(*CREDENTIALS, base_url=server.base_url, transport=transport, **kwargs)
+
+
+def _result(benchmark, size, variant, seconds, rows=None, **extra):
+    result = {
+        "benchmark": benchmark,
+        "size": size,
+        "variant": variant,
+        "seconds": round(seconds, 6),
+    }
+    if rows is not None:
+        result["rows"] = rows
+        result["rows_per_second"] = round(rows / seconds, 1) if seconds > 0 else None
+    result.update(extra)
+    return result
+
+
+# Statements measured by the import benchmark in a fresh interpreter
+IMPORT_STATEMENTS = {
+    "pyzaim": "import pyzaim",
+    "pyzaim.ZaimAPI": "import pyzaim; pyzaim.ZaimAPI",
+    "pyzaim.AsyncZaimAPI": "import pyzaim; pyzaim.AsyncZaimAPI",
+    "pyzaim.ZaimCrawler": "import pyzaim; pyzaim.ZaimCrawler",
+}
+
+# Dependencies reported as loaded or not by the import benchmark
+HEAVY_MODULES = ("selenium.webdriver", "tqdm", "requests_oauthlib", "requests", "aiohttp")
+
+IMPORT_SCRIPT = """
+import json, sys, time
+t = time.perf_counter()
+{statement}
+seconds = time.perf_counter() - t
+print(json.dumps([seconds, [m for m in {modules!r} if m in sys.modules]]))
+"""
+
+
+def bench_import(args):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=root + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    for variant, statement in IMPORT_STATEMENTS.items():
+        code = IMPORT_SCRIPT.format(statement=statement, modules=HEAVY_MODULES)
+        for _ in range(args.repeat):
+            out = subprocess.run(
+                [sys.executable, "-c", code], env=env, check=True, capture_output=True, text=True
+            )
+            seconds, loaded = json.loads(out.stdout)
+            yield _result("import", None, variant, seconds, loaded_modules=loaded)
+
+
+def bench_cold_start(args):
+    genre = generate_id_tables()[0][5]["name"]
+    with StubZaimServer(latency=args.latency) as server, tempfile.TemporaryDirectory() as tmp:
+        for variant, cache in (("no_cache", None), ("disk_cache", IdTableCache(tmp))):
+            if cache is not None:
+                # fill the cache once, then measure the clients reading it
+                _api(server, id_table_cache=cache).refresh_id_tables()
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                api = _api(server, id_table_cache=cache)
+                api._payment_ids(genre)
+                yield _result(
+                    "cold_start", None, variant, time.perf_counter() - start,
+                    requests=sum(s["count"] for s in api.stats()["requests"].values()),
+                )
+
+
+def bench_bulk_write(args):
+    genre = generate_id_tables()[0][5]
+    for size in args.sizes:
+        if size > args.max_write_rows:
+            continue
+        records = [
+            {
+                "mode": "payment",
+                "date": datetime.date(2020, 1, 1) + datetime.timedelta(days=i % 365),
+                "amount": 100 + i,
+                "category_id": genre["category_id"],
+                "genre_id": genre["id"],
+            }
+            for i in range(size)
+        ]
+        with StubZaimServer(latency=args.latency, throttle_every=args.throttle_every) as server:
+            api = _api(server)
+            start = time.perf_counter()
+            results = api.bulk_insert(records, max_workers=args.workers, max_retries=5, backoff=0.01)
+            seconds = time.perf_counter() - start
+            yield _result(
+                "bulk_write", size, "workers={}".format(args.workers), seconds, size,
+                failed=sum(not r.ok for r in results),
+                throttled=server.throttled,
+            )
+
+
+def bench_read(args):
+    for size in args.sizes:
+        server = StubZaimServer(
+            generate_records(size), latency=args.latency, throttle_every=args.throttle_every
+        )
+        with server:
+            for variant, prefetch in (("sequential", False), ("prefetch", True)):
+                api = _api(server)
+                start = time.perf_counter()
+                rows = sum(1 for _ in api.iter_money(page_size=100, prefetch=prefetch))
+                yield _result(
+                    "read", size, variant, time.perf_counter() - start, rows,
+                    pages=api.stats()["requests"]["GET /v2/home/money"]["count"],
+                )
+
+
+def bench_crawl(args):
+    for size in args.sizes:
+        for extraction in args.extractions:
+            if extraction == "webdriver" and size > args.max_webdriver_rows:
+                continue
+            with contextlib.redirect_stdout(sys.stderr):
+                crawler = ZaimCrawler(
+                    "user", "password", extraction=extraction,
+                    driver_factory=lambda: FakeWebDriver(size, args.window, args.driver_latency),
+                )
+                start = time.perf_counter()
+                rows = sum(1 for _ in crawler.iter_data(2020, 10, progress=False))
+                seconds = time.perf_counter() - start
+            phases = crawler.stats()["phases"]
+            yield _result(
+                "crawl", size, extraction, seconds, rows,
+                driver_calls=crawler.driver.calls,
+                phases={name: round(p["sum"], 6) for name, p in phases.items()},
+            )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--benchmarks", default=",".join(BENCHMARKS),
+                        help="comma-separated benchmarks to run")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="comma-separated numbers of the records")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="latency of the stub server in seconds")
+    parser.add_argument("--throttle-every", type=int, default=0,
+                        help="answer every n-th request of the stub server with 429")
+    parser.add_argument("--workers", type=int, default=8, help="workers of bulk_write")
+    parser.add_argument("--repeat", type=int, default=3, help="repetitions of import and cold_start")
+    parser.add_argument("--extractions", default="script,html,webdriver",
+                        help="comma-separated extraction modes of crawl")
+    parser.add_argument("--window", type=int, default=20, help="rows shown at a time by the fake driver")
+    parser.add_argument("--driver-latency", type=float, default=0.0,
+                        help="latency of each call of the fake driver in seconds")
+    parser.add_argument("--max-webdriver-rows", type=int, default=10000,
+                        help="largest size crawled with the 'webdriver' extraction")
+    parser.add_argument("--max-write-rows", type=int, default=10000,
+                        help="largest size of bulk_write")
+    parser.add_argument("--output", help="file to write the JSON lines to (default: stdout)")
+    args = parser.parse_args(argv)
+    args.sizes = [int(size) for size in args.sizes.split(",") if size]
+    args.extractions = [e for e in args.extractions.split(",") if e]
+    benchmarks = [b for b in args.benchmarks.split(",") if b]
+    for name in benchmarks:
+        if name not in BENCHMARKS:
+            parser.error("unknown benchmark: {}".format(name))
+
+    environment = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "latency": args.latency,
+        "throttle_every": args.throttle_every,
+    }
+    out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        for name in benchmarks:
+            for result in globals()["bench_" + name](args):
+                result["environment"] = environment
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,388 @@
+"""local stand-in of the /v2/home/* endpoints of the Zaim API.
+
+The server keeps the money records in memory and answers the requests of ZaimAPI
+and AsyncZaimAPI without checking the OAuth signatures. The latency, the maximum
+page size and the injection of 429 responses can be configured.
+
+    with StubZaimServer(records=generate_records(1000), latency=0.01) as server:
+        api = ZaimAPI("id", "secret", "token", "secret", "verifier", base_url=server.base_url)
+"""
+import argparse
+import bisect
+import datetime
+import hashlib
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+MODES = ("payment", "income", "transfer")
+
+
+def generate_id_tables(categories=10, genres_per_category=5, accounts=5):
+    """return the genres, categories and accounts in the format of the API.
+    """
+    category_list = []
+    genre_list = []
+    for c in range(categories):
+        category_id = 101 + c
+        mode = "income" if c == 0 else "payment"
+        category_list.append(
+            {"id": category_id, "name": "category{}".format(c), "mode": mode, "active": 1}
+        )
+        for g in range(genres_per_category):
+            genre_list.append({
+                "id": category_id * 100 + g + 1,
+                "name": "genre{}-{}".format(c, g),
+                "category_id": category_id,
+                "active": 1,
+            })
+    account_list = [
+        {"id": a + 1, "name": "account{}".format(a), "active": 1} for a in range(accounts)
+    ]
+    return genre_list, category_list, account_list
+
+
+def generate_records(n, start=datetime.date(2015, 1, 1), days=365 * 5, seed=0):
+    """return n money records spread over the days from start.
+    """
+    rnd = random.Random(seed)
+    genres, categories, accounts = generate_id_tables()
+    payment_genres = [g for g in genres if g["category_id"] != 101]
+    income_genres = [g for g in genres if g["category_id"] == 101]
+    account_ids = [a["id"] for a in accounts]
+    records = []
+    for i in range(n):
+        mode = rnd.choices(MODES, weights=(8, 1, 1))[0]
+        date = start + datetime.timedelta(days=rnd.randrange(days))
+        record = _new_record(i + 1, mode, date.strftime("%Y-%m-%d"), rnd.randrange(100, 100000))
+        if mode == "payment":
+            genre = rnd.choice(payment_genres)
+            record.update(
+                category_id=genre["category_id"],
+                genre_id=genre["id"],
+                from_account_id=rnd.choice(account_ids),
+                name="item{}".format(rnd.randrange(1000)),
+                place="shop{}".format(rnd.randrange(100)),
+            )
+        elif mode == "income":
+            genre = rnd.choice(income_genres)
+            record.update(
+                category_id=genre["category_id"],
+                genre_id=genre["id"],
+                to_account_id=rnd.choice(account_ids),
+            )
+        else:
+            from_account, to_account = rnd.sample(account_ids, 2)
+            record.update(from_account_id=from_account, to_account_id=to_account)
+        records.append(record)
+    return records
+
+
+def _new_record(data_id, mode, date, amount):
+    return {
+        "id": data_id,
+        "mode": mode,
+        "user_id": 1,
+        "date": date,
+        "category_id": 0,
+        "genre_id": 0,
+        "from_account_id": 0,
+        "to_account_id": 0,
+        "amount": amount,
+        "comment": "",
+        "active": 1,
+        "name": "",
+        "receipt_id": 0,
+        "place": "",
+        "created": date + " 00:00:00",
+        "currency_code": "JPY",
+    }
+
+
+class _MoneyTable:
+    """money records indexed by (date, id) per mode and by id.
+    """
+
+    def __init__(self, records):
+        self.lock = threading.Lock()
+        self.records = {}
+        self.keys = {None: []}
+        self.keys.update((mode, []) for mode in MODES)
+        self.ids = []
+        for record in sorted(records, key=lambda r: r["id"]):
+            self._add(record)
+        for keys in self.keys.values():
+            keys.sort()
+        self._next_id = itertools.count((self.ids[-1] if self.ids else 0) + 1)
+
+    def _add(self, record, insort=False):
+        key = (record["date"], record["id"])
+        self.records[record["id"]] = record
+        for keys in (self.keys[None], self.keys[record["mode"]]):
+            if insort:
+                bisect.insort(keys, key)
+            else:
+                keys.append(key)
+        if insort:
+            bisect.insort(self.ids, record["id"])
+        else:
+            self.ids.append(record["id"])
+
+    def _remove(self, record):
+        key = (record["date"], record["id"])
+        for keys in (self.keys[None], self.keys[record["mode"]]):
+            del keys[bisect.bisect_left(keys, key)]
+        del self.ids[bisect.bisect_left(self.ids, record["id"])]
+        del self.records[record["id"]]
+
+    def select(self, params):
+        page = int(params.get("page", 1))
+        limit = int(params.get("limit", 20))
+        offset = (page - 1) * limit
+        mode = params.get("mode")
+        start = params.get("start_date")
+        end = params.get("end_date")
+        with self.lock:
+            if params.get("order") == "id":
+                ids = [
+                    i for i in reversed(self.ids)
+                    if (mode is None or self.records[i]["mode"] == mode)
+                    and (start is None or self.records[i]["date"] >= start)
+                    and (end is None or self.records[i]["date"] <= end)
+                ]
+                return [self.records[i] for i in ids[offset:offset + limit]]
+            keys = self.keys[mode]
+            lo = 0 if start is None else bisect.bisect_left(keys, (start, 0))
+            hi = len(keys) if end is None else bisect.bisect_right(keys, (end, float("inf")))
+            # newest first
+            first = hi - 1 - offset
+            last = max(lo, first - limit + 1)
+            return [self.records[keys[i][1]] for i in range(first, last - 1, -1)]
+
+    def insert(self, mode, form):
+        with self.lock:
+            record = _new_record(next(self._next_id), mode, form["date"], int(form["amount"]))
+            _update_record(record, form)
+            self._add(record, insort=True)
+            return record
+
+    def update(self, mode, data_id, form):
+        with self.lock:
+            record = self.records.get(data_id)
+            if record is None or record["mode"] != mode:
+                return None
+            self._remove(record)
+            record = dict(record)
+            _update_record(record, form)
+            self._add(record, insort=True)
+            return record
+
+    def delete(self, mode, data_id):
+        with self.lock:
+            record = self.records.get(data_id)
+            if record is None or record["mode"] != mode:
+                return None
+            self._remove(record)
+            return record
+
+
+def _update_record(record, form):
+    for key, value in form.items():
+        if key not in record or key in ("id", "mode", "mapping"):
+            continue
+        record[key] = int(value) if isinstance(record[key], int) else value
+
+
+class StubZaimServer:
+    """threaded HTTP server answering the Zaim API requests from memory.
+
+    Parameters
+    ==========
+    records : list of dict
+        initial money records (see generate_records).
+    latency : float
+        seconds slept before answering each request.
+    max_page_size : int
+        upper bound of the 'limit' parameter of GET /money.
+    throttle_every : int
+        if positive, every n-th request is answered with 429.
+    retry_after : float
+        value of the 'Retry-After' header of the 429 responses.
+    etags : bool
+        if True, the GET responses carry an 'ETag' and 'If-None-Match' is answered with 304.
+    port : int
+        port to listen on. 0 picks a free port.
+    """
+
+    def __init__(
+        self,
+        records=(),
+        latency=0.0,
+        max_page_size=100,
+        throttle_every=0,
+        retry_after=0.0,
+        etags=False,
+        port=0,
+    ):
+        self.money = _MoneyTable(records)
+        self.genres, self.categories, self.accounts = generate_id_tables()
+        self.latency = latency
+        self.max_page_size = max_page_size
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.etags = etags
+        self.requests = 0
+        self.throttled = 0
+        self._counter_lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), _handler(self))
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def _throttle(self):
+        with self._counter_lock:
+            self.requests += 1
+            throttle = self.throttle_every > 0 and self.requests % self.throttle_every == 0
+            if throttle:
+                self.throttled += 1
+        return throttle
+
+    def handle(self, method, path, params, form):
+        """return (status, body) of the request.
+        """
+        parts = path.strip("/").split("/")
+        if parts[:2] != ["v2", "home"]:
+            return 404, {"message": "not found"}
+        parts = parts[2:]
+        if method == "GET":
+            if parts == ["user", "verify"]:
+                return 200, {"me": {"id": 1, "login": "stub", "name": "stub"}}
+            if parts == ["money"]:
+                params["limit"] = min(int(params.get("limit", 20)), self.max_page_size)
+                return 200, {"money": self.money.select(params), "requested": int(time.time())}
+            if parts == ["genre"]:
+                return 200, {"genres": self.genres, "requested": int(time.time())}
+            if parts == ["category"]:
+                return 200, {"categories": self.categories, "requested": int(time.time())}
+            if parts == ["account"]:
+                return 200, {"accounts": self.accounts, "requested": int(time.time())}
+        elif len(parts) >= 2 and parts[0] == "money" and parts[1] in MODES:
+            mode = parts[1]
+            if method == "POST" and len(parts) == 2:
+                record = self.money.insert(mode, form)
+                return 200, {"money": {"id": record["id"], "modified": record["created"]}}
+            if len(parts) == 3 and parts[2].isdigit():
+                data_id = int(parts[2])
+                if method == "PUT":
+                    record = self.money.update(mode, data_id, form)
+                elif method == "DELETE":
+                    record = self.money.delete(mode, data_id)
+                else:
+                    record = None
+                if record is None:
+                    return 404, {"message": "not found"}
+                return 200, {"money": {"id": data_id}}
+        return 404, {"message": "not found"}
+
+
+def _handler(server):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # the headers and the body are written separately
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def _serve(self):
+            if server.latency:
+                time.sleep(server.latency)
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length).decode() if length else ""
+            if server._throttle():
+                self.send_response(429)
+                self.send_header("Retry-After", str(server.retry_after))
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            url = urlsplit(self.path)
+            status, payload = server.handle(
+                self.command, url.path, dict(parse_qsl(url.query)), dict(parse_qsl(body))
+            )
+            data = json.dumps(payload).encode()
+            etag = None
+            if server.etags and self.command == "GET" and status == 200:
+                stable = {k: v for k, v in payload.items() if k != "requested"}
+                etag = '"{}"'.format(hashlib.sha1(json.dumps(stable).encode()).hexdigest())
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+            self.send_response(status)
+            if etag is not None:
+                self.send_header("ETag", etag)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        do_GET = do_POST = do_PUT = do_DELETE = _serve
+
+    return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="serve a stub of the Zaim API")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--records", type=int, default=1000, help="number of the money records")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--max-page-size", type=int, default=100)
+    parser.add_argument("--throttle-every", type=int, default=0)
+    parser.add_argument("--retry-after", type=float, default=0.0)
+    parser.add_argument("--etags", action="store_true")
+    args = parser.parse_args(argv)
+    server = StubZaimServer(
+        generate_records(args.records),
+        latency=args.latency,
+        max_page_size=args.max_page_size,
+        throttle_every=args.throttle_every,
+        retry_after=args.retry_after,
+        etags=args.etags,
+        port=args.port,
+    )
+    print("Serving the stub Zaim API on {}".format(server.base_url))
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1 +1,52 @@
-from .pyzaim import ZaimAPI, get_access_token, ZaimCrawler
\ No newline at end of file
+import importlib
+
+# The classes are imported on first access, so that "import pyzaim" does not load
+# Selenium, tqdm, requests or requests_oauthlib, and ZaimAPI can be used without loading Selenium.
+_EXPORTS = {
+    "ZaimAPI": "api",
+    "get_access_token": "api",
+    "ZaimCrawler": "crawler",
+    "AsyncZaimAPI": "async_api",
+    "ZaimStore": "store",
+    "Outbox": "outbox",
+    "ZaimClientPool": "pool",
+    "MoneyRecord": "records",
+    "Payment": "records",
+    "Income": "records",
+    "Transfer": "records",
+}
+
+_SUBMODULES = frozenset([
+    "analytics",
+    "api",
+    "async_api",
+    "cache",
+    "cli",
+    "columnar",
+    "crawler",
+    "instrumentation",
+    "outbox",
+    "pool",
+    "pyzaim",
+    "reconcile",
+    "records",
+    "store",
+    "transport",
+])
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return importlib.import_module("." + name, __name__)
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    value = getattr(importlib.import_module("." + module, __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
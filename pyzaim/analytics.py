@@ -0,0 +1,426 @@
+try:
+    import numpy as np
+except ImportError as e:
+    raise ImportError(
+        "numpy is required to use pyzaim.analytics: pip install pyzaim[columnar]"
+    ) from e
+
+from .columnar import MODES, NAME_FIELDS, ColumnBuilder
+
+# Keys accepted by the aggregations
+TIME_KEYS = ("date", "month", "year")
+KEYS = TIME_KEYS + ("mode",) + NAME_FIELDS + ("account",)
+
+# Above this number of possible groups, the groups are found with np.unique
+# instead of a dense np.bincount
+DENSE_GROUP_LIMIT: int = 1 << 22
+
+
+class Aggregator:
+    """vectorized group-by aggregations of money records.
+
+    The records are converted once to NumPy columns (see ColumnBuilder.to_numpy), and
+    every aggregation is computed with np.bincount over the integer codes of the
+    categories, genres and accounts instead of looping over dicts keyed by names.
+
+    Parameters
+    ==========
+    records : iterable of dict or MoneyRecord
+        records of ZaimAPI.get_data / iter_money or items of ZaimCrawler.get_data.
+    api : ZaimAPI
+        client whose ID tables are used to name the IDs of the API records and to
+        identify the names of the crawler items. The category of a record without one
+        is filled from its genre through 'genre_to_category'.
+    columns : dict
+        output of ColumnBuilder.to_numpy used instead of records.
+    """
+
+    def __init__(self, records=None, api=None, columns=None):
+        if columns is None:
+            columns = ColumnBuilder(api).extend(records or ()).to_numpy()
+        self.columns = columns
+        self.names = columns["dictionaries"]
+        self.amount = columns["amount"]
+        self.day = columns["date"].astype("datetime64[D]").astype(np.int64)
+        self.month = columns["date"].astype("datetime64[M]").astype(np.int64)
+        self.mode = columns["mode_code"].astype(np.int64)
+        self.codes = {field: columns[field + "_code"].astype(np.int64) for field in NAME_FIELDS}
+        self.ids = {field: _ids_by_code(columns, field) for field in NAME_FIELDS}
+        if api is not None:
+            self._fill_categories(api)
+        self._unify_accounts()
+
+    def __len__(self):
+        return len(self.amount)
+
+    def sum_by(self, *by, mode="payment", start_date=None, end_date=None):
+        """total the amounts and count the records per group.
+
+        Parameters
+        ==========
+        *by : str
+            keys of the groups: 'date', 'month', 'year', 'mode', 'category', 'genre',
+            'from_account', 'to_account' or 'account' (the source of payments and transfers,
+            the destination of incomes).
+        mode : str
+            'payment', 'income' or 'transfer'. If None, all the records are aggregated.
+        start_date, end_date : datetime.date
+            range of the dates (both inclusive).
+
+        Returns
+        =======
+        dict of numpy.ndarray
+            one column per key ('<key>_id' is added for the names), 'amount' and 'count',
+            with one row per non-empty group.
+        """
+        mask = self._mask(mode, start_date, end_date)
+        keys = [self._key(field, mask) for field in by]
+        amount = self.amount[mask]
+        if not keys:
+            return {"amount": np.array([amount.sum()]), "count": np.array([len(amount)])}
+        groups, inverse = _group(keys)
+        result = _key_columns(by, keys, groups)
+        result["amount"] = _bincount(inverse, amount, len(groups[0]))
+        result["count"] = np.bincount(inverse, minlength=len(groups[0]))
+        return result
+
+    def monthly(self, by=None, mode="payment", start_date=None, end_date=None):
+        """return the monthly totals, optionally per category, genre or account.
+
+        Returns
+        =======
+        dict of numpy.ndarray
+            'month' (datetime64[M]) of every month in the range, and 'amount' and 'count' of
+            shape (months,), or (groups, months) with the '<by>' and '<by>_id' of the groups.
+        """
+        mask = self._mask(mode, start_date, end_date)
+        return self._monthly_matrix(by, mask)
+
+    def rolling(self, window=12, by=None, mode="payment", start_date=None, end_date=None):
+        """return the totals of the last 'window' months at every month.
+
+        The months without records count as zero. The first window-1 months are
+        totals of the available months.
+
+        Returns
+        =======
+        dict of numpy.ndarray
+            same as monthly(), with the rolling totals in 'amount' and 'count'.
+        """
+        if window < 1:
+            raise ValueError("window must be positive: {}".format(window))
+        result = self.monthly(by, mode, start_date, end_date)
+        for column in ("amount", "count"):
+            totals = np.cumsum(result[column], axis=-1)
+            shifted = np.zeros_like(totals)
+            shifted[..., window:] = totals[..., :-window]
+            result[column] = totals - shifted
+        return result
+
+    def budget_vs_actual(self, budgets, by="category", mode="payment", start_date=None, end_date=None):
+        """compare the monthly budgets with the actual monthly totals.
+
+        Parameters
+        ==========
+        budgets : dict
+            monthly budget per name or ID of the 'by' field.
+        by : str
+            'category', 'genre', 'from_account', 'to_account' or 'account'.
+
+        Returns
+        =======
+        dict of numpy.ndarray
+            'month', '<by>', '<by>_id', 'budget', 'actual', 'remaining' (budget - actual)
+            and 'ratio' (actual / budget) for every budget and every month in the range.
+        """
+        if by not in NAME_FIELDS + ("account",):
+            raise ValueError("budgets are compared by a name field, not {!r}".format(by))
+        mask = self._mask(mode, start_date, end_date)
+        matrix = self._monthly_matrix(by, mask)
+        names, ids = self._labels(by)
+        codes = np.array([self._code_of(by, key, names, ids) for key in budgets], dtype=np.int64)
+        budget = np.array(list(budgets.values()), dtype=np.int64)
+        months = matrix["month"]
+        n = len(months)
+
+        # position of each budgeted code among the groups of the matrix
+        group_codes = matrix.pop("_codes")
+        actual = np.zeros((len(codes), n), dtype=np.int64)
+        if len(group_codes):
+            order = np.argsort(group_codes)
+            pos = np.searchsorted(group_codes, codes, sorter=order)
+            pos = np.minimum(pos, len(group_codes) - 1)
+            found = (codes >= 0) & (group_codes[order[pos]] == codes)
+            actual[found] = matrix["amount"][order[pos[found]]]
+
+        budget = np.repeat(budget, n)
+        actual = actual.ravel()
+        label_codes = np.where(codes >= 0, codes, len(names))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = np.where(budget != 0, actual / budget, np.nan)
+        return {
+            "month": np.tile(months, len(codes)),
+            by: np.repeat(np.append(names, None)[label_codes], n),
+            by + "_id": np.repeat(np.append(ids, -1)[label_codes], n),
+            "budget": budget,
+            "actual": actual,
+            "remaining": budget - actual,
+            "ratio": ratio,
+        }
+
+    def balances(self, initial=None, end_date=None):
+        """return the balance of every account from the flows of the records.
+
+        Incomes and transfers add to the destination account, payments and transfers
+        subtract from the source account.
+
+        Parameters
+        ==========
+        initial : dict
+            balance per account name or ID before the first record.
+        end_date : datetime.date
+            last date (inclusive) of the records taken into account.
+
+        Returns
+        =======
+        dict of numpy.ndarray
+            'account', 'account_id', 'inflow', 'outflow' and 'balance' of every account.
+        """
+        mask = self._mask(None, None, end_date)
+        inflow, outflow = self._flows(mask, self.account_to, self.account_from)
+        names, ids = self._labels("account")
+        balance = inflow - outflow
+        for key, value in (initial or {}).items():
+            code = self._code_of("account", key, names, ids)
+            if code < 0:
+                raise KeyError(key)
+            balance[code] += value
+        return {
+            "account": names,
+            "account_id": ids,
+            "inflow": inflow,
+            "outflow": outflow,
+            "balance": balance,
+        }
+
+    def monthly_balances(self, initial=None, start_date=None, end_date=None):
+        """return the balance of every account at the end of every month.
+
+        Returns
+        =======
+        dict of numpy.ndarray
+            'month', 'account', 'account_id' and 'balance' of shape (accounts, months).
+        """
+        mask = self._mask(None, start_date, end_date)
+        names, ids = self._labels("account")
+        months, month_codes = _dense_months(self.month[mask])
+        n = len(months)
+        amount = self.amount[mask]
+        net = np.zeros(len(names) * n, dtype=np.int64)
+        for accounts, sign in ((self.account_to[mask], 1), (self.account_from[mask], -1)):
+            valid = accounts >= 0
+            net += sign * _bincount(accounts[valid] * n + month_codes[valid], amount[valid], len(net))
+        balance = np.cumsum(net.reshape(len(names), n), axis=1)
+        if start_date is not None:
+            # add the flows before the range to the first month
+            before = self._mask(None, None, None) & (self.day < _day(start_date))
+            inflow, outflow = self._flows(before, self.account_to, self.account_from)
+            balance += (inflow - outflow)[:, None]
+        for key, value in (initial or {}).items():
+            code = self._code_of("account", key, names, ids)
+            if code < 0:
+                raise KeyError(key)
+            balance[code] += value
+        return {"month": months, "account": names, "account_id": ids, "balance": balance}
+
+    def _fill_categories(self, api):
+        genre_to_category = api.genre_to_category
+        if not genre_to_category:
+            return
+        # code of the genre -> code of its category
+        category_codes = {name: code for code, name in enumerate(self.names["category"])}
+        genre_ids = self.ids["genre"]
+        lookup = np.full(len(genre_ids) + 1, -1, dtype=np.int64)
+        for code, genre_id in enumerate(genre_ids.tolist()):
+            name = api.category_itos.get(genre_to_category.get(genre_id))
+            if name is not None and name in category_codes:
+                lookup[code] = category_codes[name]
+        categories = self.codes["category"]
+        missing = categories < 0
+        if missing.any():
+            categories[missing] = lookup[self.codes["genre"][missing]]
+
+    def _unify_accounts(self):
+        # the source and the destination accounts have separate dictionaries
+        names = []
+        index = {}
+        maps = {}
+        for field in ("from_account", "to_account"):
+            lookup = np.empty(len(self.names[field]) + 1, dtype=np.int64)
+            lookup[-1] = -1
+            for code, name in enumerate(self.names[field]):
+                if name not in index:
+                    index[name] = len(names)
+                    names.append(name)
+                lookup[code] = index[name]
+            maps[field] = lookup
+        self.account_names = np.array(names, dtype=object)
+        self.account_ids = np.full(len(names), -1, dtype=np.int64)
+        for field in ("from_account", "to_account"):
+            valid = maps[field][:-1]
+            self.account_ids[valid] = np.maximum(self.account_ids[valid], self.ids[field])
+        self.account_from = maps["from_account"][self.codes["from_account"]]
+        self.account_to = maps["to_account"][self.codes["to_account"]]
+        # payments are paid from the source, incomes go to the destination
+        self.account = np.where(self.account_from >= 0, self.account_from, self.account_to)
+
+    def _mask(self, mode, start_date, end_date):
+        mask = np.ones(len(self.amount), dtype=bool)
+        if mode is not None:
+            if mode not in MODES:
+                raise ValueError("unknown mode: {}".format(mode))
+            mask &= self.mode == MODES.index(mode)
+        if start_date is not None:
+            mask &= self.day >= _day(start_date)
+        if end_date is not None:
+            mask &= self.day <= _day(end_date)
+        return mask
+
+    def _labels(self, field):
+        if field == "account":
+            return self.account_names, self.account_ids
+        return np.array(self.names[field], dtype=object), self.ids[field]
+
+    def _key(self, field, mask):
+        """return the codes of the rows (-1 for missing) and the labels of the codes.
+        """
+        if field in TIME_KEYS:
+            if field == "date":
+                values, unit = self.day[mask], "D"
+            elif field == "month":
+                values, unit = self.month[mask], "M"
+            else:
+                values, unit = self.month[mask] // 12, None
+            start = values.min() if len(values) else 0
+            stop = values.max() + 1 if len(values) else 0
+            labels = np.arange(start, stop)
+            labels = labels + 1970 if unit is None else labels.astype("datetime64[{}]".format(unit))
+            return values - start, labels, None
+        if field == "mode":
+            return self.mode[mask], np.array(self.names["mode"], dtype=object), None
+        if field not in KEYS:
+            raise ValueError("unknown key: {}".format(field))
+        names, ids = self._labels(field)
+        codes = self.account[mask] if field == "account" else self.codes[field][mask]
+        return codes, names, ids
+
+    def _code_of(self, field, key, names, ids):
+        if isinstance(key, str):
+            found = np.flatnonzero(names == key)
+        else:
+            found = np.flatnonzero(ids == key)
+        return int(found[0]) if len(found) else -1
+
+    def _monthly_matrix(self, by, mask):
+        months, month_codes = _dense_months(self.month[mask])
+        n = len(months)
+        amount = self.amount[mask]
+        if by is None:
+            return {
+                "month": months,
+                "amount": _bincount(month_codes, amount, n),
+                "count": np.bincount(month_codes, minlength=n),
+            }
+        codes, names, ids = self._key(by, mask)
+        if by in TIME_KEYS or by == "mode":
+            raise ValueError("monthly totals are grouped by a name field, not {!r}".format(by))
+        groups, inverse = _group([(codes, names, ids)])
+        size = len(groups[0])
+        flat = inverse * n + month_codes
+        result = {"month": months}
+        result.update(_key_columns((by,), [(codes, names, ids)], groups))
+        result["amount"] = _bincount(flat, amount, size * n).reshape(size, n)
+        result["count"] = np.bincount(flat, minlength=size * n).reshape(size, n)
+        result["_codes"] = groups[0]
+        return result
+
+    def _flows(self, mask, to_accounts, from_accounts):
+        size = len(self.account_names)
+        amount = self.amount[mask]
+        flows = []
+        for accounts in (to_accounts[mask], from_accounts[mask]):
+            valid = accounts >= 0
+            flows.append(_bincount(accounts[valid], amount[valid], size))
+        return flows
+
+
+def _day(date):
+    return np.datetime64(date, "D").astype(np.int64)
+
+
+def _ids_by_code(columns, field):
+    codes = columns[field + "_code"]
+    ids = np.full(len(columns["dictionaries"][field]), -1, dtype=np.int64)
+    valid = codes >= 0
+    ids[codes[valid]] = columns[field + "_id"][valid]
+    return ids
+
+
+def _dense_months(month):
+    if len(month) == 0:
+        return np.array([], dtype="datetime64[M]"), month
+    start = month.min()
+    months = np.arange(start, month.max() + 1).astype("datetime64[M]")
+    return months, month - start
+
+
+def _bincount(codes, amount, size):
+    # the sums are exact as long as they are below 2**53
+    return np.rint(np.bincount(codes, weights=amount, minlength=size)).astype(np.int64)
+
+
+def _group(keys):
+    """return the codes of the non-empty groups per key and the group of each row.
+    """
+    # the missing values (-1) take the slot after the last label
+    codes = [np.where(c >= 0, c, len(labels)) for c, labels, _ in keys]
+    sizes = [len(labels) + 1 for _, labels, _ in keys]
+    flat = np.ravel_multi_index(codes, sizes) if len(codes) > 1 else codes[0]
+    total = int(np.prod(sizes))
+    if total <= DENSE_GROUP_LIMIT:
+        counts = np.bincount(flat, minlength=total)
+        present = np.flatnonzero(counts)
+        lookup = np.empty(total, dtype=np.int64)
+        lookup[present] = np.arange(len(present))
+        inverse = lookup[flat]
+    else:
+        present, inverse = np.unique(flat, return_inverse=True)
+    groups = np.unravel_index(present, sizes) if len(codes) > 1 else (present,)
+    return [np.where(g < size - 1, g, -1) for g, size in zip(groups, sizes)], inverse
+
+
+def _key_columns(by, keys, groups):
+    columns = {}
+    for field, (_, labels, ids), codes in zip(by, keys, groups):
+        missing = codes < 0
+        if labels.dtype == object:
+            columns[field] = np.append(labels, None)[codes]
+        else:
+            columns[field] = labels[np.where(missing, 0, codes)]
+        if ids is not None:
+            columns[field + "_id"] = np.append(ids, -1)[codes]
+    return columns
+
+
+def sum_by(records, *by, api=None, **kwargs):
+    """total the amounts of the records per group. See Aggregator.sum_by.
+    """
+    return Aggregator(records, api).sum_by(*by, **kwargs)
+
+
+def monthly(records, by=None, api=None, **kwargs):
+    return Aggregator(records, api).monthly(by, **kwargs)
+
+
+def balances(records, api=None, **kwargs):
+    return Aggregator(records, api).balances(**kwargs)
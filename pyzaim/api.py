@@ -0,0 +1,941 @@
+from getpass import getpass
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, NamedTuple, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+from .cache import IdTableCache, ResponseCache, user_key
+from .instrumentation import Metrics
+from .records import from_api
+from .transport import IDEMPOTENT_METHODS, NO_RETRY, RetryPolicy, TokenBucket, Transport
+
+# Base strings for Zaim APIs
+ZAIM_API_VERSION: str = 'v2'
+ZAIM_API_BASE_URL: str = 'https://api.zaim.net'
+ZAIM_API_HOME_URL: str = f'{ZAIM_API_BASE_URL}/{ZAIM_API_VERSION}/home'
+ZAIM_CALLBACK_URL: str = 'https://www.zaim.net/'
+
+# Authorization
+ZAIM_API_AUTHORIZE_URL: str = f'https://auth.zaim.net/users/auth'
+ZAIM_API_REQUEST_TOKEN_URL: str = f'{ZAIM_API_BASE_URL}/{ZAIM_API_VERSION}/auth/request'
+ZAIM_API_ACCESS_TOKEN_URL: str = f'{ZAIM_API_BASE_URL}/{ZAIM_API_VERSION}/auth/access'
+ZAIM_API_VEFIRY_URL: str = f'{ZAIM_API_BASE_URL}/{ZAIM_API_VERSION}/home/user/verify'
+
+# Money operation
+ZAIM_API_MONEY_URL: str = f'{ZAIM_API_HOME_URL}/money'
+ZAIM_API_MONEY_PAYMENT_URL: str = f'{ZAIM_API_MONEY_URL}/payment'
+ZAIM_API_MONEY_INCOME_URL: str = f'{ZAIM_API_MONEY_URL}/income'
+ZAIM_API_MONEY_TRANSFER_URL: str = f'{ZAIM_API_MONEY_URL}/transfer'
+
+# Home operation
+ZAIN_API_CATEGORY_URL: str = f'{ZAIM_API_HOME_URL}/category'
+ZAIM_API_GENRE_URL: str = f'{ZAIM_API_HOME_URL}/genre'
+ZAIM_API_ACCOUNT_URL: str = f'{ZAIM_API_HOME_URL}/account'
+ZAIM_API_CURRENCY_URL: str = f'{ZAIM_API_HOME_URL}/currency'
+
+# Seconds during which a name missing from fresh ID tables does not fetch them again
+ID_TABLE_REFRESH_INTERVAL: float = 60.0
+
+# Largest 'limit' of /v2/home/money; a larger value is silently capped by the API
+ZAIM_API_MAX_PAGE_SIZE: int = 100
+
+# IDs
+ZAIM_CONSUMER_ID: str = 'ZAIM_CONSUMER_ID'
+ZAIM_CONSUMER_SECRET: str = 'ZAIM_CONSUMER_SECRET'
+ZAIM_ACCESS_TOKEN: str = 'ZAIM_ACCESS_TOKEN'
+ZAIM_ACCESS_TOKEN_SECRET: str = 'ZAIM_ACCESS_TOKEN_SECRET'
+ZAIM_OAUTH_VERIFIER: str = 'ZAIM_OAUTH_VERIFIER'
+
+
+def get_access_token():
+    """get the access token.
+    """
+    consumer_id = os.environ.get(ZAIM_CONSUMER_ID, None)
+    if consumer_id is None:
+        consumer_id = getpass("Please input consumer ID: ")
+        consumer_id = consumer_id.srtip()
+        os.environ[ZAIM_CONSUMER_ID] = consumer_id
+
+    consumer_secret = os.environ.get(ZAIM_CONSUMER_SECRET, None)
+    if consumer_secret is None:
+        consumer_secret = getpass("Please input consumer secret: ")
+        os.environ[ZAIM_CONSUMER_SECRET] = consumer_secret
+
+    from requests_oauthlib import OAuth1Session
+
+    auth = OAuth1Session(
+        client_key=consumer_id,
+        client_secret=consumer_secret,
+        callback_uri=ZAIM_CALLBACK_URL
+    )
+
+    auth.fetch_request_token(ZAIM_API_REQUEST_TOKEN_URL)
+
+    # Redirect user to zaim for authorization
+    authorization_url = auth.authorization_url(ZAIM_API_AUTHORIZE_URL)
+    print("Please go here and authorize: ", authorization_url)
+
+    oauth_verifier = input("Please input oauth verifier: ")
+    access_token_res = auth.fetch_access_token(
+        url=ZAIM_API_ACCESS_TOKEN_URL, verifier=oauth_verifier
+    )
+    access_token = access_token_res.get("oauth_token")
+    os.environ[ZAIM_ACCESS_TOKEN] = access_token
+    access_token_secret = access_token_res.get("oauth_token_secret")
+    os.environ[ZAIM_ACCESS_TOKEN_SECRET] = access_token_secret
+    os.environ[ZAIM_OAUTH_VERIFIER] = oauth_verifier
+    return access_token, access_token_secret, oauth_verifier
+
+
+def _resolve_credentials(
+    consumer_id=None,
+    consumer_secret=None,
+    access_token=None,
+    access_token_secret=None,
+    oauth_verifier=None,
+):
+    """fill the missing credentials with the environmental variables.
+    """
+    if consumer_id is None:
+        consumer_id = os.environ.get(ZAIM_CONSUMER_ID)
+    if consumer_secret is None:
+        consumer_secret = os.environ.get(ZAIM_CONSUMER_SECRET)
+    if access_token is None:
+        access_token = os.environ.get(ZAIM_ACCESS_TOKEN)
+    if access_token_secret is None:
+        access_token_secret = os.environ.get(ZAIM_ACCESS_TOKEN_SECRET)
+    if oauth_verifier is None:
+        oauth_verifier = os.environ.get(ZAIM_OAUTH_VERIFIER)
+    return consumer_id, consumer_secret, access_token, access_token_secret, oauth_verifier
+
+
+def _payment_data(
+    date,
+    amount,
+    category_id,
+    genre_id,
+    from_account_id=None,
+    comment=None,
+    name=None,
+    place=None,
+    data_id=None,
+):
+    data = {"mapping": 1}
+    if data_id is not None:
+        data["id"] = data_id
+    data.update({
+        "category_id": category_id,
+        "genre_id": genre_id,
+        "amount": amount,
+        "date": date.strftime("%Y-%m-%d"),
+    })
+    if from_account_id is not None:
+        data["from_account_id"] = from_account_id
+    if comment is not None:
+        data["comment"] = comment
+    if name is not None:
+        data["name"] = name
+    if place is not None:
+        data["place"] = place
+    return data
+
+
+def _income_data(
+    date,
+    category_id,
+    amount,
+    to_account_id=None,
+    comment=None,
+    place=None,
+    data_id=None,
+):
+    data = {"mapping": 1}
+    if data_id is not None:
+        data["id"] = data_id
+    data.update({
+        "category_id": category_id,
+        "amount": amount,
+        "date": date.strftime("%Y-%m-%d"),
+    })
+    if to_account_id is not None:
+        data["to_account_id"] = to_account_id
+    if comment is not None:
+        data["comment"] = comment
+    if place is not None:
+        data["place"] = place
+    return data
+
+
+def _transfer_data(
+    date, amount, from_account_id, to_account_id, comment=None, data_id=None
+):
+    data = {"mapping": 1}
+    if data_id is not None:
+        data["id"] = data_id
+    data.update({
+        "amount": amount,
+        "date": date.strftime("%Y-%m-%d"),
+        "from_account_id": from_account_id,
+        "to_account_id": to_account_id,
+    })
+    if comment is not None:
+        data["comment"] = comment
+    return data
+
+
+class BulkResult(NamedTuple):
+    """result of one record of the bulk operations.
+    """
+    index: int
+    record: dict
+    ok: bool
+    status_code: Optional[int] = None
+    data: Any = None
+    error: Optional[BaseException] = None
+    attempts: int = 0
+
+
+# Names of the ID tables built by _IdTableMixin
+_ID_TABLES = (
+    "genre_itos",
+    "genre_stoi",
+    "genre_to_category",
+    "category_itos",
+    "category_stoi",
+    "account_itos",
+    "account_stoi",
+)
+
+
+def _id_table_property(name):
+    def fget(self):
+        if self._id_tables is None or name not in self._id_tables:
+            self._build_id_table()
+        return self._id_tables[name]
+
+    def fset(self, value):
+        tables = dict(self._id_tables or {})
+        tables[name] = value
+        self._id_tables = tables
+
+    return property(fget, fset)
+
+
+class _IdTableMixin:
+    """name <-> ID tables of genres, categories and accounts shared by the API clients.
+
+    The tables are built lazily on first access, optionally through an IdTableCache.
+    A table can also be assigned (e.g. api.genre_stoi = {...}); it is kept until the
+    tables are refreshed.
+    """
+
+    _id_tables = None
+    _id_table_cache = None
+    _user_key = None
+    # monotonic time of the last fetch of the tables from the API
+    _id_tables_fetched = float("-inf")
+
+    genre_itos = _id_table_property("genre_itos")
+    genre_stoi = _id_table_property("genre_stoi")
+    genre_to_category = _id_table_property("genre_to_category")
+    category_itos = _id_table_property("category_itos")
+    category_stoi = _id_table_property("category_stoi")
+    account_itos = _id_table_property("account_itos")
+    account_stoi = _id_table_property("account_stoi")
+
+    def _load_id_table(self, genres, categories, accounts):
+        genre_itos = {}
+        genre_stoi = {}
+        genre_to_category = {}
+        for g in genres:
+            genre_itos[g["id"]] = g["name"]
+            genre_stoi[g["name"]] = g["id"]
+            genre_to_category[g["id"]] = g["category_id"]
+        category_itos = {}
+        category_stoi = {}
+        for c in categories:
+            category_itos[c["id"]] = c["name"]
+            category_stoi[c["name"]] = c["id"]
+        account_stoi = {}
+        account_itos = {}
+        for a in accounts:
+            account_itos[a["id"]] = a["name"]
+            account_stoi[a["name"]] = a["id"]
+        tables = {
+            "genre_itos": genre_itos,
+            "genre_stoi": genre_stoi,
+            "genre_to_category": genre_to_category,
+            "category_itos": category_itos,
+            "category_stoi": category_stoi,
+            "account_itos": account_itos,
+            "account_stoi": account_stoi,
+        }
+        if not self._has_id_tables():
+            # the tables assigned before the others were built are kept
+            tables.update(self._id_tables or {})
+        self._id_tables = tables
+
+    def _has_id_tables(self):
+        return self._id_tables is not None and all(name in self._id_tables for name in _ID_TABLES)
+
+    def _id_tables_fresh(self):
+        return time.monotonic() - self._id_tables_fetched < ID_TABLE_REFRESH_INTERVAL
+
+    def _load_cached_id_table(self):
+        if self._id_table_cache is None:
+            return False
+        tables = self._id_table_cache.load(self._user_key)
+        if tables is None:
+            return False
+        self._load_id_table(tables["genres"], tables["categories"], tables["accounts"])
+        return True
+
+    def _save_id_table(self, genres, categories, accounts):
+        self._id_tables_fetched = time.monotonic()
+        if self._id_table_cache is not None:
+            self._id_table_cache.save(
+                self._user_key,
+                {"genres": genres, "categories": categories, "accounts": accounts},
+            )
+        self._load_id_table(genres, categories, accounts)
+
+    def _payment_ids(self, genre, from_account=None):
+        genre_id = self.genre_stoi[genre]
+        category_id = self.genre_to_category[genre_id]
+        if from_account is not None:
+            from_account_id = self.account_stoi[from_account]
+        else:
+            from_account_id = None
+        return category_id, genre_id, from_account_id
+
+    def _income_ids(self, category, to_account=None):
+        category_id = self.category_stoi[category]
+        if to_account is not None:
+            to_account_id = self.account_stoi[to_account]
+        else:
+            to_account_id = None
+        return category_id, to_account_id
+
+    def _transfer_ids(self, from_account, to_account):
+        return self.account_stoi[from_account], self.account_stoi[to_account]
+
+
+def _collection_url(url, base_url=ZAIM_API_BASE_URL):
+    """return the URL of the collection of a resource (<base_url>/v2/home/<collection>).
+
+    The path of base_url (e.g. a stub server mounted at https://host/zaim) is kept as a prefix.
+    """
+    parts = urlsplit(url)
+    prefix = urlsplit(base_url).path.rstrip("/")
+    path = parts.path
+    if prefix and path.startswith(prefix + "/"):
+        path = path[len(prefix):]
+    else:
+        prefix = ""
+    path = prefix + "/".join(path.split("/")[:4])
+    return urlunsplit((parts.scheme, parts.netloc, path, "", ""))
+
+
+class ZaimAPI(_IdTableMixin):
+    """Wrapper class for the Zaim API.
+
+    Parameters
+    ==========
+    consumer_id : str
+        consumer ID.
+        If None, then the value of the environmental variable 'ZAIM_CONSUMER_ID' is referred to.
+    consumer_secret : str
+        consumer secret.
+        If None, then the value of the environmental variable 'ZAIM_CONSUMER_SECRET' is referred to.
+    access_token : str
+        access token. This value is normally obrained by using 'get_access_token()' function.
+        If None, then the value of the environmental variable 'ZAIM_ACCESS_TOKEN' is referred to.
+    access_token_secret : str
+        access token secret. This value is normally obrained by using 'get_access_token()' function.
+        If None, then the value of the environmental variable 'ZAIM_ACCESS_TOKEN_SECRET' is referred to.
+    oauth_verifier : str
+        OAuth verifier. This value is normally obrained by using 'get_access_token()' function.
+        If None, then the value of the environmental variable 'ZAIM_OAUTH_VERIFIER' is referred to.
+    id_table_cache : IdTableCache or str
+        on-disk cache of the genre/category/account tables, or its directory.
+        If None, the tables are fetched from the API on first use.
+    transport : Transport
+        rate limiter, timeouts, retry policy and pool size of the requests.
+        One Transport can be shared by many clients to keep them under one quota.
+        If None, a Transport with the default settings is used.
+    base_url : str
+        base URL of the API. This can be changed to a local stub server for testing.
+    response_cache : ResponseCache or str
+        cache of the GET responses, or the directory of its disk backend.
+        The cached money records are discarded by the insert, update and delete methods.
+        If None, every GET request is sent to the API.
+    session : requests.Session
+        session whose connection pool is shared with other clients (see ZaimClientPool).
+        The requests are signed for this client only. If None, the client has its own
+        OAuth1Session and connection pool.
+    """
+
+    def __init__(
+        self,
+        consumer_id: str = None,
+        consumer_secret: str = None,
+        access_token: str = None,
+        access_token_secret: str = None,
+        oauth_verifier: str = None,
+        id_table_cache=None,
+        transport: Transport = None,
+        base_url: str = ZAIM_API_BASE_URL,
+        response_cache=None,
+        session=None,
+    ):
+        (
+            self._consumer_id,
+            self._consumer_secret,
+            access_token,
+            access_token_secret,
+            oauth_verifier,
+        ) = _resolve_credentials(
+            consumer_id, consumer_secret, access_token, access_token_secret, oauth_verifier
+        )
+
+        # requests_oauthlib is imported on first use to keep "import pyzaim" fast
+        from requests_oauthlib import OAuth1, OAuth1Session
+
+        credentials = dict(
+            client_key=self._consumer_id,
+            client_secret=self._consumer_secret,
+            resource_owner_key=access_token,
+            resource_owner_secret=access_token_secret,
+            callback_uri=ZAIM_CALLBACK_URL,
+            verifier=oauth_verifier,
+        )
+        self._transport = transport if transport is not None else Transport()
+        if session is None:
+            self._auth = OAuth1Session(**credentials)
+            self._signer = None
+            self._pool_maxsize = self._transport.mount(self._auth)
+        else:
+            # the adapters of a shared session are mounted by its owner
+            self._auth = session
+            self._signer = OAuth1(**credentials)
+            self._pool_maxsize = None
+        self._local = threading.local()
+        self._metrics = Metrics()
+        self._base_url = base_url.rstrip("/")
+
+        # the ID tables are built lazily on first use of the name-based methods
+        if isinstance(id_table_cache, str):
+            id_table_cache = IdTableCache(id_table_cache)
+        self._id_table_cache = id_table_cache
+        self._user_key = user_key(self._consumer_id, access_token)
+        self._id_table_lock = threading.RLock()
+        if isinstance(response_cache, str):
+            response_cache = ResponseCache(directory=response_cache)
+        self._response_cache = response_cache
+
+    def verify(self):
+        return self._request("GET", ZAIM_API_VEFIRY_URL).json()
+
+    def stats(self):
+        """return the statistics of the requests sent by this client.
+
+        Returns
+        =======
+        dict
+            'requests' maps each endpoint (e.g. 'GET /v2/home/money') to its number of attempts,
+            request/response bytes, status codes, connection errors and latency histogram.
+            'phases' holds the durations of the ID table builds ('build_id_table').
+            'cache' holds the hits, misses and revalidations of the response cache, if any.
+        """
+        stats = self._metrics.snapshot()
+        if self._response_cache is not None:
+            stats["cache"] = self._response_cache.stats()
+        return stats
+
+    def reset_stats(self):
+        self._metrics.reset()
+
+    def add_hook(self, when, hook):
+        """register a hook called before ('pre') or after ('post') every request attempt.
+
+        'pre' hooks are called as hook(method, url, kwargs) and can modify kwargs
+        (e.g. to add tracing headers). 'post' hooks are called as hook(event) with a dict of
+        'method', 'url', 'endpoint', 'status', 'error', 'elapsed', 'request_bytes',
+        'response_bytes' and 'attempt', e.g. to export the metrics to Prometheus or OpenTelemetry.
+        """
+        self._metrics.add_hook(when, hook)
+
+    def get_data(self, params=None, records=False):
+        money = self._request("GET", ZAIM_API_MONEY_URL, params=params).json()["money"]
+        if records:
+            # Payment/Income/Transfer with the names shared through the ID tables
+            return [from_api(record, self) for record in money]
+        return money
+
+    def iter_money(
+        self,
+        start_date=None,
+        end_date=None,
+        page_size=100,
+        mode=None,
+        prefetch=False,
+        records=False,
+        **params,
+    ):
+        """iterate over money records page by page.
+
+        The API is requested with the 'page' and 'limit' parameters and the
+        records are yielded as soon as each page arrives, so that at most one
+        page (two pages with prefetch) is held in memory at a time.
+
+        Parameters
+        ==========
+        start_date : datetime.date
+            first date of the records. If None, no lower bound is applied.
+        end_date : datetime.date
+            last date of the records. If None, no upper bound is applied.
+        page_size : int
+            number of records requested per page. Values above ZAIM_API_MAX_PAGE_SIZE (100),
+            which the API caps, are lowered to it.
+        mode : str
+            'payment', 'income' or 'transfer'. If None, all kinds of records are yielded.
+        prefetch : bool
+            if True, the next page is requested in background while the current page is consumed.
+        records : bool
+            if True, Payment/Income/Transfer objects are yielded instead of dicts.
+        **params
+            other query parameters passed to the API as is (e.g. 'category_id', 'order').
+
+        Yields
+        ======
+        dict or MoneyRecord
+            money record.
+        """
+        if page_size < 1:
+            raise ValueError("page_size must be positive: {}".format(page_size))
+        # a short page marks the last one, so the size has to be one the API returns in full
+        page_size = min(page_size, ZAIM_API_MAX_PAGE_SIZE)
+        query = {"mapping": 1, "limit": page_size}
+        query.update(params)
+        if start_date is not None:
+            query["start_date"] = start_date.strftime("%Y-%m-%d")
+        if end_date is not None:
+            query["end_date"] = end_date.strftime("%Y-%m-%d")
+        if mode is not None:
+            query["mode"] = mode
+
+        def fetch(page):
+            return self.get_data(dict(query, page=page), records=records)
+
+        if not prefetch:
+            page = 1
+            while True:
+                money = fetch(page)
+                yield from money
+                if len(money) < page_size:
+                    return
+                page += 1
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            page = 1
+            future = executor.submit(fetch, page)
+            while True:
+                money = future.result()
+                if len(money) < page_size:
+                    yield from money
+                    return
+                page += 1
+                future = executor.submit(fetch, page)
+                yield from money
+
+    def insert_payment_simple(
+        self,
+        date,
+        amount,
+        genre,
+        from_account=None,
+        comment=None,
+        name=None,
+        place=None,
+    ):
+        category_id, genre_id, from_account_id = self._resolve_ids(
+            self._payment_ids, genre, from_account
+        )
+        return self.insert_payment(
+            date, amount, category_id, genre_id, from_account_id, comment, name, place
+        )
+
+    def insert_payment(
+        self,
+        date,
+        amount,
+        category_id,
+        genre_id,
+        from_account_id=None,
+        comment=None,
+        name=None,
+        place=None,
+    ):
+        data = _payment_data(
+            date, amount, category_id, genre_id, from_account_id, comment, name, place
+        )
+        return self._request("POST", ZAIM_API_MONEY_PAYMENT_URL, data=data)
+
+    def update_payment_simple(
+        self,
+        data_id,
+        date,
+        genre,
+        amount,
+        from_account=None,
+        comment=None,
+        name=None,
+        place=None,
+    ):
+        category_id, genre_id, from_account_id = self._resolve_ids(
+            self._payment_ids, genre, from_account
+        )
+        return self.update_payment(
+            data_id,
+            date,
+            amount,
+            category_id,
+            genre_id,
+            from_account_id,
+            comment,
+            name,
+            place,
+        )
+
+    def update_payment(
+        self,
+        data_id,
+        date,
+        amount,
+        category_id,
+        genre_id,
+        from_account_id=None,
+        comment=None,
+        name=None,
+        place=None,
+    ):
+        data = _payment_data(
+            date,
+            amount,
+            category_id,
+            genre_id,
+            from_account_id,
+            comment,
+            name,
+            place,
+            data_id=data_id,
+        )
+        return self._request(
+            "PUT", "{}/{}".format(ZAIM_API_MONEY_PAYMENT_URL, data_id), data=data
+        )
+
+    def delete_payment(self, data_id):
+        return self._request("DELETE", "{}/{}".format(ZAIM_API_MONEY_PAYMENT_URL, data_id))
+
+    def insert_income_simple(
+        self, date, category, amount, to_account=None, comment=None, place=None
+    ):
+        category_id, to_account_id = self._resolve_ids(
+            self._income_ids, category, to_account
+        )
+        return self.insert_income(
+            date, category_id, amount, to_account_id, comment, place
+        )
+
+    def insert_income(
+        self, date, category_id, amount, to_account_id=None, comment=None, place=None
+    ):
+        data = _income_data(date, category_id, amount, to_account_id, comment, place)
+        return self._request("POST", ZAIM_API_MONEY_INCOME_URL, data=data)
+
+    def update_income_simple(
+        self, data_id, date, category, amount, to_account=None, comment=None, place=None
+    ):
+        category_id, to_account_id = self._resolve_ids(
+            self._income_ids, category, to_account
+        )
+        return self.update_income(
+            data_id, date, category_id, amount, to_account_id, comment, place
+        )
+
+    def update_income(
+        self,
+        data_id,
+        date,
+        category_id,
+        amount,
+        to_account_id=None,
+        comment=None,
+        place=None,
+    ):
+        data = _income_data(
+            date, category_id, amount, to_account_id, comment, place, data_id=data_id
+        )
+        return self._request(
+            "PUT", "{}/{}".format(ZAIM_API_MONEY_INCOME_URL, data_id), data=data
+        )
+
+    def delete_income(self, data_id):
+        return self._request("DELETE", "{}/{}".format(ZAIM_API_MONEY_INCOME_URL, data_id))
+
+    def insert_transfer_simple(
+        self, date, amount, from_account, to_account, comment=None
+    ):
+        from_account_id, to_account_id = self._resolve_ids(
+            self._transfer_ids, from_account, to_account
+        )
+        return self.insert_transfer(
+            date, amount, from_account_id, to_account_id, comment
+        )
+
+    def insert_transfer(
+        self, date, amount, from_account_id, to_account_id, comment=None
+    ):
+        data = _transfer_data(date, amount, from_account_id, to_account_id, comment)
+        return self._request("POST", ZAIM_API_MONEY_TRANSFER_URL, data=data)
+
+    def update_transfer_simple(
+        self, data_id, date, amount, from_account, to_account, comment=None
+    ):
+        from_account_id, to_account_id = self._resolve_ids(
+            self._transfer_ids, from_account, to_account
+        )
+        return self.update_transfer(
+            data_id, date, amount, from_account_id, to_account_id, comment
+        )
+
+    def update_transfer(
+        self, data_id, date, amount, from_account_id, to_account_id, comment=None
+    ):
+        data = _transfer_data(
+            date, amount, from_account_id, to_account_id, comment, data_id=data_id
+        )
+        return self._request(
+            "PUT", "{}/{}".format(ZAIM_API_MONEY_TRANSFER_URL, data_id), data=data
+        )
+
+    def delete_transfer(self, data_id):
+        return self._request("DELETE", "{}/{}".format(ZAIM_API_MONEY_TRANSFER_URL, data_id))
+
+    def bulk_insert(
+        self,
+        records,
+        max_workers=8,
+        rate=None,
+        max_retries=3,
+        backoff=0.5,
+        methods=IDEMPOTENT_METHODS,
+    ):
+        """insert the records concurrently.
+
+        Parameters
+        ==========
+        records : iterable of dict
+            each record has 'mode' (or 'type') in 'payment', 'income' and 'transfer'
+            and the keyword arguments of the corresponding insert method.
+            The '*_simple' method is used if a name key ('genre', 'category',
+            'from_account' or 'to_account') is included.
+        max_workers : int
+            number of threads sending the requests.
+        rate : float
+            maximum number of requests per second. If None, the requests are not throttled.
+        max_retries : int
+            maximum number of retries for the transient errors (429, 5xx and connection errors).
+        backoff : float
+            base interval of the jittered exponential backoff in seconds.
+            'Retry-After' of the response is used instead if available.
+        methods : iterable of str
+            methods retried after 5xx errors and connection errors (see RetryPolicy).
+            By default an insert (POST) is retried only after 429 and after a connect timeout,
+            because the record may have been created by a request which failed later.
+            If None, inserts are retried as well, at the risk of duplicate records.
+
+        Returns
+        =======
+        list of BulkResult
+            results in the same order as the records.
+        """
+        return self._bulk("insert", records, max_workers, rate, max_retries, backoff, methods)
+
+    def bulk_update(
+        self,
+        records,
+        max_workers=8,
+        rate=None,
+        max_retries=3,
+        backoff=0.5,
+        methods=IDEMPOTENT_METHODS,
+    ):
+        """update the records concurrently.
+
+        Each record has 'id' of the target data in addition to the keys of bulk_insert.
+        See bulk_insert for the other parameters.
+        """
+        return self._bulk("update", records, max_workers, rate, max_retries, backoff, methods)
+
+    def bulk_delete(
+        self,
+        records,
+        max_workers=8,
+        rate=None,
+        max_retries=3,
+        backoff=0.5,
+        methods=IDEMPOTENT_METHODS,
+    ):
+        """delete the records concurrently.
+
+        Each record has 'mode' (or 'type') and 'id' of the target data.
+        See bulk_insert for the other parameters.
+        """
+        return self._bulk("delete", records, max_workers, rate, max_retries, backoff, methods)
+
+    def _bulk(self, action, records, max_workers, rate, max_retries, backoff, methods):
+        self._ensure_pool(max_workers)
+        limiter = TokenBucket(rate) if rate is not None else None
+        # the writes are retried by _write, so the transport must not retry them again
+        policy = RetryPolicy(max_retries, backoff, methods=methods)
+
+        def run(args):
+            index, record = args
+            return self._write(index, action, record, policy, limiter)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(run, enumerate(records)))
+
+    def _ensure_pool(self, max_workers):
+        if self._pool_maxsize is not None and max_workers > self._pool_maxsize:
+            # let every worker keep its own keep-alive connection
+            self._pool_maxsize = self._transport.mount(self._auth, max_workers)
+
+    def _write(self, index, action, record, policy, limiter=None):
+        """send one write of the bulk operations and the outbox, retrying the transient errors.
+        """
+        import requests
+
+        method = {"insert": "POST", "update": "PUT", "delete": "DELETE"}[action]
+        attempts = 0
+        self._local.retry = NO_RETRY
+        try:
+            while True:
+                attempts += 1
+                if limiter is not None:
+                    limiter.acquire()
+                try:
+                    res = self._dispatch_write(action, record)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    # nothing has reached the server if the connection was not established
+                    unsent = isinstance(e, requests.ConnectTimeout)
+                    if not (
+                        policy.should_retry(method, attempts)
+                        or unsent and attempts <= policy.max_retries
+                    ):
+                        raise
+                    res = None
+                else:
+                    if not policy.should_retry(method, attempts, res):
+                        break
+                self._transport.backoff(policy.delay(attempts, res), res, limiter)
+            try:
+                data = res.json()
+            except ValueError:
+                data = res.text
+            return BulkResult(index, record, res.ok, res.status_code, data, None, attempts)
+        except Exception as e:
+            return BulkResult(index, record, False, None, None, e, attempts)
+        finally:
+            self._local.retry = None
+
+    def _dispatch_write(self, action, record):
+        kwargs = dict(record)
+        mode = kwargs.pop("mode", None)
+        mode = kwargs.pop("type", mode)
+        if mode not in ("payment", "income", "transfer"):
+            raise ValueError("unknown mode: {}".format(mode))
+        if "id" in kwargs:
+            kwargs["data_id"] = kwargs.pop("id")
+        if action == "delete":
+            return getattr(self, "delete_{}".format(mode))(kwargs["data_id"])
+        if any(key in kwargs for key in ("genre", "category", "from_account", "to_account")):
+            return getattr(self, "{}_{}_simple".format(action, mode))(**kwargs)
+        return getattr(self, "{}_{}".format(action, mode))(**kwargs)
+
+    def refresh_id_tables(self):
+        """fetch the genres, categories and accounts and rebuild the ID tables.
+        """
+        with self._id_table_lock:
+            if self._response_cache is not None:
+                for url in (ZAIM_API_GENRE_URL, ZAIN_API_CATEGORY_URL, ZAIM_API_ACCOUNT_URL):
+                    self._response_cache.invalidate(
+                        ResponseCache.scope(self._user_key, self._url(url))
+                    )
+            self._save_id_table(
+                self._get_genre()["genres"],
+                self._get_category()["categories"],
+                self._get_account()["accounts"],
+            )
+
+    def _build_id_table(self):
+        with self._id_table_lock, self._metrics.phase("build_id_table"):
+            if not self._has_id_tables() and not self._load_cached_id_table():
+                self.refresh_id_tables()
+
+    def _resolve_ids(self, resolve, *names):
+        try:
+            return resolve(*names)
+        except KeyError:
+            # the name may have been created after the tables were built; a name missing
+            # from just fetched tables (e.g. a typo repeated in bulk_insert) is not refetched
+            with self._id_table_lock:
+                if not self._id_tables_fresh():
+                    self.refresh_id_tables()
+            return resolve(*names)
+
+    def _url(self, url):
+        if self._base_url != ZAIM_API_BASE_URL and url.startswith(ZAIM_API_BASE_URL):
+            url = self._base_url + url[len(ZAIM_API_BASE_URL):]
+        return url
+
+    def _request(self, method, url, **kwargs):
+        url = self._url(url)
+        cache = self._response_cache
+        if cache is None:
+            return self._send(method, url, **kwargs)
+        if method == "GET":
+            def send(conditional):
+                headers = dict(kwargs.get("headers") or {}, **conditional)
+                return self._send(method, url, **dict(kwargs, headers=headers))
+
+            return cache.fetch(ResponseCache.key(self._user_key, url, kwargs.get("params")), send)
+        try:
+            return self._send(method, url, **kwargs)
+        finally:
+            # e.g. a write to /v2/home/money/payment/1 discards the cached /v2/home/money
+            cache.invalidate(ResponseCache.scope(self._user_key, _collection_url(url, self._base_url)))
+
+    def _send(self, method, url, **kwargs):
+        retry = None
+        if method != "GET":
+            # a write of _write is retried by its caller; the GETs it makes (e.g. of the
+            # ID tables of insert_payment_simple) keep the policy of the transport
+            retry = getattr(self._local, "retry", None)
+        if self._signer is not None:
+            kwargs["auth"] = self._signer
+        return self._transport.request(
+            self._auth, method, url, retry=retry, observer=self._metrics, **kwargs
+        )
+
+    def _get_account(self):
+        return self._request("GET", ZAIM_API_ACCOUNT_URL).json()
+
+    def _get_category(self):
+        return self._request("GET", ZAIN_API_CATEGORY_URL).json()
+
+    def _get_genre(self):
+        return self._request("GET", ZAIM_API_GENRE_URL).json()
@@ -0,0 +1,418 @@
+import asyncio
+import json
+import time
+from typing import Any, NamedTuple
+from urllib.parse import urlencode
+
+from oauthlib.oauth1 import Client
+
+from .api import (
+    ZAIM_API_BASE_URL,
+    ZAIM_API_VERSION,
+    ZAIM_CALLBACK_URL,
+    _IdTableMixin,
+    _income_data,
+    _payment_data,
+    _resolve_credentials,
+    _transfer_data,
+)
+from .cache import IdTableCache, user_key
+from .instrumentation import Metrics
+from .transport import RetryPolicy
+
+FORM_CONTENT_TYPE: str = 'application/x-www-form-urlencoded'
+
+
+class _Response(NamedTuple):
+    """status and headers of an aiohttp response, in the names read by RetryPolicy.
+    """
+    status_code: int
+    headers: Any
+
+
+class AsyncZaimAPI(_IdTableMixin):
+    """asyncio version of ZaimAPI.
+
+    The requests are signed with OAuth1 and sent through one aiohttp connection pool
+    shared by all the coroutines, and the number of requests in flight is bounded by a semaphore.
+    The write methods return the decoded JSON response instead of the response object.
+    A response other than 2xx raises aiohttp.ClientResponseError after the retries of the
+    retry policy. 'aiohttp' is required to use this class.
+
+    Parameters
+    ==========
+    consumer_id, consumer_secret, access_token, access_token_secret, oauth_verifier : str
+        credentials. See ZaimAPI for the details.
+    max_concurrency : int
+        maximum number of requests in flight.
+    max_connections : int
+        size of the connection pool. If None, the value of max_concurrency is used.
+    timeout : float
+        total timeout of each request in seconds.
+    base_url : str
+        base URL of the API. This can be changed to a local stub server for testing.
+    id_table_cache : IdTableCache or str
+        on-disk cache of the genre/category/account tables, or its directory.
+    retry : RetryPolicy
+        retry policy of 429, 5xx and connection errors, as in Transport.
+        If None, the default RetryPolicy is used.
+    """
+
+    def __init__(
+        self,
+        consumer_id: str = None,
+        consumer_secret: str = None,
+        access_token: str = None,
+        access_token_secret: str = None,
+        oauth_verifier: str = None,
+        max_concurrency: int = 100,
+        max_connections: int = None,
+        timeout: float = 60.0,
+        base_url: str = ZAIM_API_BASE_URL,
+        id_table_cache=None,
+        retry: RetryPolicy = None,
+    ):
+        (
+            self._consumer_id,
+            self._consumer_secret,
+            access_token,
+            access_token_secret,
+            oauth_verifier,
+        ) = _resolve_credentials(
+            consumer_id, consumer_secret, access_token, access_token_secret, oauth_verifier
+        )
+        self._client = Client(
+            client_key=self._consumer_id,
+            client_secret=self._consumer_secret,
+            resource_owner_key=access_token,
+            resource_owner_secret=access_token_secret,
+            callback_uri=ZAIM_CALLBACK_URL,
+            verifier=oauth_verifier,
+        )
+        self._home_url = f'{base_url}/{ZAIM_API_VERSION}/home'
+        self._max_concurrency = max_concurrency
+        self._max_connections = max_connections or max_concurrency
+        self._timeout = timeout
+        self._retry = retry if retry is not None else RetryPolicy()
+        self._semaphore = None
+        self._session = None
+        if isinstance(id_table_cache, str):
+            id_table_cache = IdTableCache(id_table_cache)
+        self._id_table_cache = id_table_cache
+        self._user_key = user_key(self._consumer_id, access_token)
+        self._id_table_lock = None
+        self._metrics = Metrics()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def stats(self):
+        """return the statistics of the requests sent by this client. See ZaimAPI.stats.
+        """
+        return self._metrics.snapshot()
+
+    def reset_stats(self):
+        self._metrics.reset()
+
+    def add_hook(self, when, hook):
+        """register a hook called before ('pre') or after ('post') every request. See ZaimAPI.add_hook.
+        """
+        self._metrics.add_hook(when, hook)
+
+    async def verify(self):
+        return await self._request("GET", "/user/verify")
+
+    async def get_data(self, params=None):
+        return (await self._request("GET", "/money", params=params))["money"]
+
+    async def insert_payment_simple(
+        self,
+        date,
+        amount,
+        genre,
+        from_account=None,
+        comment=None,
+        name=None,
+        place=None,
+    ):
+        category_id, genre_id, from_account_id = await self._resolve_ids(
+            self._payment_ids, genre, from_account
+        )
+        return await self.insert_payment(
+            date, amount, category_id, genre_id, from_account_id, comment, name, place
+        )
+
+    async def insert_payment(
+        self,
+        date,
+        amount,
+        category_id,
+        genre_id,
+        from_account_id=None,
+        comment=None,
+        name=None,
+        place=None,
+    ):
+        data = _payment_data(
+            date, amount, category_id, genre_id, from_account_id, comment, name, place
+        )
+        return await self._request("POST", "/money/payment", data=data)
+
+    async def update_payment_simple(
+        self,
+        data_id,
+        date,
+        genre,
+        amount,
+        from_account=None,
+        comment=None,
+        name=None,
+        place=None,
+    ):
+        category_id, genre_id, from_account_id = await self._resolve_ids(
+            self._payment_ids, genre, from_account
+        )
+        return await self.update_payment(
+            data_id,
+            date,
+            amount,
+            category_id,
+            genre_id,
+            from_account_id,
+            comment,
+            name,
+            place,
+        )
+
+    async def update_payment(
+        self,
+        data_id,
+        date,
+        amount,
+        category_id,
+        genre_id,
+        from_account_id=None,
+        comment=None,
+        name=None,
+        place=None,
+    ):
+        data = _payment_data(
+            date,
+            amount,
+            category_id,
+            genre_id,
+            from_account_id,
+            comment,
+            name,
+            place,
+            data_id=data_id,
+        )
+        return await self._request("PUT", f"/money/payment/{data_id}", data=data)
+
+    async def delete_payment(self, data_id):
+        return await self._request("DELETE", f"/money/payment/{data_id}")
+
+    async def insert_income_simple(
+        self, date, category, amount, to_account=None, comment=None, place=None
+    ):
+        category_id, to_account_id = await self._resolve_ids(
+            self._income_ids, category, to_account
+        )
+        return await self.insert_income(
+            date, category_id, amount, to_account_id, comment, place
+        )
+
+    async def insert_income(
+        self, date, category_id, amount, to_account_id=None, comment=None, place=None
+    ):
+        data = _income_data(date, category_id, amount, to_account_id, comment, place)
+        return await self._request("POST", "/money/income", data=data)
+
+    async def update_income_simple(
+        self, data_id, date, category, amount, to_account=None, comment=None, place=None
+    ):
+        category_id, to_account_id = await self._resolve_ids(
+            self._income_ids, category, to_account
+        )
+        return await self.update_income(
+            data_id, date, category_id, amount, to_account_id, comment, place
+        )
+
+    async def update_income(
+        self,
+        data_id,
+        date,
+        category_id,
+        amount,
+        to_account_id=None,
+        comment=None,
+        place=None,
+    ):
+        data = _income_data(
+            date, category_id, amount, to_account_id, comment, place, data_id=data_id
+        )
+        return await self._request("PUT", f"/money/income/{data_id}", data=data)
+
+    async def delete_income(self, data_id):
+        return await self._request("DELETE", f"/money/income/{data_id}")
+
+    async def insert_transfer_simple(
+        self, date, amount, from_account, to_account, comment=None
+    ):
+        from_account_id, to_account_id = await self._resolve_ids(
+            self._transfer_ids, from_account, to_account
+        )
+        return await self.insert_transfer(
+            date, amount, from_account_id, to_account_id, comment
+        )
+
+    async def insert_transfer(
+        self, date, amount, from_account_id, to_account_id, comment=None
+    ):
+        data = _transfer_data(date, amount, from_account_id, to_account_id, comment)
+        return await self._request("POST", "/money/transfer", data=data)
+
+    async def update_transfer_simple(
+        self, data_id, date, amount, from_account, to_account, comment=None
+    ):
+        from_account_id, to_account_id = await self._resolve_ids(
+            self._transfer_ids, from_account, to_account
+        )
+        return await self.update_transfer(
+            data_id, date, amount, from_account_id, to_account_id, comment
+        )
+
+    async def update_transfer(
+        self, data_id, date, amount, from_account_id, to_account_id, comment=None
+    ):
+        data = _transfer_data(
+            date, amount, from_account_id, to_account_id, comment, data_id=data_id
+        )
+        return await self._request("PUT", f"/money/transfer/{data_id}", data=data)
+
+    async def delete_transfer(self, data_id):
+        return await self._request("DELETE", f"/money/transfer/{data_id}")
+
+    async def build_id_table(self):
+        """build the ID tables from the cache, or from the API if the cache is missing or expired.
+        """
+        if self._id_table_lock is None:
+            self._id_table_lock = asyncio.Lock()
+        async with self._id_table_lock:
+            with self._metrics.phase("build_id_table"):
+                if not self._has_id_tables() and not self._load_cached_id_table():
+                    await self._fetch_id_table()
+
+    async def refresh_id_tables(self):
+        """fetch the genres, categories and accounts concurrently and rebuild the ID tables.
+        """
+        if self._id_table_lock is None:
+            self._id_table_lock = asyncio.Lock()
+        async with self._id_table_lock:
+            await self._fetch_id_table()
+
+    async def _fetch_id_table(self):
+        genre, category, account = await asyncio.gather(
+            self._request("GET", "/genre"),
+            self._request("GET", "/category"),
+            self._request("GET", "/account"),
+        )
+        self._save_id_table(genre["genres"], category["categories"], account["accounts"])
+
+    def _build_id_table(self):
+        raise RuntimeError("the ID tables are not built yet: await build_id_table() first")
+
+    async def _resolve_ids(self, resolve, *names):
+        if not self._has_id_tables():
+            await self.build_id_table()
+        try:
+            return resolve(*names)
+        except KeyError:
+            # the name may have been created after the tables were built; a name missing
+            # from just fetched tables is not refetched
+            if self._id_table_lock is None:
+                self._id_table_lock = asyncio.Lock()
+            async with self._id_table_lock:
+                if not self._id_tables_fresh():
+                    await self._fetch_id_table()
+            return resolve(*names)
+
+    def _get_session(self):
+        if self._session is None:
+            try:
+                import aiohttp
+            except ImportError as e:
+                raise ImportError(
+                    "aiohttp is required to use AsyncZaimAPI: pip install aiohttp"
+                ) from e
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self._max_connections),
+                timeout=aiohttp.ClientTimeout(total=self._timeout),
+            )
+            self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        return self._session
+
+    async def _request(self, method, path, params=None, data=None):
+        session = self._get_session()
+        import aiohttp
+
+        url = self._home_url + path
+        if params:
+            url = f"{url}?{urlencode(params)}"
+        form = None
+        if data is not None:
+            form = urlencode(data)
+        attempt = 0
+        while True:
+            attempt += 1
+            # every attempt is signed with a new nonce
+            headers = {"Content-Type": FORM_CONTENT_TYPE} if form is not None else {}
+            signed_url, headers, body = self._client.sign(url, method, form, headers)
+            kwargs = {"headers": headers, "data": body}
+            async with self._semaphore:
+                self._metrics.before_request(method, signed_url, kwargs)
+                start = time.perf_counter()
+                try:
+                    async with session.request(method, signed_url, **kwargs) as res:
+                        content = await res.read()
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                    self._metrics.record_request(
+                        method, signed_url, None, e, time.perf_counter() - start,
+                        len(body or ""), 0, attempt,
+                    )
+                    if not self._retry.should_retry(method, attempt):
+                        raise
+                    response = None
+                except Exception as e:
+                    self._metrics.record_request(
+                        method, signed_url, None, e, time.perf_counter() - start,
+                        len(body or ""), 0, attempt,
+                    )
+                    raise
+                else:
+                    self._metrics.record_request(
+                        method, signed_url, res.status, None, time.perf_counter() - start,
+                        len(body or ""), len(content), attempt,
+                    )
+                    response = _Response(res.status, res.headers)
+                    if not self._retry.should_retry(method, attempt, response):
+                        if not 200 <= res.status < 300:
+                            raise aiohttp.ClientResponseError(
+                                res.request_info,
+                                res.history,
+                                status=res.status,
+                                message="{}: {}".format(
+                                    res.reason, content.decode("utf-8", "replace")
+                                ),
+                                headers=res.headers,
+                            )
+                        return json.loads(content)
+            await asyncio.sleep(self._retry.delay(attempt, response))
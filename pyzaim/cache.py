@@ -0,0 +1,454 @@
+import collections
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+
+# Default lifetime of the cached ID tables in seconds
+ID_TABLE_CACHE_TTL: float = 24 * 60 * 60
+
+
+def user_key(consumer_id, access_token):
+    """return an opaque key identifying the user of the credentials.
+    """
+    source = "{}:{}".format(consumer_id, access_token).encode("utf-8")
+    return hashlib.sha256(source).hexdigest()[:32]
+
+
+class IdTableCache:
+    """on-disk cache of the genre/category/account tables.
+
+    The tables are saved as one JSON file per user and are ignored once they get older than the TTL.
+
+    Parameters
+    ==========
+    directory : str
+        directory of the cache files.
+        If None, '$XDG_CACHE_HOME/pyzaim' (or '~/.cache/pyzaim') is used.
+    ttl : float
+        lifetime of the cached tables in seconds.
+    """
+
+    def __init__(self, directory=None, ttl=ID_TABLE_CACHE_TTL):
+        if directory is None:
+            base = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+            directory = os.path.join(base, "pyzaim")
+        self.directory = directory
+        self.ttl = ttl
+
+    def load(self, key):
+        """return the tables of the user, or None if they are missing or expired.
+        """
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - entry.get("fetched_at", 0) > self.ttl:
+            return None
+        return entry.get("tables")
+
+    def save(self, key, tables):
+        os.makedirs(self.directory, exist_ok=True)
+        entry = {"fetched_at": time.time(), "tables": tables}
+        # write to a temporary file first so that concurrent readers never see a partial file
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    def clear(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _path(self, key):
+        return os.path.join(self.directory, "id_tables-{}.json".format(key))
+
+
+class MemoryIdTableCache:
+    """in-memory LRU cache of the ID tables with the interface of IdTableCache.
+
+    The genres, categories and accounts are stored once per distinct content, so that
+    the users sharing the default genres and categories share their tables too.
+    The least recently used users are evicted beyond max_entries.
+
+    Parameters
+    ==========
+    max_entries : int
+        maximum number of the users whose tables are kept.
+    ttl : float
+        lifetime of the cached tables in seconds.
+    backend : IdTableCache
+        second-level cache read on misses and written through, e.g. on disk.
+        If None, the tables are kept in memory only.
+    """
+
+    def __init__(self, max_entries=1024, ttl=ID_TABLE_CACHE_TTL, backend=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        # key -> (stored_at, digests of the genres, categories and accounts)
+        self._entries = collections.OrderedDict()
+        # digest -> [table, number of the entries referring to it]
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def load(self, key):
+        """return the tables of the user, or None if they are missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[0] > self.ttl:
+                self._remove(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(zip(_TABLE_NAMES, (self._tables[d][0] for d in entry[1])))
+            self.misses += 1
+        if self.backend is None:
+            return None
+        tables = self.backend.load(key)
+        if tables is not None:
+            self._put(key, tables)
+        return tables
+
+    def save(self, key, tables):
+        self._put(key, tables)
+        if self.backend is not None:
+            self.backend.save(key, tables)
+
+    def clear(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+        if self.backend is not None:
+            self.backend.clear(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "tables": len(self._tables),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _put(self, key, tables):
+        digests = tuple(
+            _digest(json.dumps(tables[name], sort_keys=True, ensure_ascii=False))
+            for name in _TABLE_NAMES
+        )
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            for name, digest in zip(_TABLE_NAMES, digests):
+                shared = self._tables.setdefault(digest, [tables[name], 0])
+                shared[1] += 1
+            self._entries[key] = (time.time(), digests)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        _, digests = self._entries.pop(key)
+        for digest in digests:
+            shared = self._tables[digest]
+            shared[1] -= 1
+            if shared[1] == 0:
+                del self._tables[digest]
+
+
+_TABLE_NAMES = ("genres", "categories", "accounts")
+
+
+# Default lifetime of the cached responses served without any request, in seconds
+RESPONSE_CACHE_TTL: float = 60.0
+
+# Default age after which the cached responses are discarded instead of revalidated, in seconds
+RESPONSE_CACHE_MAX_AGE: float = 24 * 60 * 60
+
+# Response headers kept with the cached responses
+_CACHED_HEADERS = ("Content-Type", "ETag", "Last-Modified")
+
+
+class ResponseCache:
+    """LRU cache of the GET responses of the API with an optional disk backend.
+
+    A response younger than the TTL is served without any request. An older one is
+    revalidated with 'If-None-Match' / 'If-Modified-Since' when the server sent an
+    'ETag' / 'Last-Modified' header, and fetched again otherwise.
+    The least recently used responses are evicted from memory beyond max_entries or
+    max_bytes, and every response is discarded after max_age.
+
+    Parameters
+    ==========
+    max_entries : int
+        maximum number of the responses kept in memory.
+    max_bytes : int
+        maximum total size of the response bodies kept in memory. If None, no limit is applied.
+    ttl : float
+        lifetime of the responses served without any request, in seconds.
+    max_age : float
+        age after which the responses are discarded, in seconds.
+    directory : str
+        directory of the disk backend. If None, the responses are kept in memory only.
+    """
+
+    def __init__(
+        self,
+        max_entries=256,
+        max_bytes=None,
+        ttl=RESPONSE_CACHE_TTL,
+        max_age=RESPONSE_CACHE_MAX_AGE,
+        directory=None,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_age = max_age
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self._entries = collections.OrderedDict()
+        self._bytes = 0
+        # number of invalidations of each scope, so that a GET sent before a write
+        # and answered after it does not cache its stale response
+        self._generations = collections.Counter()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def scope(user, url):
+        """return the scope of the responses of the URL with any query, for invalidate().
+        """
+        return "{} {}".format(user, url)
+
+    @classmethod
+    def key(cls, user, url, params=None):
+        """return the key of a GET request of the user.
+        """
+        query = sorted((str(k), str(v)) for k, v in (params or {}).items())
+        return "{}?{}".format(cls.scope(user, url), urlencode(query))
+
+    def fetch(self, key, send):
+        """return the response of the key from the cache, or by calling send(headers).
+
+        'headers' are the conditional headers revalidating the cached response, if any.
+        A 304 response renews the cached one, and a 200 response is cached, unless the
+        scope of the key has been invalidated while the request was in flight.
+        """
+        generation = self.generation(_scope_of(key))
+        entry = self.get(key)
+        if entry is not None and self.is_fresh(entry):
+            with self._lock:
+                self.hits += 1
+            return self.to_response(entry)
+        response = send(self.conditional_headers(entry))
+        if response.status_code == 304 and entry is not None:
+            with self._lock:
+                self.revalidated += 1
+            self.touch(key, entry, generation)
+            return self.to_response(entry)
+        with self._lock:
+            self.misses += 1
+        if response.status_code == 200:
+            self.store(key, response, generation)
+        return response
+
+    def generation(self, scope):
+        """return the number of invalidations of the scope.
+        """
+        with self._lock:
+            return self._generations[scope]
+
+    def get(self, key):
+        """return the cached entry, or None if it is missing or too old.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None and self.directory is not None:
+            entry = self._load(key)
+            if entry is not None:
+                self._put(key, entry)
+        if entry is not None and time.time() - entry["stored_at"] > self.max_age:
+            self.discard(key)
+            return None
+        return entry
+
+    def is_fresh(self, entry):
+        return time.time() - entry["stored_at"] <= self.ttl
+
+    def conditional_headers(self, entry):
+        """return the headers revalidating the entry, or an empty dict if it cannot be revalidated.
+        """
+        headers = {}
+        if entry is not None:
+            if "ETag" in entry["headers"]:
+                headers["If-None-Match"] = entry["headers"]["ETag"]
+            if "Last-Modified" in entry["headers"]:
+                headers["If-Modified-Since"] = entry["headers"]["Last-Modified"]
+        return headers
+
+    def store(self, key, response, generation=None):
+        """cache a successful response of the request with the key.
+
+        If generation is given and the scope has been invalidated since, nothing is cached.
+        """
+        entry = {
+            "scope": _scope_of(key),
+            "url": response.url,
+            "stored_at": time.time(),
+            "headers": {h: response.headers[h] for h in _CACHED_HEADERS if h in response.headers},
+            "content": response.content,
+        }
+        if not self._put(key, entry, generation):
+            return None
+        if self.directory is not None:
+            self._save(key, entry)
+            if generation is not None and self.generation(entry["scope"]) != generation:
+                # invalidated while the file was written
+                self._remove(self._path(key))
+        return entry
+
+    def touch(self, key, entry, generation=None):
+        """renew the entry after the server answered that it has not been modified.
+        """
+        if generation is not None and self.generation(entry["scope"]) != generation:
+            return
+        entry["stored_at"] = time.time()
+        if self.directory is not None:
+            self._save(key, entry)
+
+    def discard(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= len(entry["content"])
+        if self.directory is not None:
+            self._remove(self._path(key))
+
+    def invalidate(self, scope):
+        """discard every response cached under the scope (e.g. the user and a resource path).
+        """
+        with self._lock:
+            self._generations[scope] += 1
+            for key in [k for k, e in self._entries.items() if e["scope"] == scope]:
+                self._bytes -= len(self._entries.pop(key)["content"])
+        if self.directory is not None:
+            prefix = _digest(scope) + "-"
+            try:
+                names = os.listdir(self.directory)
+            except FileNotFoundError:
+                return
+            for name in names:
+                if name.startswith("response-" + prefix):
+                    self._remove(os.path.join(self.directory, name))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        if self.directory is not None and os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.startswith("response-"):
+                    self._remove(os.path.join(self.directory, name))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidated": self.revalidated,
+            }
+
+    @staticmethod
+    def to_response(entry):
+        """build a requests.Response from a cached entry.
+        """
+        import requests
+
+        response = requests.Response()
+        response.status_code = 200
+        response.url = entry["url"]
+        response.headers = requests.structures.CaseInsensitiveDict(entry["headers"])
+        response._content = entry["content"]
+        response.from_cache = True
+        return response
+
+    def _put(self, key, entry, generation=None):
+        with self._lock:
+            if generation is not None and self._generations[entry["scope"]] != generation:
+                return False
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old["content"])
+            self._entries[key] = entry
+            self._bytes += len(entry["content"])
+            while self._entries and (
+                len(self._entries) > self.max_entries
+                or (self.max_bytes is not None and self._bytes > self.max_bytes)
+            ):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted["content"])
+        return True
+
+    def _path(self, key):
+        # the files of a scope share a prefix so that invalidate() finds them by name
+        scope = _scope_of(key)
+        return os.path.join(
+            self.directory, "response-{}-{}.json".format(_digest(scope), _digest(key))
+        )
+
+    def _load(self, key):
+        try:
+            with open(self._path(key), encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get("key") != key:
+            return None
+        entry.pop("key")
+        entry["content"] = entry["content"].encode("latin-1")
+        return entry
+
+    def _save(self, key, entry):
+        os.makedirs(self.directory, exist_ok=True)
+        data = dict(entry, key=key, content=entry["content"].decode("latin-1"))
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _digest(value):
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()[:32]
+
+
+def _scope_of(key):
+    return key.split("?", 1)[0]
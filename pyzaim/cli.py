@@ -0,0 +1,474 @@
+"""command-line interface of pyzaim.
+
+    pyzaim export --start 2015-01-01 --end 2020-12-31 --format jsonl --output export/
+    pyzaim export --source crawler --start 2020-01-01 --workers 3 --format parquet
+
+The export splits the date range into shards, fetches them concurrently and writes one
+file per shard. Finished shards are recorded in a checkpoint file, so that running the
+same command again after an interruption fetches only the unfinished shards.
+"""
+import argparse
+import calendar
+import csv
+import datetime
+import json
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from getpass import getpass
+
+from .api import ZAIM_API_BASE_URL
+
+EXPORT_SOURCES = ("api", "crawler")
+EXPORT_FORMATS = ("jsonl", "csv", "parquet")
+EXPORT_SHARDS = ("year", "month", "day")
+# ways of ZaimCrawler to read the rows (crawler.CRAWLER_EXTRACTIONS, which requires selenium)
+EXPORT_EXTRACTIONS = ("script", "html", "webdriver")
+
+# Columns of the CSV export
+CSV_COLUMNS = (
+    "id",
+    "mode",
+    "date",
+    "amount",
+    "category_id",
+    "genre_id",
+    "from_account_id",
+    "to_account_id",
+    "category",
+    "genre",
+    "from_account",
+    "to_account",
+    "name",
+    "place",
+    "comment",
+    "count",
+    "created",
+)
+
+CHECKPOINT_NAME: str = "checkpoint.json"
+
+# Environmental variables of the login of the crawler
+ZAIM_USER_ID: str = "ZAIM_USER_ID"
+ZAIM_PASSWORD: str = "ZAIM_PASSWORD"
+
+
+def split_shards(start, end, shard="month"):
+    """split the dates from start to end (both inclusive) into shards.
+
+    Returns
+    =======
+    list of tuple
+        (name, first date, last date) of the shards, e.g. ('2020-01', 2020-01-01, 2020-01-31).
+    """
+    shards = []
+    first = start
+    while first <= end:
+        if shard == "day":
+            name = first.strftime("%Y-%m-%d")
+            last = first
+        elif shard == "month":
+            name = first.strftime("%Y-%m")
+            last = first.replace(day=calendar.monthrange(first.year, first.month)[1])
+        elif shard == "year":
+            name = first.strftime("%Y")
+            last = first.replace(month=12, day=31)
+        else:
+            raise ValueError("unknown shard: {}".format(shard))
+        last = min(last, end)
+        shards.append((name, first, last))
+        first = last + datetime.timedelta(days=1)
+    return shards
+
+
+class Checkpoint:
+    """JSON file recording the finished shards of an export.
+
+    Parameters
+    ==========
+    path : str
+        path of the checkpoint file.
+    job : dict
+        settings of the export. A checkpoint of other settings is not resumed.
+        The settings resolved when the export starts (e.g. an end date defaulting to today)
+        are left out and passed to load(), so that they are kept when it is resumed.
+    """
+
+    def __init__(self, path, job):
+        self.path = path
+        self.job = job
+        self.shards = {}
+        self._lock = threading.Lock()
+
+    def load(self, defaults=None):
+        """read the finished shards, or raise ValueError if the file belongs to another export.
+
+        Parameters
+        ==========
+        defaults : dict
+            settings missing from the job, taken from the checkpoint if it exists.
+        """
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            state = None
+        for name, value in (defaults or {}).items():
+            if name not in self.job:
+                self.job[name] = (state or {}).get("job", {}).get(name, value)
+        if state is None:
+            return self
+        if state.get("job") != self.job:
+            raise ValueError(
+                "{} was written by an export with other settings".format(self.path)
+            )
+        self.shards = state.get("shards", {})
+        return self
+
+    def done(self, name):
+        return name in self.shards
+
+    def finish(self, name, **info):
+        with self._lock:
+            self.shards[name] = info
+            self._save()
+
+    def _save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        # write to a temporary file first so that an interruption never leaves a partial file
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"job": self.job, "shards": self.shards}, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+
+def write_records(records, path, fmt, api=None):
+    """write the records to a file of the format and return their number.
+
+    The records are streamed, and the file appears under the path only when it is complete.
+    """
+    tmp = path + ".part"
+    try:
+        if fmt == "parquet":
+            from .columnar import write_parquet
+
+            count = write_parquet(records, tmp, api)
+        else:
+            count = 0
+            with open(tmp, "w", encoding="utf-8", newline="") as f:
+                if fmt == "csv":
+                    writer = csv.DictWriter(f, CSV_COLUMNS, extrasaction="ignore")
+                    writer.writeheader()
+                    for record in records:
+                        writer.writerow(_plain(record))
+                        count += 1
+                else:
+                    for record in records:
+                        f.write(json.dumps(_plain(record), ensure_ascii=False) + "\n")
+                        count += 1
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return count
+
+
+def _plain(record):
+    """return a JSON/CSV-friendly dict of an API record or a crawler item.
+    """
+    record = dict(record.items())
+    if "type" in record:
+        record["mode"] = record.pop("type")
+    date = record.get("date")
+    if isinstance(date, (datetime.date, datetime.datetime)):
+        record["date"] = date.strftime("%Y-%m-%d")
+    return record
+
+
+def run_export(shards, workers, fetch, output, fmt, checkpoint, api=None, progress=True):
+    """fetch and write the unfinished shards concurrently.
+
+    Parameters
+    ==========
+    shards : list of tuple
+        shards returned by split_shards.
+    workers : int
+        number of the shards fetched at a time.
+    fetch : callable
+        fetch() returns a function of a worker, which is called with the first and the
+        last dates of a shard and returns an iterable of its records.
+        The optional close() attribute of the function is called when the worker ends.
+    output : str
+        directory of the files.
+    fmt : str
+        'jsonl', 'csv' or 'parquet'.
+    checkpoint : Checkpoint
+        record of the finished shards.
+    api : ZaimAPI
+        client whose ID tables fill the names of the Parquet files.
+    progress : bool
+        if True, a progress bar with the throughput and the ETA is shown.
+
+    Returns
+    =======
+    dict
+        'shards' (written), 'skipped', 'failed' (name -> exception), 'rows' and 'seconds'.
+    """
+    os.makedirs(output, exist_ok=True)
+    todo = [shard for shard in shards if not checkpoint.done(shard[0])]
+    tasks = queue.Queue()
+    for shard in todo:
+        tasks.put(shard)
+    failed = {}
+    lock = threading.Lock()
+    rows = [0]
+    start = time.perf_counter()
+    pbar = None
+    if progress:
+        from tqdm import tqdm
+
+        pbar = tqdm(total=len(shards), initial=len(shards) - len(todo), unit="shard")
+
+    def report():
+        if pbar is not None:
+            elapsed = time.perf_counter() - start
+            rate = rows[0] / elapsed if elapsed else 0
+            pbar.set_postfix_str("rows={}, rows/s={:.0f}".format(rows[0], rate))
+
+    def work():
+        get = None
+        try:
+            while True:
+                try:
+                    name, first, last = tasks.get_nowait()
+                except queue.Empty:
+                    return
+                shard_start = time.perf_counter()
+                path = os.path.join(output, "money-{}.{}".format(name, fmt))
+                try:
+                    if get is None:
+                        get = fetch()
+                    records = _counted(get(first, last), rows, lock, report)
+                    count = write_records(records, path, fmt, api)
+                except Exception as e:
+                    failed[name] = e
+                    # a worker failing once (e.g. a broken driver) starts over with a new one
+                    _close(get)
+                    get = None
+                else:
+                    checkpoint.finish(
+                        name,
+                        file=os.path.basename(path),
+                        rows=count,
+                        seconds=round(time.perf_counter() - shard_start, 3),
+                    )
+                if pbar is not None:
+                    with lock:
+                        pbar.update(1)
+                        report()
+        finally:
+            _close(get)
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for future in [executor.submit(work) for _ in range(min(workers, len(todo)))]:
+                future.result()
+    finally:
+        if pbar is not None:
+            pbar.close()
+    return {
+        "shards": len(todo) - len(failed),
+        "skipped": len(shards) - len(todo),
+        "failed": failed,
+        "rows": rows[0],
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def _counted(records, rows, lock, report, every=1000):
+    """yield the records, adding their number to rows[0] every 'every' records.
+    """
+    n = 0
+    for record in records:
+        yield record
+        n += 1
+        if n == every:
+            with lock:
+                rows[0] += n
+                report()
+            n = 0
+    with lock:
+        rows[0] += n
+
+
+def _close(get):
+    close = getattr(get, "close", None)
+    if close is not None:
+        close()
+
+
+def _api_fetcher(args):
+    from .api import ZaimAPI
+    from .transport import TokenBucket, Transport
+
+    transport = Transport(limiter=TokenBucket(args.rate) if args.rate else None)
+    api = ZaimAPI(
+        id_table_cache=args.id_table_cache, transport=transport, base_url=args.base_url
+    )
+    api._ensure_pool(args.workers)
+
+    def fetch():
+        def get(first, last):
+            return api.iter_money(
+                start_date=first, end_date=last, page_size=args.page_size, prefetch=True
+            )
+        return get
+
+    return api, fetch
+
+
+def _crawler_fetcher(args):
+    from .crawler import ZaimCrawler
+
+    user_id = os.environ.get(ZAIM_USER_ID) or input("Please input login ID: ")
+    password = os.environ.get(ZAIM_PASSWORD) or getpass("Please input password: ")
+
+    def fetch():
+        crawler = ZaimCrawler(
+            user_id,
+            password,
+            driver_path=args.driver_path,
+            headless=args.headless,
+            extraction=args.extraction,
+            cookie_path=args.cookie_path,
+        )
+
+        def get(first, last):
+            month = first.replace(day=1)
+            while month <= last:
+                for item in crawler.iter_data(month.year, month.month, progress=False):
+                    # a shard may start or end in the middle of a month
+                    if first <= item["date"].date() <= last:
+                        yield item
+                month = (month + datetime.timedelta(days=31)).replace(day=1)
+
+        get.close = crawler.close
+        return get
+
+    return None, fetch
+
+
+def _date(value):
+    try:
+        return datetime.datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid date (YYYY-MM-DD): {}".format(value))
+
+
+def export(args):
+    if args.source == "crawler" and args.shard == "day":
+        raise SystemExit("the crawler reads whole months; use --shard month or year")
+    job = {
+        "source": args.source,
+        "format": args.format,
+        "shard": args.shard,
+        "start": args.start.strftime("%Y-%m-%d"),
+    }
+    # the default end is fixed by the first run, so that a resumed export has the same shards
+    defaults = {}
+    if args.end is None:
+        defaults["end"] = datetime.date.today().strftime("%Y-%m-%d")
+    else:
+        job["end"] = args.end.strftime("%Y-%m-%d")
+    path = args.checkpoint or os.path.join(args.output, CHECKPOINT_NAME)
+    if args.restart and os.path.exists(path):
+        os.remove(path)
+    try:
+        checkpoint = Checkpoint(path, job).load(defaults)
+    except ValueError as e:
+        raise SystemExit("{}; use --restart to start over".format(e))
+    args.end = _date(job["end"])
+    if args.end < args.start:
+        raise SystemExit("--end must not be before --start")
+    shards = split_shards(args.start, args.end, args.shard)
+
+    if args.source == "api":
+        api, fetch = _api_fetcher(args)
+    else:
+        api, fetch = _crawler_fetcher(args)
+    result = run_export(
+        shards, args.workers, fetch, args.output, args.format, checkpoint, api, not args.quiet
+    )
+    seconds = result["seconds"]
+    print(
+        "{} rows in {} shard(s) in {:.1f}s ({:.0f} rows/s), {} shard(s) already done".format(
+            result["rows"],
+            result["shards"],
+            seconds,
+            result["rows"] / seconds if seconds else 0,
+            result["skipped"],
+        ),
+        file=sys.stderr,
+    )
+    for name, error in sorted(result["failed"].items()):
+        print("failed {}: {!r}".format(name, error), file=sys.stderr)
+    return 1 if result["failed"] else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="pyzaim", description="command-line tools of pyzaim")
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    p = commands.add_parser(
+        "export",
+        help="export the money records to files, resuming an interrupted export",
+        description="export the money records shard by shard. The API credentials are read from "
+                    "ZAIM_CONSUMER_ID, ZAIM_CONSUMER_SECRET, ZAIM_ACCESS_TOKEN, ZAIM_ACCESS_TOKEN_SECRET "
+                    "and ZAIM_OAUTH_VERIFIER, and the login of the crawler from ZAIM_USER_ID and "
+                    "ZAIM_PASSWORD.",
+    )
+    p.add_argument("--source", choices=EXPORT_SOURCES, default="api",
+                   help="fetch the records with ZaimAPI or ZaimCrawler (default: api)")
+    p.add_argument("--start", type=_date, required=True, help="first date (YYYY-MM-DD)")
+    p.add_argument("--end", type=_date,
+                   help="last date (YYYY-MM-DD, default: today, or that of the export resumed)")
+    p.add_argument("--shard", choices=EXPORT_SHARDS, default="month",
+                   help="period of each shard (default: month)")
+    p.add_argument("--format", choices=EXPORT_FORMATS, default="jsonl",
+                   help="format of the files (default: jsonl; parquet requires pyzaim[columnar])")
+    p.add_argument("--output", default="zaim-export", help="directory of the files")
+    p.add_argument("--checkpoint", help="checkpoint file (default: OUTPUT/{})".format(CHECKPOINT_NAME))
+    p.add_argument("--restart", action="store_true", help="ignore the checkpoint and export everything")
+    p.add_argument("--workers", type=int, default=4,
+                   help="shards fetched at a time (number of browsers for the crawler)")
+    p.add_argument("--quiet", action="store_true", help="do not show the progress bar")
+    api_options = p.add_argument_group("api")
+    api_options.add_argument("--page-size", type=int, default=100, help="records per request (at most 100)")
+    api_options.add_argument("--rate", type=float, help="maximum requests per second")
+    api_options.add_argument("--id-table-cache", help="directory of the ID table cache")
+    api_options.add_argument("--base-url", default=ZAIM_API_BASE_URL, help="base URL of the API")
+    crawler_options = p.add_argument_group("crawler")
+    crawler_options.add_argument("--driver-path", help="path of Chrome Driver")
+    crawler_options.add_argument("--headless", action="store_true", help="run Chrome headless")
+    crawler_options.add_argument("--extraction", choices=EXPORT_EXTRACTIONS, default="script",
+                                 help="way to read the rows: script, html or webdriver (default: script)")
+    crawler_options.add_argument("--cookie-path", help="file of the saved login session")
+    p.set_defaults(func=export)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
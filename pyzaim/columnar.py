@@ -0,0 +1,251 @@
+import datetime
+from array import array
+
+EPOCH_ORDINAL: int = datetime.date(1970, 1, 1).toordinal()
+
+# Default number of rows per Parquet row group
+PARQUET_BATCH_SIZE: int = 65536
+
+MODES = ("payment", "income", "transfer")
+NAME_FIELDS = ("category", "genre", "from_account", "to_account")
+TEXT_FIELDS = ("name", "place", "comment")
+
+
+class _Dictionary:
+    """names of a dictionary-encoded column and their codes.
+    """
+
+    def __init__(self, itos=None, stoi=None):
+        self.names = []
+        self._codes = {}
+        self._itos = itos or {}
+        self._stoi = stoi or {}
+        self._id_codes = {}
+
+    def code_for_name(self, name):
+        if name is None or name == "":
+            return -1
+        code = self._codes.get(name)
+        if code is None:
+            code = self._codes[name] = len(self.names)
+            self.names.append(name)
+        return code
+
+    def code_for_id(self, data_id):
+        code = self._id_codes.get(data_id)
+        if code is None:
+            if not data_id:
+                code = -1
+            else:
+                code = self.code_for_name(self._itos.get(data_id, str(data_id)))
+            self._id_codes[data_id] = code
+        return code
+
+    def id_for_name(self, name):
+        return self._stoi.get(name, -1)
+
+
+class ColumnBuilder:
+    """accumulate money records into typed columns.
+
+    Both the API records and the crawler items are accepted, and the category, genre and
+    account names are dictionary-encoded. NumPy, pandas and pyarrow are imported only
+    when the corresponding conversion is used.
+
+    Parameters
+    ==========
+    api : ZaimAPI
+        client whose ID tables ('*_itos' and '*_stoi') are used to map the IDs
+        of the API records to the names, and the names of the crawler items to the IDs.
+        If None, the names of the API records are their IDs and the IDs of the crawler items are -1.
+    """
+
+    def __init__(self, api=None):
+        tables = {}
+        if api is not None:
+            tables = {
+                "category": (api.category_itos, api.category_stoi),
+                "genre": (api.genre_itos, api.genre_stoi),
+                "from_account": (api.account_itos, api.account_stoi),
+                "to_account": (api.account_itos, api.account_stoi),
+            }
+        self.dictionaries = {
+            field: _Dictionary(*tables.get(field, (None, None))) for field in NAME_FIELDS
+        }
+        self.mode_dictionary = _Dictionary()
+        for mode in MODES:
+            self.mode_dictionary.code_for_name(mode)
+        self.clear()
+
+    def __len__(self):
+        return len(self.id)
+
+    def clear(self):
+        self.id = array("q")
+        self.date = array("i")
+        self.amount = array("q")
+        self.mode = array("b")
+        self.codes = {field: array("i") for field in NAME_FIELDS}
+        self.ids = {field: array("q") for field in NAME_FIELDS}
+        self.texts = {field: [] for field in TEXT_FIELDS}
+
+    def append(self, record):
+        """append an API record or a crawler item.
+        """
+        self.id.append(int(record["id"]))
+        date = record["date"]
+        if isinstance(date, str):
+            date = datetime.datetime.strptime(date[:10], "%Y-%m-%d")
+        self.date.append(date.toordinal() - EPOCH_ORDINAL)
+        self.amount.append(int(record["amount"]))
+        mode = record.get("mode", record.get("type"))
+        self.mode.append(self.mode_dictionary.code_for_name(mode))
+        for field in NAME_FIELDS:
+            dictionary = self.dictionaries[field]
+            id_key = field + "_id"
+            if id_key in record:
+                data_id = record[id_key] or 0
+                self.ids[field].append(data_id)
+                self.codes[field].append(dictionary.code_for_id(data_id))
+            else:
+                name = record.get(field)
+                self.ids[field].append(dictionary.id_for_name(name))
+                self.codes[field].append(dictionary.code_for_name(name))
+        for field in TEXT_FIELDS:
+            self.texts[field].append(record.get(field))
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+        return self
+
+    def to_numpy(self):
+        """return the columns as NumPy arrays.
+
+        Returns
+        =======
+        dict
+            'id', 'amount' and '<field>_id' are int64, 'date' is datetime64[D],
+            'mode_code' and '<field>_code' are the codes of the dictionaries in 'dictionaries'
+            (-1 for missing), and the texts are object arrays.
+        """
+        import numpy as np
+
+        columns = {
+            "id": np.frombuffer(self.id, dtype=np.int64).copy(),
+            "date": np.frombuffer(self.date, dtype=np.int32).astype("datetime64[D]"),
+            "amount": np.frombuffer(self.amount, dtype=np.int64).copy(),
+            "mode_code": np.frombuffer(self.mode, dtype=np.int8).copy(),
+        }
+        for field in NAME_FIELDS:
+            columns[field + "_id"] = np.frombuffer(self.ids[field], dtype=np.int64).copy()
+            columns[field + "_code"] = np.frombuffer(self.codes[field], dtype=np.int32).copy()
+        for field in TEXT_FIELDS:
+            columns[field] = np.array(self.texts[field], dtype=object)
+        columns["dictionaries"] = self.dictionary_names()
+        return columns
+
+    def dictionary_names(self):
+        names = {field: list(d.names) for field, d in self.dictionaries.items()}
+        names["mode"] = list(self.mode_dictionary.names)
+        return names
+
+    def to_pandas(self):
+        """return a pandas DataFrame whose name columns are categoricals.
+        """
+        import pandas as pd
+
+        columns = self.to_numpy()
+        names = columns.pop("dictionaries")
+        frame = {
+            "id": columns["id"],
+            "date": columns["date"],
+            "mode": pd.Categorical.from_codes(columns.pop("mode_code"), names["mode"]),
+            "amount": columns["amount"],
+        }
+        for field in NAME_FIELDS:
+            frame[field + "_id"] = columns[field + "_id"]
+            frame[field] = pd.Categorical.from_codes(columns[field + "_code"], names[field])
+        for field in TEXT_FIELDS:
+            frame[field] = columns[field]
+        return pd.DataFrame(frame)
+
+    def to_arrow(self):
+        """return a pyarrow Table whose name columns are dictionary arrays.
+        """
+        import pyarrow as pa
+
+        columns = self.to_numpy()
+        names = columns.pop("dictionaries")
+
+        def dictionary(codes, field):
+            return pa.DictionaryArray.from_arrays(
+                pa.array(codes, mask=codes < 0), pa.array(names[field], type=pa.string())
+            )
+
+        arrays = {
+            "id": pa.array(columns["id"]),
+            "date": pa.array(columns["date"]),
+            "mode": dictionary(columns["mode_code"].astype("int32"), "mode"),
+            "amount": pa.array(columns["amount"]),
+        }
+        for field in NAME_FIELDS:
+            arrays[field + "_id"] = pa.array(columns[field + "_id"])
+            arrays[field] = dictionary(columns[field + "_code"], field)
+        for field in TEXT_FIELDS:
+            arrays[field] = pa.array(self.texts[field], type=pa.string())
+        return pa.table(arrays)
+
+
+def to_columns(records, api=None):
+    """convert the records to a dict of NumPy arrays. See ColumnBuilder.to_numpy.
+    """
+    return ColumnBuilder(api).extend(records).to_numpy()
+
+
+def to_pandas(records, api=None):
+    return ColumnBuilder(api).extend(records).to_pandas()
+
+
+def to_arrow(records, api=None):
+    return ColumnBuilder(api).extend(records).to_arrow()
+
+
+def write_parquet(records, path, api=None, batch_size=PARQUET_BATCH_SIZE):
+    """write the records to a Parquet file batch by batch.
+
+    At most batch_size records are held in memory, so that the records can be streamed
+    from ZaimAPI.iter_money or ZaimCrawler.iter_data.
+
+    Returns
+    =======
+    int
+        number of the written records.
+    """
+    import pyarrow.parquet as pq
+
+    builder = ColumnBuilder(api)
+    writer = None
+    count = 0
+    try:
+        for record in records:
+            builder.append(record)
+            if len(builder) >= batch_size:
+                writer = _write_batch(builder, path, writer, pq)
+                count += len(builder)
+                builder.clear()
+        if len(builder) or writer is None:
+            writer = _write_batch(builder, path, writer, pq)
+            count += len(builder)
+    finally:
+        if writer is not None:
+            writer.close()
+    return count
+
+
+def _write_batch(builder, path, writer, pq):
+    table = builder.to_arrow()
+    if writer is None:
+        writer = pq.ParquetWriter(path, table.schema)
+    writer.write_table(table)
+    return writer
@@ -0,0 +1,639 @@
+import os
+import datetime
+import json
+import time
+import calendar
+import queue
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from selenium.common.exceptions import TimeoutException, WebDriverException
+
+from .instrumentation import Metrics
+from .records import from_crawler
+
+# XPaths of the result list of the money page
+ZAIM_RESULT_LIST_XPATH: str = "//*[starts-with(@class, 'SearchResult-module__list___')]"
+ZAIM_RESULT_ROW_XPATH: str = "//*[starts-with(@class, 'SearchResult-module__body___')]"
+
+# Extract all the rows of the result list in one round trip.
+# Each cell is read in the same way as the WebDriver calls of ZaimCrawler._read_rows.
+ZAIM_EXTRACT_ROWS_SCRIPT: str = """
+function attr(cell, tag, name) {
+    var e = cell.getElementsByTagName(tag)[0];
+    return e ? e.getAttribute(name) : null;
+}
+function text(cell, index) {
+    var e = cell.getElementsByTagName("span")[index || 0];
+    return e ? e.innerText.trim() : null;
+}
+var lines = document.querySelectorAll("[class^='SearchResult-module__body___']");
+return Array.prototype.map.call(lines, function (line) {
+    var items = line.getElementsByTagName("div");
+    return {
+        data_url: attr(items[0], "i", "data-url"),
+        count: attr(items[1], "i", "title"),
+        date: items[2].innerText.trim(),
+        category: attr(items[3], "span", "data-title"),
+        genre: text(items[3], 1),
+        amount: text(items[4]),
+        from_account: attr(items[5], "img", "data-title"),
+        to_account: attr(items[6], "img", "data-title"),
+        place: text(items[7]),
+        name: text(items[8]),
+        comment: text(items[9])
+    };
+});
+"""
+
+# Scroll the last row into view
+ZAIM_SCROLL_SCRIPT: str = """
+var lines = document.querySelectorAll("[class^='SearchResult-module__body___']");
+if (lines.length > 0) {
+    lines[lines.length - 1].scrollIntoView(true);
+}
+"""
+
+# Return the ID URLs of the first and the last rows
+ZAIM_ROW_BOUNDS_SCRIPT: str = """
+function url(line) {
+    return line.getElementsByTagName("div")[0].getElementsByTagName("i")[0].getAttribute("data-url");
+}
+var lines = document.querySelectorAll("[class^='SearchResult-module__body___']");
+if (lines.length == 0) {
+    return [null, null];
+}
+return [url(lines[0]), url(lines[lines.length - 1])];
+"""
+
+# Ways to extract the rows of the result list
+CRAWLER_EXTRACTIONS = ("script", "html", "webdriver")
+
+
+def _parse_row(row, year):
+    """convert the raw strings of a row of the result list to an item.
+    """
+    item = {}
+    item["id"] = row["data_url"].split("/")[2]
+    item["count"] = row["count"].split("（")[0]
+    date = row["date"].split("（")[0]
+    item["date"] = datetime.datetime.strptime(
+        "{}年{}".format(year, date), "%Y年%m月%d日"
+    )
+    item["category"] = row["category"]
+    item["genre"] = row["genre"]
+    item["amount"] = int(row["amount"].strip("¥").replace(",", ""))
+    if row["from_account"] is not None:
+        item["from_account"] = row["from_account"]
+    if row["to_account"] is not None:
+        item["to_account"] = row["to_account"]
+    item["type"] = (
+        "transfer" if "from_account" in item and "to_account" in item else "payment" if "from_account" in item else "income" if "to_account" in item else None
+    )
+    item["place"] = row["place"]
+    item["name"] = row["name"]
+    item["comment"] = row["comment"]
+    return item
+
+
+def _parse_rows_html(source):
+    """read the rows of the result list from the page source with lxml.
+    """
+    try:
+        from lxml import html
+    except ImportError as e:
+        raise ImportError(
+            "lxml is required for the 'html' extraction: pip install lxml"
+        ) from e
+
+    def attr(cell, tag, name):
+        found = cell.xpath(".//{}".format(tag))
+        return found[0].get(name) if found else None
+
+    def text(cell, index=0):
+        found = cell.xpath(".//span")
+        return found[index].text_content().strip() if len(found) > index else None
+
+    rows = []
+    for line in html.fromstring(source).xpath(ZAIM_RESULT_ROW_XPATH):
+        items = line.xpath(".//div")
+        rows.append({
+            "data_url": attr(items[0], "i", "data-url"),
+            "count": attr(items[1], "i", "title"),
+            "date": items[2].text_content().strip(),
+            "category": attr(items[3], "span", "data-title"),
+            "genre": text(items[3], 1),
+            "amount": text(items[4]),
+            "from_account": attr(items[5], "img", "data-title"),
+            "to_account": attr(items[6], "img", "data-title"),
+            "place": text(items[7]),
+            "name": text(items[8]),
+            "comment": text(items[9]),
+        })
+    return rows
+
+
+def _wait_until(condition, timeout, interval=0.05, max_interval=0.5):
+    """call the condition with exponentially growing intervals until it returns a truthy value.
+
+    WebDriver errors raised by the condition (e.g. the element is not found yet) are
+    regarded as False. TimeoutException is raised if the timeout expires.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            value = condition()
+        except WebDriverException:
+            value = None
+        if value:
+            return value
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutException("condition not met in {} seconds".format(timeout))
+        time.sleep(min(interval, remaining))
+        interval = min(interval * 2, max_interval)
+
+
+def _month_range(start, end):
+    """list the (year, month) from start to end (both inclusive).
+    """
+    if isinstance(start, datetime.date):
+        start = (start.year, start.month)
+    if isinstance(end, datetime.date):
+        end = (end.year, end.month)
+    months = []
+    year, month = start
+    while (year, month) <= tuple(end):
+        months.append((year, month))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def _quit_driver(crawler):
+    if crawler.driver is None:
+        return
+    try:
+        crawler.driver.quit()
+    except Exception:
+        pass
+
+
+class ZaimCrawler:
+    def __init__(self, user_id, password, driver_path=None, headless=False, poor=False, gcf=False,
+                 extraction="script", timeout=10.0, scroll_timeout=2.0, cookie_path=None,
+                 driver_factory=None, scroll_quiet=1.0):
+        # extraction: 一覧の行の読み込み方法
+        #   "script": execute_scriptで表示中の全行を1回のやりとりで取得する
+        #   "html": page_sourceをlxmlで解析する
+        #   "webdriver": 1セルずつWebDriverで取得する (従来の方法)
+        # timeout: ログインフォームや一覧の表示を待つ時間の上限 (秒)
+        # scroll_timeout: スクロール後に新しい行が読み込まれるのを待つ時間の上限 (秒)
+        # scroll_quiet: スクロール後に表示中の行が変わらないまま経過したら一覧の最後とみなす時間 (秒)
+        # cookie_path: ログイン後のCookieを保存するファイル。有効なセッションが保存されていればログインを省略する
+        # driver_factory: WebDriverを返す関数。指定した場合はChrome Driverの代わりに使用する (ベンチマーク用の偽のドライバーなど)
+        if extraction not in CRAWLER_EXTRACTIONS:
+            raise ValueError("unknown extraction: {}".format(extraction))
+        self.extraction = extraction
+        self.timeout = timeout
+        self.scroll_timeout = scroll_timeout
+        self.scroll_quiet = scroll_quiet
+        self.cookie_path = cookie_path
+        self._metrics = Metrics()
+        self._user_id = user_id
+        self._password = password
+        self._driver_factory = driver_factory
+        self._driver_options = {
+            "driver_path": driver_path, "headless": headless, "poor": poor, "gcf": gcf
+        }
+
+        with self._metrics.phase("start_driver"):
+            self.driver = self._new_driver()
+        print("Start Chrome Driver.")
+        with self._metrics.phase("login"):
+            if not self._restore_session():
+                self._login()
+                self._save_session()
+        self.data = []
+        self._data_ids = set()
+        self.current = 0
+
+    def get_data(self, year, month, progress=True, records=False):
+        # records: Trueの場合はdictの代わりにPayment/Income/Transferを返す (メモリ使用量が少ない)
+        for item in self._iter_month(year, month, progress, self._data_ids, records):
+            self.data.append(item)
+        return reversed(self.data)
+
+    def iter_data(self, year, month, progress=True, records=False):
+        """yield the items of the month as they are parsed.
+
+        Unlike get_data, the items are not accumulated in self.data,
+        so that crawling many months runs in constant memory.
+        The items are yielded in the order of the page (from the newest).
+        If records is True, Payment/Income/Transfer objects are yielded instead of dicts.
+        """
+        return self._iter_month(year, month, progress, set(), records)
+
+    def get_range(self, start, end, workers=1, retries=2, progress=True, records=False):
+        """crawl the months from start to end with a pool of logged-in drivers.
+
+        This crawler itself is one of the workers and the others are started with the same options.
+        A month which fails is retried on a fresh driver.
+
+        Parameters
+        ==========
+        start, end : tuple of int or datetime.date
+            first and last months (both inclusive) as (year, month) or a date.
+        workers : int
+            number of drivers crawling in parallel.
+        retries : int
+            number of retries of each month.
+        progress : bool
+            if True, a progress bar of the months is shown.
+        records : bool
+            if True, Payment/Income/Transfer objects are returned instead of dicts.
+
+        Returns
+        =======
+        list of dict or MoneyRecord
+            items of all the months in date order.
+        """
+        months = _month_range(start, end)
+        tasks = queue.Queue()
+        for index, month in enumerate(months):
+            tasks.put((index, month))
+        results = [None] * len(months)
+        errors = {}
+        if progress:
+            from tqdm import tqdm
+
+        pbar = tqdm(total=len(months)) if progress else None
+        spawned = []
+        lock = threading.Lock()
+
+        def work(crawler):
+            while True:
+                try:
+                    index, (year, month) = tasks.get_nowait()
+                except queue.Empty:
+                    return
+                for _ in range(retries + 1):
+                    try:
+                        if crawler is None:
+                            crawler = self._spawn()
+                            with lock:
+                                spawned.append(crawler)
+                        items = list(crawler.iter_data(year, month, False, records))
+                    except Exception as e:
+                        errors[index] = e
+                        # 失敗したドライバーは破棄して、新しいドライバーで再試行する
+                        if crawler is self:
+                            try:
+                                self._restart_driver()
+                            except Exception as restart_error:
+                                errors[index] = restart_error
+                                crawler = None
+                        else:
+                            _quit_driver(crawler)
+                            crawler = None
+                    else:
+                        errors.pop(index, None)
+                        results[index] = items[::-1]
+                        break
+                if pbar is not None:
+                    with lock:
+                        pbar.update(1)
+
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(work, self)]
+                futures += [executor.submit(work, None) for _ in range(workers - 1)]
+                for future in futures:
+                    future.result()
+        finally:
+            for crawler in spawned:
+                self._metrics.merge(crawler._metrics)
+                _quit_driver(crawler)
+            if pbar is not None:
+                pbar.close()
+
+        if errors:
+            index = min(errors)
+            raise RuntimeError(
+                "failed to crawl {} month(s) from {}/{}".format(len(errors), *months[index])
+            ) from errors[index]
+        return [item for items in results for item in items]
+
+    def stats(self):
+        """return the durations of the crawler phases.
+
+        Returns
+        =======
+        dict
+            'phases' maps 'start_driver', 'login', 'navigation' (opening a month and waiting
+            for the list), 'parse' (reading the rows of a screen) and 'scroll' (waiting for
+            the next rows) to their histograms. The phases of the workers of get_range are included.
+        """
+        return self._metrics.snapshot()
+
+    def close(self):
+        # ドライバーの再起動に失敗した後は終了するブラウザがない
+        if self.driver is None:
+            return
+        # セッションの保存に失敗してもブラウザは終了する (close()はウィンドウを閉じるだけ)
+        try:
+            self._save_session()
+        finally:
+            self.driver.quit()
+
+    def crawler(self, year, progress):
+        items, loop = self._crawl_page(year, self._data_ids)
+        for item in items:
+            self.data.append(item)
+            if progress:
+                self._update_progress(item)
+        return loop
+
+    def _iter_month(self, year, month, progress, seen, records=False):
+        day_len = calendar.monthrange(int(year), int(month))[1]
+        year = str(year)
+        month = str(month).zfill(2)
+        print("Get Data of {}/{}.".format(year, month))
+        if self.driver is None:
+            # 前回の再起動に失敗したドライバーを起動し直す
+            self._start_session()
+        with self._metrics.phase("navigation"):
+            self.driver.get(
+                "https://zaim.net/money?month={}{}".format(year, month))
+            _wait_until(
+                lambda: self.driver.find_elements_by_xpath(ZAIM_RESULT_LIST_XPATH), self.timeout)
+
+        # プログレスバーのゴールを対象月の日数にする
+        print("Found {} days in {}/{}.".format(day_len, year, month))
+        self.current = day_len
+        if progress:
+            from tqdm import tqdm
+
+            self.pbar = tqdm(total=day_len)
+
+        # データが一画面に収まらない場合には、スクロールして繰り返し読み込みする
+        try:
+            loop = True
+            while loop:
+                items, loop = self._crawl_page(year, seen)
+                for item in items:
+                    if progress:
+                        self._update_progress(item)
+                    yield from_crawler(item) if records else item
+        finally:
+            if progress:
+                self.pbar.update(self.current)
+                self.pbar.close()
+
+    def _update_progress(self, item):
+        tmp_day = item["date"].day
+        self.pbar.update(self.current - tmp_day)
+        self.current = tmp_day
+
+    def _crawl_page(self, year, seen):
+        with self._metrics.phase("parse"):
+            items, lines, current_id, last_id = self._parse_page(year, seen)
+
+        if current_id is None:
+            return items, False
+
+        # 画面をスクロールして、新しい行が読み込まれた場合はループを繰り返す
+        with self._metrics.phase("scroll"):
+            if lines is not None:
+                self.driver.execute_script(
+                    "arguments[0].scrollIntoView(true);", lines[len(lines)-1])
+            else:
+                self.driver.execute_script(ZAIM_SCROLL_SCRIPT)
+            bounds = (current_id, last_id)
+            # 先頭と末尾の行がscroll_quietの間変わらなければ、一覧の最後まで読み込んだとみなす
+            try:
+                _wait_until(
+                    lambda: self._row_bounds() != bounds,
+                    min(self.scroll_quiet, self.scroll_timeout),
+                )
+            except TimeoutException:
+                return items, False
+        return items, True
+
+    def _parse_page(self, year, seen):
+        if self.extraction == "script":
+            lines = None
+            rows = self.driver.execute_script(ZAIM_EXTRACT_ROWS_SCRIPT)
+        elif self.extraction == "html":
+            lines = None
+            rows = _parse_rows_html(self.driver.page_source)
+        else:
+            table = self.driver.find_element_by_xpath(ZAIM_RESULT_LIST_XPATH)
+            lines = table.find_elements_by_xpath(ZAIM_RESULT_ROW_XPATH)
+            rows = self._read_rows(lines, seen)
+
+        items = []
+        current_id = last_id = None
+        for row in rows:
+            if current_id is None:
+                current_id = row["data_url"]
+            last_id = row["data_url"]
+            # 前ループの読み込み内容と重複がある場合はスキップする
+            data_id = row["data_url"].split("/")[2]
+            if data_id in seen:
+                continue
+            seen.add(data_id)
+            items.append(_parse_row(row, year))
+        return items, lines, current_id, last_id
+
+    def _row_bounds(self):
+        if self.extraction != "webdriver":
+            return tuple(self.driver.execute_script(ZAIM_ROW_BOUNDS_SCRIPT))
+        lines = self.driver.find_elements_by_xpath(ZAIM_RESULT_ROW_XPATH)
+        if not lines:
+            return (None, None)
+        return tuple(
+            line.find_element_by_tag_name("div").find_element_by_tag_name("i").get_attribute("data-url")
+            for line in (lines[0], lines[-1])
+        )
+
+    def _read_rows(self, lines, seen):
+        # 1セルずつWebDriverで読み込む (重複する行は残りのセルを読まない)
+        for line in lines:
+            items = line.find_elements_by_tag_name("div")
+            row = {
+                "data_url": items[0].find_element_by_tag_name("i").get_attribute("data-url")
+            }
+            if row["data_url"].split("/")[2] in seen:
+                yield row
+                continue
+
+            row["count"] = items[1].find_element_by_tag_name("i").get_attribute("title")
+            row["date"] = items[2].text
+            row["category"] = (
+                items[3].find_element_by_tag_name(
+                    "span").get_attribute("data-title")
+            )
+            row["genre"] = items[3].find_elements_by_tag_name("span")[1].text
+            row["amount"] = items[4].find_element_by_tag_name("span").text
+            m_from = items[5].find_elements_by_tag_name("img")
+            row["from_account"] = m_from[0].get_attribute("data-title") if len(m_from) != 0 else None
+            m_to = items[6].find_elements_by_tag_name("img")
+            row["to_account"] = m_to[0].get_attribute("data-title") if len(m_to) != 0 else None
+            row["place"] = items[7].find_element_by_tag_name("span").text
+            row["name"] = items[8].find_element_by_tag_name("span").text
+            row["comment"] = items[9].find_element_by_tag_name("span").text
+            yield row
+
+    def _new_driver(self):
+        if self._driver_factory is not None:
+            return self._driver_factory()
+        return self._start_driver(**self._driver_options)
+
+    def _start_driver(self, driver_path=None, headless=False, poor=False, gcf=False):
+        # selenium.webdriver is imported here because it takes long to import
+        from selenium.webdriver import Chrome, ChromeOptions, Remote
+
+        options = ChromeOptions()
+
+        if gcf:
+            options.add_argument('--headless')
+            options.add_argument('--disable-gpu')
+            options.add_argument('--window-size=480x270')
+            options.add_argument('--no-sandbox')
+            options.add_argument('--hide-scrollbars')
+            options.add_argument('--enable-logging')
+            options.add_argument('--log-level=0')
+            options.add_argument('--v=99')
+            options.add_argument('--single-process')
+            options.add_argument('--ignore-certificate-errors')
+
+            options.binary_location = os.getcwd() + "/headless-chromium"
+            driver = Chrome(
+                os.getcwd() + "/chromedriver", options=options)
+        else:
+            if poor:
+                options.add_argument("--disable-gpu")
+                options.add_argument("--no-sandbox")
+                options.add_argument("--disable-dev-shm-usage")
+                options.add_argument("--remote-debugging-port=9222")
+                options.add_argument("--headless")
+            if headless:
+                options.add_argument("--headless")
+            if driver_path == 'remote':  # リモート接続も可能（docker-seleniumの利用を想定）
+                driver = Remote(
+                    command_executor='http://localhost:4444/wd/hub',
+                    desired_capabilities=options.to_capabilities(),
+                    options=options,
+                )
+            elif driver_path is not None:
+                driver = Chrome(
+                    executable_path=driver_path, options=options)
+            else:
+                driver = Chrome(options=options)
+            if poor:
+                driver.set_window_size(480, 270)
+        return driver
+
+    def _login(self):
+        from selenium.webdriver.common.keys import Keys
+
+        print("Login to Zaim.")
+
+        self.driver.get("https://auth.zaim.net/")
+        email = _wait_until(lambda: self.driver.find_elements_by_id("UserEmail"), self.timeout)
+
+        email[0].send_keys(self._user_id)
+        self.driver.find_element_by_id(
+            "UserPassword").send_keys(self._password, Keys.ENTER)
+        # ログインフォームが消えるまで待つ
+        try:
+            _wait_until(
+                lambda: not self.driver.find_elements_by_id("UserPassword"), self.timeout)
+        except TimeoutException as e:
+            raise TimeoutException("Login failed.") from e
+        print("Login Success.")
+
+    def _spawn(self):
+        return ZaimCrawler(
+            self._user_id,
+            self._password,
+            extraction=self.extraction,
+            timeout=self.timeout,
+            scroll_timeout=self.scroll_timeout,
+            scroll_quiet=self.scroll_quiet,
+            cookie_path=self.cookie_path,
+            driver_factory=self._driver_factory,
+            **self._driver_options
+        )
+
+    def _restart_driver(self):
+        _quit_driver(self)
+        self.driver = None
+        self._start_session()
+
+    def _start_session(self):
+        # 起動やログインに失敗した場合はドライバーを終了してself.driverをNoneに戻す
+        with self._metrics.phase("start_driver"):
+            self.driver = self._new_driver()
+        try:
+            with self._metrics.phase("login"):
+                if not self._restore_session():
+                    self._login()
+                    self._save_session()
+        except BaseException:
+            _quit_driver(self)
+            self.driver = None
+            raise
+
+    def _restore_session(self):
+        if self.cookie_path is None:
+            return False
+        try:
+            with open(self.cookie_path, encoding="utf-8") as f:
+                cookies = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        print("Restore the session of Zaim.")
+        # Cookieは表示中のドメインにしか追加できないため、先にzaim.netを開く
+        self.driver.get("https://zaim.net/")
+        for cookie in cookies:
+            try:
+                self.driver.add_cookie(cookie)
+            except WebDriverException:
+                pass
+
+        # 一覧ページが表示されればセッションは有効、ログインページに戻されれば無効
+        def check():
+            if self.driver.find_elements_by_xpath(ZAIM_RESULT_LIST_XPATH):
+                return "valid"
+            if "auth.zaim.net" in self.driver.current_url or self.driver.find_elements_by_id("UserPassword"):
+                return "expired"
+            return None
+
+        self.driver.get("https://zaim.net/money")
+        try:
+            state = _wait_until(check, self.timeout)
+        except TimeoutException:
+            state = "expired"
+        if state != "valid":
+            print("The saved session has expired.")
+            return False
+        print("Login Success.")
+        return True
+
+    def _save_session(self):
+        if self.cookie_path is None:
+            return
+        cookies = self.driver.get_cookies()
+        directory = os.path.dirname(os.path.abspath(self.cookie_path))
+        # Cookieはログイン情報に相当するため、本人のみ読み書きできるファイルに書き込む
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(cookies, f)
+            os.replace(tmp, self.cookie_path)
+        except BaseException:
+            os.remove(tmp)
+            raise
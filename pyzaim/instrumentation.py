@@ -0,0 +1,224 @@
+import contextlib
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+# Upper bounds of the latency histogram buckets in seconds
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, float("inf")
+)
+
+_ID_SEGMENT = re.compile(r"/\d+(?=/|$)")
+
+
+def endpoint_of(method, url):
+    """return the endpoint of the request with the numeric IDs replaced by '{id}'.
+    """
+    return "{} {}".format(method.upper(), _ID_SEGMENT.sub("/{id}", urlsplit(url).path))
+
+
+class Histogram:
+    """cumulative histogram of durations in seconds.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        for i, n in enumerate(other.counts):
+            self.counts[i] += n
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def percentile(self, q):
+        """return the upper bound of the bucket containing the q-th percentile.
+        """
+        if self.count == 0:
+            return None
+        rank = q / 100 * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else None,
+            "max": self.max,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "buckets": dict(zip(self.buckets, self.counts)),
+        }
+
+
+class _EndpointStats:
+    def __init__(self):
+        self.count = 0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.statuses = {}
+        self.errors = {}
+        self.latency = Histogram()
+
+    def merge(self, other):
+        self.count += other.count
+        self.request_bytes += other.request_bytes
+        self.response_bytes += other.response_bytes
+        for key, n in other.statuses.items():
+            self.statuses[key] = self.statuses.get(key, 0) + n
+        for key, n in other.errors.items():
+            self.errors[key] = self.errors.get(key, 0) + n
+        self.latency.merge(other.latency)
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "request_bytes": self.request_bytes,
+            "response_bytes": self.response_bytes,
+            "statuses": dict(self.statuses),
+            "errors": dict(self.errors),
+            "latency": self.latency.snapshot(),
+        }
+
+
+class Metrics:
+    """per-endpoint request statistics, phase timings and request hooks.
+
+    The pre-request hooks are called as hook(method, url, kwargs) before every attempt,
+    and the post-request hooks as hook(event) after it, where event is a dict with
+    'method', 'url', 'endpoint', 'status', 'error', 'elapsed', 'request_bytes',
+    'response_bytes' and 'attempt'. They can be used to export the metrics to
+    Prometheus or OpenTelemetry.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._phases = {}
+        self.pre_hooks = []
+        self.post_hooks = []
+
+    def add_hook(self, when, hook):
+        """register a hook called 'pre' or 'post' request.
+        """
+        if when == "pre":
+            self.pre_hooks.append(hook)
+        elif when == "post":
+            self.post_hooks.append(hook)
+        else:
+            raise ValueError("unknown hook: {}".format(when))
+
+    def before_request(self, method, url, kwargs):
+        for hook in self.pre_hooks:
+            hook(method, url, kwargs)
+
+    def after_request(self, method, url, response, error, elapsed, attempt):
+        """record an attempt of requests.Session.request.
+        """
+        status = None
+        request_bytes = response_bytes = 0
+        if response is not None:
+            status = response.status_code
+            body = response.request.body if response.request is not None else None
+            request_bytes = len(body) if body else 0
+            response_bytes = len(response.content or b"")
+        self.record_request(
+            method, url, status, error, elapsed, request_bytes, response_bytes, attempt
+        )
+
+    def record_request(
+        self, method, url, status, error, elapsed, request_bytes=0, response_bytes=0, attempt=1
+    ):
+        """record an attempt of any HTTP client and call the post-request hooks.
+        """
+        endpoint = endpoint_of(method, url)
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = self._endpoints[endpoint] = _EndpointStats()
+            stats.count += 1
+            stats.request_bytes += request_bytes
+            stats.response_bytes += response_bytes
+            stats.latency.observe(elapsed)
+            if status is not None:
+                stats.statuses[status] = stats.statuses.get(status, 0) + 1
+            if error is not None:
+                name = type(error).__name__
+                stats.errors[name] = stats.errors.get(name, 0) + 1
+        if self.post_hooks:
+            event = {
+                "method": method,
+                "url": url,
+                "endpoint": endpoint,
+                "status": status,
+                "error": error,
+                "elapsed": elapsed,
+                "request_bytes": request_bytes,
+                "response_bytes": response_bytes,
+                "attempt": attempt,
+            }
+            for hook in self.post_hooks:
+                hook(event)
+
+    def observe_phase(self, name, elapsed):
+        with self._lock:
+            histogram = self._phases.get(name)
+            if histogram is None:
+                histogram = self._phases[name] = Histogram()
+            histogram.observe(elapsed)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """measure the duration of the block as the phase.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_phase(name, time.perf_counter() - start)
+
+    def snapshot(self):
+        """return the statistics as a dict of 'requests' per endpoint and 'phases'.
+        """
+        with self._lock:
+            return {
+                "requests": {k: v.snapshot() for k, v in self._endpoints.items()},
+                "phases": {k: v.snapshot() for k, v in self._phases.items()},
+            }
+
+    def merge(self, other):
+        """add the statistics of another Metrics (e.g. of a worker) to this one.
+        """
+        with other._lock:
+            endpoints = list(other._endpoints.items())
+            phases = list(other._phases.items())
+        with self._lock:
+            for key, stats in endpoints:
+                self._endpoints.setdefault(key, _EndpointStats()).merge(stats)
+            for key, histogram in phases:
+                self._phases.setdefault(key, Histogram()).merge(histogram)
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+            self._phases.clear()
@@ -0,0 +1,628 @@
+import datetime
+import hashlib
+import inspect
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from .api import (
+    ZAIM_API_MONEY_URL,
+    ZaimAPI,
+    _income_data,
+    _payment_data,
+    _transfer_data,
+)
+from .cache import ResponseCache
+from .transport import RETRY_STATUS_CODES, RetryPolicy, TokenBucket
+
+SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS outbox (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL UNIQUE,
+    action TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    record TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL DEFAULT 0,
+    status_code INTEGER,
+    data_id INTEGER,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS outbox_state ON outbox (state, seq);
+CREATE INDEX IF NOT EXISTS outbox_data_id ON outbox (data_id);
+"""
+
+ACTIONS = ("insert", "update", "delete")
+MODES = ("payment", "income", "transfer")
+
+# States of the journal entries
+PENDING: str = "pending"
+INFLIGHT: str = "inflight"
+DONE: str = "done"
+FAILED: str = "failed"
+
+# Upper bound of the interval between the flushes of an entry failing with transient errors
+MAX_BACKOFF: float = 300.0
+
+# Seconds close() waits for the queued writes to be sent by default
+CLOSE_TIMEOUT: float = 30.0
+
+
+class Outbox:
+    """durable journal of the writes of a ZaimAPI flushed by a background worker.
+
+    The insert, update and delete methods of ZaimAPI are available with the same
+    arguments. They append the write to a SQLite journal and return its idempotency key
+    immediately; the worker sends the journaled writes in batches of concurrent requests.
+    Each write gets a new key unless one is given. An insert enqueued again with the key of
+    an entry is ignored, and with dedupe the key is the hash of the write, so that re-running
+    an import does not duplicate its records. An update or a delete is never ignored in
+    favour of an entry already sent or followed by other writes to the same data.
+
+    The API has no idempotency keys, so an insert whose outcome is unknown (the process
+    died while sending it, or the connection failed) is looked up among the records of its
+    date before it is sent again. Transient errors (429, 5xx and connection errors) keep
+    the entries in the journal with an exponential backoff for up to max_attempts attempts,
+    and the other errors mark them as failed. Only one Outbox should use a journal at a time.
+
+    Parameters
+    ==========
+    api : ZaimAPI
+        client sending the writes.
+    path : str
+        path of the SQLite journal.
+    batch_size : int
+        maximum number of entries sent per batch.
+    max_workers : int
+        number of threads sending a batch.
+    rate : float
+        maximum number of requests per second. If None, the requests are not throttled.
+    max_retries : int
+        maximum number of retries of a request within a batch.
+    backoff : float
+        base interval of the backoff in seconds.
+    interval : float
+        seconds the worker sleeps when there is nothing to send.
+    start : bool
+        if True, the worker is started immediately.
+    max_attempts : int
+        number of flushes of an entry failing with transient errors before it is marked as
+        failed. If None, the entry is kept until it is sent.
+    close_timeout : float
+        seconds close() waits for the queued writes to be sent. The writes left are sent
+        by the next Outbox of the journal.
+    dedupe : bool
+        if True, the writes enqueued without a key are keyed by their content.
+    """
+
+    def __init__(
+        self,
+        api,
+        path,
+        batch_size=50,
+        max_workers=8,
+        rate=None,
+        max_retries=3,
+        backoff=0.5,
+        interval=1.0,
+        start=True,
+        max_attempts=10,
+        close_timeout=CLOSE_TIMEOUT,
+        dedupe=False,
+    ):
+        self.api = api
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.backoff = backoff
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self.close_timeout = close_timeout
+        self.dedupe = dedupe
+        self.last_error = None
+        # POST is retried only after 429; an insert failing otherwise is looked up first
+        self._policy = RetryPolicy(max_retries, backoff)
+        self._limiter = TokenBucket(rate) if rate is not None else None
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        # the WAL keeps the committed entries across crashes of the process without a full sync
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._changed = threading.Condition()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._executor = None
+        if start:
+            self.start()
+
+    def start(self):
+        """start the background worker.
+        """
+        if self._thread is not None:
+            return
+        self.api._ensure_pool(self.max_workers)
+        self._stopped.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        self._thread = threading.Thread(target=self._run, name="pyzaim-outbox", daemon=True)
+        self._thread.start()
+
+    def stop(self, flush=True, timeout=None):
+        """stop the background worker, after sending the queued writes if flush is True.
+
+        Returns
+        =======
+        bool
+            False if writes were left in the journal because the timeout expired.
+        """
+        if self._thread is None:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        flushed = self.flush(timeout) if flush else True
+        self._stopped.set()
+        self._wake.set()
+        # a request in progress is not waited for beyond the timeout; its entry stays in
+        # flight in the journal and is resolved by the next worker
+        self._thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        self._executor.shutdown(wait=not self._thread.is_alive())
+        self._thread = None
+        self._executor = None
+        return flushed
+
+    def close(self, flush=True, timeout=None):
+        """stop the worker, waiting at most timeout seconds (close_timeout if None) for the
+        queued writes, and close the journal.
+        """
+        flushed = self.stop(flush, self.close_timeout if timeout is None else timeout)
+        with self._lock:
+            self._connection.close()
+        return flushed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def enqueue(self, action, record, key=None, dedupe=None):
+        """append a write to the journal.
+
+        Parameters
+        ==========
+        action : str
+            'insert', 'update' or 'delete'.
+        record : dict
+            record in the format of ZaimAPI.bulk_insert ('id' of the target data is
+            required to update or delete it).
+        key : str
+            idempotency key. If None, a new key is generated, or the hash of the action and
+            the record is used if dedupe is True.
+        dedupe : bool
+            if None, the dedupe of the outbox is used.
+
+        Returns
+        =======
+        str
+            idempotency key of the entry.
+        """
+        keys = None if key is None else [key]
+        return self.enqueue_many(action, [record], keys, dedupe)[0]
+
+    def enqueue_many(self, action, records, keys=None, dedupe=None):
+        """append the writes to the journal in one transaction and return their keys.
+        """
+        dedupe = self.dedupe if dedupe is None else dedupe
+        rows = []
+        for i, record in enumerate(records):
+            record = _normalize(action, record)
+            content = _encode(record)
+            if keys is not None:
+                key = keys[i]
+            elif dedupe:
+                key = _content_key(action, content)
+            else:
+                key = uuid.uuid4().hex
+            rows.append((key, action, record["mode"], content, record.get("data_id")))
+        now = time.time()
+        with self._lock, self._connection:
+            for key, action, mode, content, data_id in rows:
+                if action != "insert":
+                    self._release(key, mode, data_id)
+                self._connection.execute(
+                    "INSERT OR IGNORE INTO outbox "
+                    "(key, action, mode, record, data_id, created, updated) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, action, mode, content, data_id, now, now),
+                )
+        self._wake.set()
+        return [row[0] for row in rows]
+
+    def _release(self, key, mode, data_id):
+        """rename the entry of the key unless it is the last write waiting for the data.
+
+        An update or a delete repeating an entry already sent, or followed by other writes
+        (e.g. A -> B -> A), has to be sent again. The old entry keeps its state under the
+        key suffixed with its sequence number.
+        """
+        row = self._connection.execute(
+            "SELECT seq, state FROM outbox WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return
+        seq, state = row
+        if state in (PENDING, INFLIGHT) and self._connection.execute(
+            "SELECT 1 FROM outbox WHERE mode = ? AND data_id = ? AND seq > ?",
+            (mode, data_id, seq),
+        ).fetchone() is None:
+            return
+        self._connection.execute(
+            "UPDATE outbox SET key = key || ':' || seq WHERE seq = ?", (seq,)
+        )
+
+    def flush(self, timeout=None):
+        """wait until every queued write has been sent or has failed.
+
+        Returns
+        =======
+        bool
+            False if the timeout expired first.
+        """
+        if self._thread is None:
+            raise RuntimeError("the outbox worker is not running")
+        deadline = None if timeout is None else time.monotonic() + timeout
+        self._wake.set()
+        with self._changed:
+            while self._count(PENDING, INFLIGHT):
+                wait = self.interval
+                if deadline is not None:
+                    wait = min(wait, deadline - time.monotonic())
+                    if wait <= 0:
+                        return False
+                self._changed.wait(wait)
+        return True
+
+    def status(self, key):
+        """return the entry of the key as a dict, or None if it is not in the journal.
+
+        'data_id' of a sent insert is the ID of the created record.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT key, action, record, state, attempts, status_code, data_id, error "
+                "FROM outbox WHERE key = ?",
+                (key,),
+            ).fetchone()
+        return None if row is None else _entry(row)
+
+    def failed(self):
+        """return the entries which failed with non-transient errors or ran out of attempts.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT key, action, record, state, attempts, status_code, data_id, error "
+                "FROM outbox WHERE state = ? ORDER BY seq",
+                (FAILED,),
+            ).fetchall()
+        return [_entry(row) for row in rows]
+
+    def retry_failed(self):
+        """queue the failed entries again and return their number.
+        """
+        with self._lock, self._connection:
+            n = self._connection.execute(
+                "UPDATE outbox SET state = ?, next_attempt = 0, updated = ? WHERE state = ?",
+                (PENDING, time.time(), FAILED),
+            ).rowcount
+        self._wake.set()
+        return n
+
+    def purge(self, older_than=0.0):
+        """remove the sent entries older than the given seconds and return their number.
+
+        The keys of the removed entries can be enqueued again.
+        """
+        with self._lock, self._connection:
+            return self._connection.execute(
+                "DELETE FROM outbox WHERE state = ? AND updated <= ?",
+                (DONE, time.time() - older_than),
+            ).rowcount
+
+    def stats(self):
+        """return the number of the entries in each state and the last error of the worker.
+        """
+        with self._lock:
+            counts = dict(self._connection.execute(
+                "SELECT state, COUNT(*) FROM outbox GROUP BY state"
+            ).fetchall())
+        stats = {state: counts.get(state, 0) for state in (PENDING, INFLIGHT, DONE, FAILED)}
+        stats["last_error"] = None if self.last_error is None else repr(self.last_error)
+        return stats
+
+    def _count(self, *states):
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM outbox WHERE state IN ({})".format(
+                    ", ".join("?" * len(states))
+                ),
+                states,
+            ).fetchone()[0]
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                # the entries left in flight by a crash or a failed connection are resolved first
+                self._check_inflight()
+                sent = self._send_batch()
+            except Exception as e:
+                # e.g. the API is unreachable while looking up the inserts in flight
+                self.last_error = e
+                sent = False
+            with self._changed:
+                self._changed.notify_all()
+            if not sent:
+                self._wake.wait(self.interval)
+                self._wake.clear()
+
+    def _claim(self):
+        """mark the next batch as in flight and return (seq, action, record) of its entries.
+        """
+        now = time.time()
+        with self._lock, self._connection:
+            # the writes to the same data are sent one at a time in the order of the journal
+            rows = self._connection.execute(
+                "SELECT seq, action, record FROM outbox AS o "
+                "WHERE state = ? AND next_attempt <= ? AND (data_id IS NULL OR NOT EXISTS ("
+                "SELECT 1 FROM outbox AS p WHERE p.mode = o.mode AND p.data_id = o.data_id "
+                "AND p.seq < o.seq AND p.state IN (?, ?))) ORDER BY seq LIMIT ?",
+                (PENDING, now, PENDING, INFLIGHT, self.batch_size),
+            ).fetchall()
+            batch = [(seq, action, _decode(record)) for seq, action, record in rows]
+            self._connection.executemany(
+                "UPDATE outbox SET state = ?, attempts = attempts + 1, updated = ? WHERE seq = ?",
+                [(INFLIGHT, now, seq) for seq, _, _ in batch],
+            )
+        return batch
+
+    def _send_batch(self):
+        batch = self._claim()
+        if not batch:
+            return False
+
+        def send(entry):
+            seq, action, record = entry
+            return action, self.api._write(seq, action, record, self._policy, self._limiter)
+
+        results = list(self._executor.map(send, batch))
+        now = time.time()
+        with self._lock, self._connection:
+            for action, result in results:
+                self._connection.execute(
+                    "UPDATE outbox SET state = ?, next_attempt = ?, status_code = ?, "
+                    "data_id = COALESCE(?, data_id), error = ?, updated = ? WHERE seq = ?",
+                    self._outcome(action, result, now) + (now, result.index),
+                )
+        return True
+
+    def _outcome(self, action, result, now):
+        """return (state, next_attempt, status_code, data_id, error) of a sent entry.
+        """
+        if result.ok or (action == "delete" and result.status_code == 404):
+            data_id = None
+            if action == "insert" and isinstance(result.data, dict):
+                data_id = (result.data.get("money") or {}).get("id")
+            return DONE, 0, result.status_code, data_id, None
+        transient = (
+            result.status_code in RETRY_STATUS_CODES
+            or isinstance(result.error, (requests.ConnectionError, requests.Timeout))
+        )
+        if result.error is not None:
+            error = repr(result.error)
+        else:
+            error = result.data if isinstance(result.data, str) else json.dumps(result.data)
+        if not transient:
+            return FAILED, 0, result.status_code, None, error
+        if action == "insert" and result.status_code != 429:
+            # the record may have been created, so it is looked up before being sent again
+            return INFLIGHT, 0, result.status_code, None, error
+        attempts = self._attempts(result.index)
+        if self._exhausted(attempts):
+            return FAILED, 0, result.status_code, None, error
+        return PENDING, now + self._delay(attempts), result.status_code, None, error
+
+    def _delay(self, attempts):
+        return min(MAX_BACKOFF, self.backoff * 2 ** attempts)
+
+    def _attempts(self, seq):
+        return self._connection.execute(
+            "SELECT attempts FROM outbox WHERE seq = ?", (seq,)
+        ).fetchone()[0]
+
+    def _exhausted(self, attempts):
+        return self.max_attempts is not None and attempts >= self.max_attempts
+
+    def _check_inflight(self):
+        """requeue the entries in flight, skipping the inserts already found on the server.
+        """
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT seq, action, record, attempts FROM outbox WHERE state = ? ORDER BY seq",
+                (INFLIGHT,),
+            ).fetchall()
+        if not rows:
+            return
+        api = self.api
+        if api._response_cache is not None:
+            # a cached page may predate the lost insert
+            api._response_cache.invalidate(
+                ResponseCache.scope(api._user_key, api._url(ZAIM_API_MONEY_URL))
+            )
+        candidates = {}
+        updates = []
+        claimed = set()
+        now = time.time()
+        for seq, action, record, attempts in rows:
+            record = _decode(record)
+            if action != "insert":
+                # PUT and DELETE can be sent again safely
+                updates.append((PENDING, None, 0, seq))
+                continue
+            mode = record["mode"]
+            date = record["date"]
+            if (mode, date) not in candidates:
+                candidates[mode, date] = list(
+                    api.iter_money(start_date=date, end_date=date, mode=mode)
+                )
+            try:
+                form = _form(api, record)
+            except KeyError:
+                # an unknown name fails again when the entry is sent
+                updates.append((PENDING, None, 0, seq))
+                continue
+            data_id = None
+            for money in candidates[mode, date]:
+                if (
+                    money["id"] not in claimed
+                    and _matches(form, money)
+                    and not self._owned(money["id"])
+                ):
+                    data_id = money["id"]
+                    claimed.add(data_id)
+                    break
+            if data_id is not None:
+                updates.append((DONE, data_id, 0, seq))
+            elif self._exhausted(attempts):
+                # the insert was not created, and is given up after its last attempt
+                updates.append((FAILED, None, 0, seq))
+            else:
+                # sent again with the same backoff as the other transient errors
+                updates.append((PENDING, None, now + self._delay(attempts), seq))
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "UPDATE outbox SET state = ?, data_id = COALESCE(?, data_id), next_attempt = ?, "
+                "updated = ? WHERE seq = ?",
+                [(state, data_id, next_attempt, now, seq)
+                 for state, data_id, next_attempt, seq in updates],
+            )
+
+    def _owned(self, data_id):
+        """return True if the record was created by another insert of the journal.
+        """
+        with self._lock:
+            return self._connection.execute(
+                "SELECT 1 FROM outbox WHERE action = 'insert' AND state = ? AND data_id = ?",
+                (DONE, data_id),
+            ).fetchone() is not None
+
+
+def _queued(name):
+    action, mode = name.split("_")[:2]
+    signature = inspect.signature(getattr(ZaimAPI, name))
+
+    def method(self, *args, key=None, dedupe=None, **kwargs):
+        arguments = signature.bind(self, *args, **kwargs).arguments
+        del arguments["self"]
+        return self.enqueue(action, dict(arguments, mode=mode), key=key, dedupe=dedupe)
+
+    method.__name__ = name
+    method.__qualname__ = "Outbox." + name
+    method.__doc__ = "queue ZaimAPI.{}() and return the idempotency key of the entry.".format(name)
+    return method
+
+
+for _action in ACTIONS:
+    for _mode in MODES:
+        for _suffix in (("",) if _action == "delete" else ("", "_simple")):
+            _name = "{}_{}{}".format(_action, _mode, _suffix)
+            setattr(Outbox, _name, _queued(_name))
+
+
+def _normalize(action, record):
+    if action not in ACTIONS:
+        raise ValueError("unknown action: {}".format(action))
+    record = dict(record)
+    mode = record.pop("mode", None)
+    mode = record.pop("type", mode)
+    if mode not in MODES:
+        raise ValueError("unknown mode: {}".format(mode))
+    if "id" in record:
+        record["data_id"] = record.pop("id")
+    if action != "insert" and record.get("data_id") is None:
+        raise ValueError("'id' is required to {} a record".format(action))
+    record["mode"] = mode
+    return record
+
+
+def _encode(record):
+    def default(value):
+        if isinstance(value, datetime.date):
+            return value.strftime("%Y-%m-%d")
+        raise TypeError("{!r} cannot be journaled".format(value))
+
+    return json.dumps(record, sort_keys=True, ensure_ascii=False, default=default)
+
+
+def _decode(content):
+    record = json.loads(content)
+    if "date" in record:
+        record["date"] = datetime.datetime.strptime(record["date"], "%Y-%m-%d").date()
+    return record
+
+
+def _content_key(action, content):
+    return hashlib.sha256("{}\n{}".format(action, content).encode("utf-8")).hexdigest()[:32]
+
+
+def _entry(row):
+    key, action, record, state, attempts, status_code, data_id, error = row
+    return {
+        "key": key,
+        "action": action,
+        "record": _decode(record),
+        "state": state,
+        "attempts": attempts,
+        "status_code": status_code,
+        "data_id": data_id,
+        "error": error,
+    }
+
+
+def _form(api, record):
+    """return the form data which the insert of the record sends.
+    """
+    kwargs = dict(record)
+    mode = kwargs.pop("mode")
+    if mode == "payment":
+        if "genre" in kwargs:
+            (
+                kwargs["category_id"],
+                kwargs["genre_id"],
+                kwargs["from_account_id"],
+            ) = api._resolve_ids(
+                api._payment_ids, kwargs.pop("genre"), kwargs.pop("from_account", None)
+            )
+        return _payment_data(**kwargs)
+    if mode == "income":
+        if "category" in kwargs:
+            kwargs["category_id"], kwargs["to_account_id"] = api._resolve_ids(
+                api._income_ids, kwargs.pop("category"), kwargs.pop("to_account", None)
+            )
+        return _income_data(**kwargs)
+    if "from_account" in kwargs:
+        kwargs["from_account_id"], kwargs["to_account_id"] = api._resolve_ids(
+            api._transfer_ids, kwargs.pop("from_account"), kwargs.pop("to_account")
+        )
+    return _transfer_data(**kwargs)
+
+
+def _matches(form, money):
+    return all(
+        str(money.get(key)) == str(value) for key, value in form.items() if key != "mapping"
+    )
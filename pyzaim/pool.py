@@ -0,0 +1,246 @@
+import collections
+import http.cookiejar
+import pickle
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, NamedTuple, Optional
+
+import requests
+
+from .api import ZAIM_API_BASE_URL, ZaimAPI, _resolve_credentials
+from .cache import IdTableCache, MemoryIdTableCache, ResponseCache
+from .transport import DEFAULT_POOLSIZE, TokenBucket, Transport
+
+
+class TenantResult(NamedTuple):
+    """result of one user of ZaimClientPool.map.
+    """
+    access_token: str
+    ok: bool
+    value: Any = None
+    error: Optional[BaseException] = None
+
+
+class ZaimClientPool:
+    """per-user ZaimAPI clients of one application sharing their resources.
+
+    The clients are keyed by access token and share one requests.Session (and thus one
+    connection pool of pool_maxsize connections per host), one Transport and one
+    cache of the ID tables. The least recently used clients are dropped beyond
+    max_clients, so that the memory and the connections do not grow with the users.
+    The session keeps no cookies, so that nothing set for one user is sent for another.
+
+    Parameters
+    ==========
+    consumer_id : str
+        consumer ID of the application.
+        If None, then the value of the environmental variable 'ZAIM_CONSUMER_ID' is referred to.
+    consumer_secret : str
+        consumer secret of the application.
+        If None, then the value of the environmental variable 'ZAIM_CONSUMER_SECRET' is referred to.
+    max_clients : int
+        maximum number of the clients kept.
+    id_table_cache : MemoryIdTableCache, IdTableCache or str
+        cache of the ID tables shared by the clients. An IdTableCache or a directory is
+        used as the backend of a MemoryIdTableCache. If None, a MemoryIdTableCache is used.
+    transport : Transport
+        rate limiter, timeouts and retry policy shared by the clients.
+        If None, a Transport with the default settings is used.
+    pool_maxsize : int
+        number of the connections kept alive per host.
+    base_url : str
+        base URL of the API.
+    response_cache : ResponseCache or str
+        cache of the GET responses shared by the clients, or the directory of its disk backend.
+    """
+
+    def __init__(
+        self,
+        consumer_id=None,
+        consumer_secret=None,
+        max_clients=128,
+        id_table_cache=None,
+        transport=None,
+        pool_maxsize=DEFAULT_POOLSIZE,
+        base_url=ZAIM_API_BASE_URL,
+        response_cache=None,
+    ):
+        self.consumer_id, self.consumer_secret = _resolve_credentials(
+            consumer_id, consumer_secret
+        )[:2]
+        self.max_clients = max_clients
+        if isinstance(id_table_cache, str):
+            id_table_cache = IdTableCache(id_table_cache)
+        if not isinstance(id_table_cache, MemoryIdTableCache):
+            id_table_cache = MemoryIdTableCache(backend=id_table_cache)
+        self.id_table_cache = id_table_cache
+        self.transport = transport if transport is not None else Transport()
+        self.pool_maxsize = pool_maxsize
+        self.base_url = base_url
+        if isinstance(response_cache, str):
+            response_cache = ResponseCache(directory=response_cache)
+        self.response_cache = response_cache
+        self.session = requests.Session()
+        # the session is shared by the users, so the cookies of a response are never stored
+        self.session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+        self.transport.mount(self.session, pool_maxsize)
+        # access token -> (access token secret, ZaimAPI)
+        self._clients = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self):
+        return len(self._clients)
+
+    def client(self, access_token, access_token_secret, oauth_verifier=None):
+        """return the client of the user, creating it if needed.
+        """
+        with self._lock:
+            entry = self._clients.get(access_token)
+            if entry is not None and entry[0] == access_token_secret:
+                self._clients.move_to_end(access_token)
+                return entry[1]
+        api = ZaimAPI(
+            self.consumer_id,
+            self.consumer_secret,
+            access_token,
+            access_token_secret,
+            oauth_verifier,
+            id_table_cache=self.id_table_cache,
+            transport=self.transport,
+            base_url=self.base_url,
+            response_cache=self.response_cache,
+            session=self.session,
+        )
+        with self._lock:
+            self._clients[access_token] = (access_token_secret, api)
+            self._clients.move_to_end(access_token)
+            while len(self._clients) > self.max_clients:
+                self._clients.popitem(last=False)
+        return api
+
+    def remove(self, access_token):
+        """drop the client of the user (e.g. after the token was revoked).
+        """
+        with self._lock:
+            self._clients.pop(access_token, None)
+
+    def map(self, func, tenants, max_workers=8, processes=False):
+        """call func(client) for each user concurrently.
+
+        Parameters
+        ==========
+        func : callable
+            function called with the client of each user.
+            It and its return value must be picklable (e.g. a module-level function)
+            if processes is True.
+        tenants : iterable
+            (access_token, access_token_secret[, oauth_verifier]) tuples or dicts with these keys.
+        max_workers : int
+            number of the threads or processes.
+        processes : bool
+            if True, the users are spread over processes. Each process has its own pool with
+            the settings of this one, and the rate limit is divided among the processes.
+
+        Returns
+        =======
+        list of TenantResult
+            results in the same order as the tenants.
+        """
+        tenants = [_tenant_args(tenant) for tenant in tenants]
+        if processes:
+            executor = ProcessPoolExecutor(
+                max_workers=max_workers,
+                initializer=_init_process,
+                initargs=(self._process_config(max_workers),),
+            )
+            jobs = [(func, tenant) for tenant in tenants]
+            with executor:
+                return list(executor.map(_call_in_process, jobs))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(lambda tenant: _call(self, func, tenant), tenants))
+
+    def stats(self):
+        return {"clients": len(self._clients), "id_tables": self.id_table_cache.stats()}
+
+    def close(self):
+        with self._lock:
+            self._clients.clear()
+        self.session.close()
+
+    def _process_config(self, processes):
+        transport = self.transport
+        limiter = None
+        if transport.limiter is not None:
+            limiter = (transport.limiter.rate / processes, transport.limiter.burst)
+        cache = self.response_cache
+        return {
+            "consumer_id": self.consumer_id,
+            "consumer_secret": self.consumer_secret,
+            "max_clients": self.max_clients,
+            "backend": self.id_table_cache.backend,
+            "transport": (limiter, transport.retry, transport.timeout, transport.pool_maxsize),
+            "pool_maxsize": self.pool_maxsize,
+            "base_url": self.base_url,
+            "response_cache": cache.directory if cache is not None else None,
+        }
+
+
+def _tenant_args(tenant):
+    if isinstance(tenant, dict):
+        return (
+            tenant["access_token"],
+            tenant["access_token_secret"],
+            tenant.get("oauth_verifier"),
+        )
+    tenant = tuple(tenant)
+    return tenant + (None,) * (3 - len(tenant))
+
+
+def _call(pool, func, tenant):
+    try:
+        return TenantResult(tenant[0], True, func(pool.client(*tenant)))
+    except Exception as e:
+        return TenantResult(tenant[0], False, None, e)
+
+
+# Pool of the worker process of ZaimClientPool.map(processes=True)
+_process_pool = None
+
+
+def _init_process(config):
+    global _process_pool
+    limiter, retry, timeout, pool_maxsize = config.pop("transport")
+    transport = Transport(
+        limiter=TokenBucket(*limiter) if limiter is not None else None,
+        retry=retry,
+        timeout=timeout,
+        pool_maxsize=pool_maxsize,
+    )
+    _process_pool = ZaimClientPool(
+        config["consumer_id"],
+        config["consumer_secret"],
+        max_clients=config["max_clients"],
+        id_table_cache=config["backend"],
+        transport=transport,
+        pool_maxsize=config["pool_maxsize"],
+        base_url=config["base_url"],
+        response_cache=config["response_cache"],
+    )
+
+
+def _call_in_process(job):
+    func, tenant = job
+    result = _call(_process_pool, func, tenant)
+    if result.error is not None:
+        try:
+            # the exception has to be sent back to the parent process
+            pickle.dumps(result.error)
+        except Exception:
+            result = result._replace(error=RuntimeError(repr(result.error)))
+    return result
@@ -0,0 +1,330 @@
+import collections
+import datetime
+from typing import Any, Dict, NamedTuple, Tuple
+
+MODES = ("payment", "income", "transfer")
+TEXT_FIELDS = ("name", "place", "comment")
+
+# Fields compared between a crawled record and an API record, per mode
+COMPARED_FIELDS = {
+    "payment": (
+        "mode", "date", "amount", "category_id", "genre_id", "from_account_id",
+        "name", "place", "comment",
+    ),
+    "income": ("mode", "date", "amount", "category_id", "to_account_id", "place", "comment"),
+    "transfer": ("mode", "date", "amount", "from_account_id", "to_account_id", "comment"),
+}
+
+# Arguments of the update/insert methods of ZaimAPI, per mode
+_CALL_FIELDS = {
+    "payment": (
+        "date", "amount", "category_id", "genre_id", "from_account_id", "comment", "name", "place",
+    ),
+    "income": ("date", "category_id", "amount", "to_account_id", "comment", "place"),
+    "transfer": ("date", "amount", "from_account_id", "to_account_id", "comment"),
+}
+
+# Fields without which a record cannot be inserted, per mode
+_REQUIRED_FIELDS = {
+    "payment": ("category_id", "genre_id"),
+    "income": ("category_id",),
+    "transfer": ("from_account_id", "to_account_id"),
+}
+
+
+class Drift(NamedTuple):
+    """pair of records of the same entry whose fields differ.
+    """
+    crawled: Any
+    record: Any
+    # field -> (crawled value, API value)
+    fields: Dict[str, Tuple[Any, Any]]
+
+
+class Reconciliation:
+    """result of reconcile().
+
+    Attributes
+    ==========
+    matches : list of tuple
+        (crawled, record) pairs of the same entry without differences.
+    drifts : list of Drift
+        pairs of the same entry with different fields.
+    missing_in_api : list
+        crawled records without any API record.
+    missing_in_crawler : list
+        API records without any crawled record.
+    unresolved : list of tuple
+        (crawled, field, name) of the names missing from the ID tables of the API, or
+        shared by several IDs (e.g. a genre name used in two categories).
+    """
+
+    def __init__(self):
+        self.matches = []
+        self.drifts = []
+        self.missing_in_api = []
+        self.missing_in_crawler = []
+        self.unresolved = []
+        # normalized fields of the drifts and of missing_in_api, in the same order
+        self._drift_entries = []
+        self._missing_entries = []
+
+    def summary(self):
+        return {
+            "matches": len(self.matches),
+            "drifts": len(self.drifts),
+            "missing_in_api": len(self.missing_in_api),
+            "missing_in_crawler": len(self.missing_in_crawler),
+            "unresolved": len(self.unresolved),
+        }
+
+    def calls(self, update=True, insert=True):
+        """return the calls converging the API records to the crawled records.
+
+        The drifts are fixed with 'update_*' and the records missing in the API are
+        added with 'insert_*'. The drifts of the mode, and the records whose category,
+        genre or accounts cannot be resolved to IDs, are left out.
+
+        Returns
+        =======
+        list of tuple
+            (method name, kwargs) of the methods of ZaimAPI (or Outbox).
+        """
+        calls = []
+        if update:
+            for drift, (crawled, api) in zip(self.drifts, self._drift_entries):
+                if "mode" in drift.fields:
+                    continue
+                merged = dict(api)
+                merged.update((field, crawled[field]) for field in drift.fields)
+                mode = merged["mode"]
+                kwargs = {field: merged[field] for field in _CALL_FIELDS[mode]}
+                calls.append(("update_{}".format(mode), dict(kwargs, data_id=merged["id"])))
+        if insert:
+            for entry in self._missing_entries:
+                mode = entry["mode"]
+                if mode not in MODES or any(entry[f] is None for f in _REQUIRED_FIELDS[mode]):
+                    continue
+                calls.append(
+                    ("insert_{}".format(mode), {f: entry[f] for f in _CALL_FIELDS[mode]})
+                )
+        return calls
+
+    def apply(self, client, update=True, insert=True):
+        """call the methods returned by calls() on a ZaimAPI or an Outbox and return the results.
+        """
+        return [getattr(client, name)(**kwargs) for name, kwargs in self.calls(update, insert)]
+
+
+def reconcile(crawled, records, api):
+    """match the records of ZaimCrawler with the records of ZaimAPI.
+
+    The records are indexed by hash tables in one pass over each source, so that the
+    reconciliation takes linear time. The crawled records are paired with the API records
+    sharing their ID first, then with those sharing every compared field, and finally with
+    those sharing (date, amount, mode, account). The names of the crawled records are
+    mapped to IDs through the ID tables of api, the genre within its category. A name
+    which cannot be mapped to one ID is reported in unresolved and not compared.
+
+    Parameters
+    ==========
+    crawled : iterable of dict or MoneyRecord
+        records of ZaimCrawler.get_data (or get_range).
+    records : iterable of dict or MoneyRecord
+        records of ZaimAPI.get_data (or iter_money) for the same period.
+    api : ZaimAPI
+        client whose ID tables ('*_stoi') are used to resolve the names.
+
+    Returns
+    =======
+    Reconciliation
+        matches, drifts and missing records of both sides.
+    """
+    result = Reconciliation()
+    tables = _Tables(api)
+
+    by_id = {}
+    rest = []
+    for record in records:
+        entry = _normalize(record, tables)
+        if entry["id"] is not None and entry["id"] not in by_id:
+            by_id[entry["id"]] = (record, entry)
+        else:
+            rest.append((record, entry))
+
+    pending = []
+    for item in crawled:
+        entry = _normalize(item, tables, result.unresolved, item)
+        other = by_id.pop(entry["id"], None) if entry["id"] is not None else None
+        if other is not None:
+            _pair(result, (item, entry), other)
+        else:
+            pending.append((item, entry))
+
+    # API records left after the ID pass, indexed by their fields and by their key
+    by_fields = collections.defaultdict(collections.deque)
+    for other in list(by_id.values()) + rest:
+        by_fields[_fields(other[1])].append(other)
+    unmatched = []
+    for crawled_pair in pending:
+        candidates = by_fields.get(_fields(crawled_pair[1]))
+        if candidates:
+            result.matches.append((crawled_pair[0], candidates.popleft()[0]))
+        else:
+            unmatched.append(crawled_pair)
+    by_key = collections.defaultdict(collections.deque)
+    for candidates in by_fields.values():
+        for other in candidates:
+            by_key[_key(other[1])].append(other)
+    for crawled_pair in unmatched:
+        candidates = by_key.get(_key(crawled_pair[1]))
+        if candidates:
+            _pair(result, crawled_pair, candidates.popleft())
+        else:
+            result.missing_in_api.append(crawled_pair[0])
+            result._missing_entries.append(crawled_pair[1])
+    for candidates in by_key.values():
+        result.missing_in_crawler.extend(record for record, _ in candidates)
+    return result
+
+
+class _Tables:
+    """name -> IDs lookups of the ID tables of a client.
+
+    The names are not unique (e.g. 'その他' is a genre of most categories), so each name
+    maps to the list of its IDs, and the genres are also indexed by their category.
+    """
+
+    def __init__(self, api):
+        self.genre_to_category = api.genre_to_category
+        self.genre_ids = _ids(api.genre_itos)
+        self.category_ids = _ids(api.category_itos)
+        self.account_ids = _ids(api.account_itos)
+        # (category ID, genre name) -> genre ID
+        self.genre_index = {
+            (self.genre_to_category.get(genre_id), name): genre_id
+            for genre_id, name in api.genre_itos.items()
+        }
+
+
+def _ids(itos):
+    ids = collections.defaultdict(list)
+    for value, name in itos.items():
+        ids[name].append(value)
+    return ids
+
+
+def _normalize(record, tables, unresolved=None, source=None):
+    """return the compared fields of an API record or a crawled record.
+
+    The IDs of an API record are used if present. The names of a crawled record (source)
+    are preferred to its IDs, which may have been filled from the names without their
+    category. A name which does not map to exactly one ID is reported and left as None.
+    """
+    mode = record.get("mode") or record.get("type")
+    data_id = record.get("id")
+    if isinstance(data_id, str):
+        data_id = int(data_id) if data_id.isdigit() else None
+    entry = {
+        "id": data_id,
+        "mode": mode,
+        "date": _date(record.get("date")),
+        "amount": int(record["amount"]) if record.get("amount") is not None else None,
+    }
+
+    def name_of(field):
+        name = record.get(field)
+        if name is None or name == "":
+            return None
+        if source is None and record.get(field + "_id") is not None:
+            return None
+        return name
+
+    def pick(field, name, candidates):
+        if len(candidates) == 1:
+            return candidates[0]
+        if unresolved is not None:
+            unresolved.append((source, field, name))
+        return None
+
+    def resolve(field, ids):
+        name = name_of(field)
+        if name is None:
+            return record.get(field + "_id") or None
+        return pick(field, name, ids.get(name, []))
+
+    entry["category_id"] = None
+    entry["genre_id"] = None
+    if mode == "payment":
+        category = name_of("category")
+        genre = name_of("genre")
+        if category is not None:
+            categories = tables.category_ids.get(category, [])
+        else:
+            categories = [record.get("category_id")] if record.get("category_id") else []
+        if genre is not None:
+            if categories:
+                # the genre is looked up within the category first
+                candidates = [
+                    tables.genre_index[c, genre] for c in categories
+                    if (c, genre) in tables.genre_index
+                ]
+            else:
+                candidates = tables.genre_ids.get(genre, [])
+            entry["genre_id"] = pick("genre", genre, candidates)
+        else:
+            entry["genre_id"] = record.get("genre_id") or None
+        if entry["genre_id"] is not None:
+            # the category of a payment follows its genre, as in insert_payment_simple
+            entry["category_id"] = tables.genre_to_category.get(entry["genre_id"])
+        elif category is not None:
+            entry["category_id"] = pick("category", category, categories)
+        else:
+            entry["category_id"] = record.get("category_id") or None
+    elif mode == "income":
+        entry["category_id"] = resolve("category", tables.category_ids)
+    entry["from_account_id"] = (
+        resolve("from_account", tables.account_ids) if mode != "income" else None
+    )
+    entry["to_account_id"] = (
+        resolve("to_account", tables.account_ids) if mode != "payment" else None
+    )
+    for field in TEXT_FIELDS:
+        entry[field] = record.get(field) or None
+    return entry
+
+
+def _date(value):
+    if isinstance(value, str):
+        return datetime.date.fromisoformat(value[:10])
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    return value
+
+
+def _key(entry):
+    mode = entry["mode"]
+    account = entry["to_account_id"] if mode == "income" else entry["from_account_id"]
+    return entry["date"], entry["amount"], mode, account
+
+
+def _fields(entry):
+    fields = COMPARED_FIELDS.get(entry["mode"], ("mode", "date", "amount"))
+    return tuple(entry[field] for field in fields)
+
+
+def _pair(result, crawled_pair, api_pair):
+    (item, crawled), (record, api) = crawled_pair, api_pair
+    fields = {}
+    for field in COMPARED_FIELDS.get(crawled["mode"], ("mode", "date", "amount")):
+        value = crawled[field]
+        # an ID the crawler does not show (or could not resolve) is not a difference
+        if value is None and field not in TEXT_FIELDS:
+            continue
+        if value != api[field]:
+            fields[field] = (value, api[field])
+    if fields:
+        result.drifts.append(Drift(item, record, fields))
+        result._drift_entries.append((crawled, api))
+    else:
+        result.matches.append((item, record))
@@ -0,0 +1,336 @@
+import datetime
+import json
+import sqlite3
+
+SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS money (
+    id INTEGER PRIMARY KEY,
+    mode TEXT,
+    date TEXT,
+    amount INTEGER,
+    category_id INTEGER,
+    genre_id INTEGER,
+    from_account_id INTEGER,
+    to_account_id INTEGER,
+    name TEXT,
+    place TEXT,
+    comment TEXT,
+    created TEXT,
+    raw TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS money_date ON money (date);
+CREATE INDEX IF NOT EXISTS money_category ON money (category_id, date);
+CREATE INDEX IF NOT EXISTS money_genre ON money (genre_id, date);
+CREATE INDEX IF NOT EXISTS money_from_account ON money (from_account_id, date);
+CREATE INDEX IF NOT EXISTS money_to_account ON money (to_account_id, date);
+CREATE TABLE IF NOT EXISTS genres (id INTEGER PRIMARY KEY, name TEXT, category_id INTEGER);
+CREATE TABLE IF NOT EXISTS categories (id INTEGER PRIMARY KEY, name TEXT);
+CREATE TABLE IF NOT EXISTS accounts (id INTEGER PRIMARY KEY, name TEXT);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+MONEY_COLUMNS = (
+    "id",
+    "mode",
+    "date",
+    "amount",
+    "category_id",
+    "genre_id",
+    "from_account_id",
+    "to_account_id",
+    "name",
+    "place",
+    "comment",
+    "created",
+)
+
+# Number of rows written per executemany
+BATCH_SIZE: int = 500
+
+
+class ZaimStore:
+    """local SQLite mirror of the money records and the ID tables.
+
+    Parameters
+    ==========
+    path : str
+        path of the SQLite database file.
+    api : ZaimAPI
+        API client used by sync(). Not required for the queries.
+    """
+
+    def __init__(self, path, api=None):
+        self.api = api
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @property
+    def watermark(self):
+        """date of the last sync, or None if the store has never been synced.
+        """
+        value = self._get_meta("watermark")
+        if value is None:
+            return None
+        return datetime.datetime.strptime(value, "%Y-%m-%d").date()
+
+    def sync(self, start_date=None, lookback_days=31, page_size=100, end_date=None):
+        """fetch the records touched since the last sync and upsert them.
+
+        The first sync fetches the whole history from start_date.
+        The later syncs refetch the dates from 'lookback_days' days before the watermark
+        on, plus the dates of the records created since the last sync,
+        and remove the local records which are no longer returned for these dates.
+
+        Parameters
+        ==========
+        start_date : datetime.date
+            first date fetched on the first sync. If None, the whole history is fetched.
+        lookback_days : int
+            number of days before the watermark refetched to catch edits and deletions.
+        page_size : int
+            number of records requested per page.
+        end_date : datetime.date
+            last date fetched. If None, the records dated in the future
+            (e.g. scheduled payments) are mirrored as well.
+
+        Returns
+        =======
+        int
+            number of the upserted records.
+        """
+        if self.api is None:
+            raise ValueError("an API client is required to sync the store")
+        today = datetime.date.today()
+        last = end_date if end_date is not None else datetime.date.max
+        watermark = self.watermark
+        max_id = int(self._get_meta("max_id") or 0)
+
+        if watermark is None:
+            ranges = [(start_date, last)]
+        else:
+            since = watermark - datetime.timedelta(days=lookback_days)
+            touched = [(since, last)]
+            for date in self._created_dates(max_id, page_size):
+                if date < since and date <= last:
+                    touched.append((date, date))
+            ranges = _merge_ranges(touched)
+
+        count = 0
+        with self.connection:
+            self._sync_id_tables()
+            for start, end in ranges:
+                n, range_max_id = self._sync_range(start, end, page_size)
+                count += n
+                max_id = max(max_id, range_max_id)
+            self._set_meta("watermark", today.strftime("%Y-%m-%d"))
+            self._set_meta("max_id", str(max_id))
+        return count
+
+    def query(
+        self,
+        start_date=None,
+        end_date=None,
+        mode=None,
+        category=None,
+        genre=None,
+        account=None,
+    ):
+        """return the local money records matching all the given conditions.
+
+        Parameters
+        ==========
+        start_date, end_date : datetime.date
+            range of the dates (both inclusive).
+        mode : str
+            'payment', 'income' or 'transfer'.
+        category, genre, account : int or str
+            ID or name. 'account' matches both of the source and the destination.
+            A genre name shared by several categories is looked up in 'category';
+            ValueError is raised if the name is still ambiguous.
+
+        Returns
+        =======
+        list of dict
+            records in the same format as ZaimAPI.get_data, in descending order of date.
+        """
+        conditions = []
+        params = []
+        if start_date is not None:
+            conditions.append("date >= ?")
+            params.append(start_date.strftime("%Y-%m-%d"))
+        if end_date is not None:
+            conditions.append("date <= ?")
+            params.append(end_date.strftime("%Y-%m-%d"))
+        if mode is not None:
+            conditions.append("mode = ?")
+            params.append(mode)
+        category_id = None
+        if category is not None:
+            category_id = self._to_id("categories", category)
+            conditions.append("category_id = ?")
+            params.append(category_id)
+        if genre is not None:
+            conditions.append("genre_id = ?")
+            params.append(self._to_id("genres", genre, category_id))
+        if account is not None:
+            account_id = self._to_id("accounts", account)
+            conditions.append("(from_account_id = ? OR to_account_id = ?)")
+            params.extend([account_id, account_id])
+        sql = "SELECT raw FROM money"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY date DESC, id DESC"
+        return [json.loads(raw) for raw, in self.connection.execute(sql, params)]
+
+    def id_tables(self):
+        """return the ID tables stored locally in the same format as ZaimAPI.
+
+        Returns
+        =======
+        dict
+            'genre_itos', 'genre_to_category', 'category_itos' and 'account_itos'.
+        """
+        c = self.connection
+        return {
+            "genre_itos": dict(c.execute("SELECT id, name FROM genres")),
+            "genre_to_category": dict(c.execute("SELECT id, category_id FROM genres")),
+            "category_itos": dict(c.execute("SELECT id, name FROM categories")),
+            "account_itos": dict(c.execute("SELECT id, name FROM accounts")),
+        }
+
+    def _created_dates(self, max_id, page_size):
+        # records are listed from the newest ID, so stop at the first page without new ones
+        dates = set()
+        page = []
+        for record in self.api.iter_money(page_size=page_size, order="id"):
+            page.append(record)
+            if len(page) < page_size:
+                continue
+            new = [r for r in page if int(r["id"]) > max_id]
+            dates.update(_parse_date(r["date"]) for r in new)
+            if not new:
+                return dates
+            page = []
+        dates.update(_parse_date(r["date"]) for r in page if int(r["id"]) > max_id)
+        return dates
+
+    def _sync_range(self, start, end, page_size):
+        c = self.connection
+        c.execute("CREATE TEMP TABLE IF NOT EXISTS sync_seen (id INTEGER PRIMARY KEY)")
+        c.execute("DELETE FROM sync_seen")
+        count = 0
+        max_id = 0
+        rows = []
+        # date.max stands for no upper bound
+        if end == datetime.date.max:
+            end = None
+        for record in self.api.iter_money(start, end, page_size=page_size):
+            rows.append(_to_row(record))
+            max_id = max(max_id, int(record["id"]))
+            if len(rows) >= BATCH_SIZE:
+                count += self._upsert(rows)
+                rows = []
+        count += self._upsert(rows)
+
+        conditions = ["id NOT IN (SELECT id FROM sync_seen)"]
+        params = []
+        if end is not None:
+            conditions.append("date <= ?")
+            params.append(end.strftime("%Y-%m-%d"))
+        if start is not None:
+            conditions.append("date >= ?")
+            params.append(start.strftime("%Y-%m-%d"))
+        c.execute("DELETE FROM money WHERE " + " AND ".join(conditions), params)
+        return count, max_id
+
+    def _upsert(self, rows):
+        if not rows:
+            return 0
+        placeholders = ", ".join("?" * (len(MONEY_COLUMNS) + 1))
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO money ({}, raw) VALUES ({})".format(
+                ", ".join(MONEY_COLUMNS), placeholders
+            ),
+            rows,
+        )
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO sync_seen (id) VALUES (?)", [(row[0],) for row in rows]
+        )
+        return len(rows)
+
+    def _sync_id_tables(self):
+        api = self.api
+        c = self.connection
+        c.execute("DELETE FROM genres")
+        c.executemany(
+            "INSERT INTO genres (id, name, category_id) VALUES (?, ?, ?)",
+            [(i, name, api.genre_to_category[i]) for i, name in api.genre_itos.items()],
+        )
+        c.execute("DELETE FROM categories")
+        c.executemany(
+            "INSERT INTO categories (id, name) VALUES (?, ?)", api.category_itos.items()
+        )
+        c.execute("DELETE FROM accounts")
+        c.executemany(
+            "INSERT INTO accounts (id, name) VALUES (?, ?)", api.account_itos.items()
+        )
+
+    def _to_id(self, table, value, category_id=None):
+        if not isinstance(value, str):
+            return value
+        sql = "SELECT id FROM {} WHERE name = ?".format(table)
+        params = [value]
+        if category_id is not None:
+            # e.g. 'その他' is a genre of many categories
+            sql += " AND category_id = ?"
+            params.append(category_id)
+        ids = [i for i, in self.connection.execute(sql, params)]
+        if not ids:
+            raise KeyError(value)
+        if len(ids) > 1:
+            raise ValueError(
+                "{!r} matches {} {}: give the ID{}".format(
+                    value, len(ids), table, " or the category" if table == "genres" else ""
+                )
+            )
+        return ids[0]
+
+    def _get_meta(self, key):
+        row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def _set_meta(self, key, value):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value)
+        )
+
+
+def _to_row(record):
+    return tuple(record.get(column) for column in MONEY_COLUMNS) + (
+        json.dumps(record, ensure_ascii=False),
+    )
+
+
+def _parse_date(value):
+    return datetime.datetime.strptime(value[:10], "%Y-%m-%d").date()
+
+
+def _merge_ranges(ranges):
+    """merge the overlapping or adjacent date ranges.
+    """
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and merged[-1][1] >= start - datetime.timedelta(days=1):
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
@@ -0,0 +1,247 @@
+import datetime
+import email.utils
+import random
+import threading
+import time
+
+# HTTP status codes worth retrying
+RETRY_STATUS_CODES = frozenset([429, 500, 502, 503, 504])
+
+# Methods which can be sent again safely after a server error
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "OPTIONS", "PUT", "DELETE"])
+
+# Default (connect, read) timeout in seconds
+DEFAULT_TIMEOUT = (10.0, 60.0)
+
+# Default number of the connections kept alive per host (requests.adapters.DEFAULT_POOLSIZE)
+DEFAULT_POOLSIZE = 10
+
+
+class TokenBucket:
+    """token bucket limiting the number of requests per second.
+
+    One bucket can be shared by many clients and threads to keep them under one quota.
+
+    Parameters
+    ==========
+    rate : float
+        number of tokens added per second.
+    burst : int
+        capacity of the bucket.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """wait until a token is available and take it.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                elif self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                else:
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """stop handing out tokens for the given seconds (e.g. after a 429 response).
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0
+
+
+class RetryPolicy:
+    """retry policy with exponential backoff and full jitter.
+
+    Parameters
+    ==========
+    max_retries : int
+        maximum number of retries of a request.
+    backoff : float
+        base interval of the backoff in seconds.
+    max_backoff : float
+        upper bound of the interval in seconds.
+    statuses : iterable of int
+        HTTP status codes to be retried.
+    methods : iterable of str
+        methods retried after server errors and connection errors.
+        429 is retried for every method because the request was not processed.
+        If None, every method is retried.
+    respect_retry_after : bool
+        if True, the 'Retry-After' header of the response is used as the interval.
+    """
+
+    def __init__(
+        self,
+        max_retries=3,
+        backoff=0.5,
+        max_backoff=30.0,
+        statuses=RETRY_STATUS_CODES,
+        methods=IDEMPOTENT_METHODS,
+        respect_retry_after=True,
+    ):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.statuses = frozenset(statuses)
+        self.methods = None if methods is None else frozenset(methods)
+        self.respect_retry_after = respect_retry_after
+
+    def should_retry(self, method, attempt, response=None):
+        """return True if the attempt-th request should be sent again.
+
+        'response' is None if the request failed with a connection error or a timeout.
+        """
+        if attempt > self.max_retries:
+            return False
+        if response is not None:
+            if response.status_code not in self.statuses:
+                return False
+            if response.status_code == 429:
+                return True
+        return self.methods is None or method.upper() in self.methods
+
+    def delay(self, attempt, response=None):
+        """return the interval in seconds before the next request.
+        """
+        if self.respect_retry_after and response is not None:
+            retry_after = _parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after is not None:
+                return min(retry_after, self.max_backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+
+
+# Policy which never retries
+NO_RETRY = RetryPolicy(max_retries=0)
+
+
+class Transport:
+    """sends the requests of ZaimAPI with rate limiting, timeouts and retries.
+
+    A Transport holds no connection by itself, so that one instance (and its limiter)
+    can be shared by many clients.
+
+    Parameters
+    ==========
+    limiter : TokenBucket
+        rate limiter applied to every request including the retries. If None, no limit is applied.
+    retry : RetryPolicy
+        retry policy. If None, the default RetryPolicy is used.
+    timeout : float or tuple of float
+        (connect, read) timeout of each request in seconds.
+    pool_maxsize : int
+        number of the connections kept alive per host.
+    """
+
+    def __init__(
+        self,
+        limiter=None,
+        retry=None,
+        timeout=DEFAULT_TIMEOUT,
+        pool_maxsize=DEFAULT_POOLSIZE,
+    ):
+        self.limiter = limiter
+        self.retry = retry if retry is not None else RetryPolicy()
+        self.timeout = timeout
+        self.pool_maxsize = pool_maxsize
+
+    def mount(self, session, pool_maxsize=None):
+        """mount an HTTP adapter with the pool size on the session.
+        """
+        from requests.adapters import HTTPAdapter
+
+        size = pool_maxsize or self.pool_maxsize
+        adapter = HTTPAdapter(pool_connections=size, pool_maxsize=size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return size
+
+    def request(self, session, method, url, retry=None, observer=None, **kwargs):
+        """send the request through the session and return the response.
+
+        Parameters
+        ==========
+        session : requests.Session
+            session sending the request (e.g. OAuth1Session).
+        method, url : str
+            method and URL of the request.
+        retry : RetryPolicy
+            policy used instead of self.retry.
+        observer : Metrics
+            notified before and after every attempt (see pyzaim.instrumentation).
+        **kwargs
+            other arguments of requests.Session.request.
+        """
+        import requests
+
+        retry = retry if retry is not None else self.retry
+        kwargs.setdefault("timeout", self.timeout)
+        attempt = 0
+        while True:
+            attempt += 1
+            if self.limiter is not None:
+                self.limiter.acquire()
+            if observer is not None:
+                observer.before_request(method, url, kwargs)
+            start = time.perf_counter()
+            try:
+                response = session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if observer is not None:
+                    observer.after_request(
+                        method, url, None, e, time.perf_counter() - start, attempt
+                    )
+                if not retry.should_retry(method, attempt):
+                    raise
+                response = None
+            else:
+                if observer is not None:
+                    observer.after_request(
+                        method, url, response, None, time.perf_counter() - start, attempt
+                    )
+                if not retry.should_retry(method, attempt, response):
+                    return response
+            self.backoff(retry.delay(attempt, response), response)
+
+    def backoff(self, delay, response=None, limiter=None):
+        """sleep for the delay before a retry.
+
+        After a 429 response, the limiter of the transport and the given one are paused as well,
+        so that the other threads and clients sharing them back off too.
+        """
+        if response is not None and response.status_code == 429:
+            for bucket in (self.limiter, limiter):
+                if bucket is not None:
+                    bucket.pause(delay)
+        time.sleep(delay)
+
+
+def _parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, (when - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
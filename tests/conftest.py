@@ -0,0 +1,45 @@
+import pytest
+
+from stub_server import StubZaimServer, generate_records
+
+from pyzaim import ZaimAPI
+from pyzaim.transport import RetryPolicy, Transport
+
+CREDENTIALS = {
+    "ZAIM_CONSUMER_ID": "consumer-id",
+    "ZAIM_CONSUMER_SECRET": "consumer-secret",
+    "ZAIM_ACCESS_TOKEN": "access-token",
+    "ZAIM_ACCESS_TOKEN_SECRET": "access-token-secret",
+    "ZAIM_OAUTH_VERIFIER": "verifier",
+}
+
+
+@pytest.fixture
+def credentials(monkeypatch):
+    for name, value in CREDENTIALS.items():
+        monkeypatch.setenv(name, value)
+    return CREDENTIALS
+
+
+@pytest.fixture
+def server():
+    with StubZaimServer(records=generate_records(300)) as server:
+        yield server
+
+
+def make_api(server, retry=None, **kwargs):
+    return ZaimAPI(
+        "consumer-id",
+        "consumer-secret",
+        "access-token",
+        "access-token-secret",
+        "verifier",
+        base_url=server.base_url,
+        transport=Transport(retry=retry or RetryPolicy(max_retries=5, backoff=0.01)),
+        **kwargs,
+    )
+
+
+@pytest.fixture
+def api(server):
+    return make_api(server)
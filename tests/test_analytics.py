@@ -0,0 +1,67 @@
+import collections
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from pyzaim.analytics import Aggregator  # noqa: E402
+
+
+@pytest.fixture
+def money(api):
+    return list(api.iter_money())
+
+
+def test_sum_by_category_matches_a_loop(api, money):
+    expected = collections.Counter()
+    for record in money:
+        if record["mode"] == "payment":
+            expected[api.category_itos[record["category_id"]]] += record["amount"]
+    result = Aggregator(money, api).sum_by("category")
+    assert dict(zip(result["category"], result["amount"].tolist())) == expected
+
+
+def test_monthly_and_rolling_totals(api, money):
+    expected = collections.Counter()
+    for record in money:
+        if record["mode"] == "payment":
+            expected[record["date"][:7]] += record["amount"]
+    aggregator = Aggregator(money, api)
+    monthly = aggregator.monthly()
+    months = [str(month) for month in monthly["month"]]
+    assert dict(zip(months, monthly["amount"].tolist())) == {
+        month: expected.get(month, 0) for month in months
+    }
+
+    rolling = aggregator.rolling(3)["amount"].tolist()
+    totals = monthly["amount"].tolist()
+    assert rolling == [sum(totals[max(0, i - 2):i + 1]) for i in range(len(totals))]
+
+
+@pytest.mark.parametrize("window", [0, -1])
+def test_rolling_rejects_empty_windows(window):
+    with pytest.raises(ValueError, match="window must be positive"):
+        Aggregator([]).rolling(window)
+
+
+def test_balances_follow_the_flows(api, money):
+    expected = collections.Counter()
+    for record in money:
+        if record["mode"] in ("payment", "transfer"):
+            expected[api.account_itos[record["from_account_id"]]] -= record["amount"]
+        if record["mode"] in ("income", "transfer"):
+            expected[api.account_itos[record["to_account_id"]]] += record["amount"]
+    result = Aggregator(money, api).balances(initial={"account0": 1000})
+    expected["account0"] += 1000
+    assert dict(zip(result["account"], result["balance"].tolist())) == expected
+
+
+def test_budget_vs_actual(api, money):
+    result = Aggregator(money, api).budget_vs_actual({"category2": 50000}, by="category")
+    total = sum(
+        r["amount"] for r in money
+        if r["mode"] == "payment" and api.category_itos[r["category_id"]] == "category2"
+    )
+    assert set(result["category"]) == {"category2"}
+    assert result["actual"].sum() == total
+    assert (result["remaining"] == result["budget"] - result["actual"]).all()
@@ -0,0 +1,161 @@
+import datetime
+import time
+
+import pytest
+
+from stub_server import StubZaimServer, generate_id_tables, generate_records
+
+from pyzaim import ZaimAPI
+from pyzaim.api import _collection_url
+from pyzaim.cache import ResponseCache
+from pyzaim.transport import TokenBucket, Transport
+
+from conftest import make_api
+
+GENRE = generate_id_tables()[0][5]
+PAYMENT = {"mode": "payment", "date": datetime.date(2021, 3, 1), "amount": 500,
+           "category_id": GENRE["category_id"], "genre_id": GENRE["id"]}
+
+
+def test_iter_money_reads_every_page(api, server):
+    ids = [record["id"] for record in api.iter_money(page_size=40)]
+    assert sorted(ids) == sorted(server.money.records)
+
+
+@pytest.mark.parametrize("prefetch", [False, True])
+def test_iter_money_caps_page_size_at_api_limit(api, server, prefetch):
+    # the API returns at most 100 records per page whatever the limit
+    n = sum(1 for _ in api.iter_money(page_size=500, prefetch=prefetch))
+    assert n == len(server.money.records)
+
+
+def test_iter_money_rejects_empty_pages(api):
+    with pytest.raises(ValueError):
+        next(api.iter_money(page_size=0))
+
+
+def test_throttled_requests_are_retried():
+    with StubZaimServer(records=generate_records(250), throttle_every=3) as server:
+        api = make_api(server)
+        assert sum(1 for _ in api.iter_money()) == 250
+        assert server.throttled > 0
+
+
+def test_write_invalidates_cached_pages(server):
+    api = make_api(server, response_cache=ResponseCache())
+    params = {"mapping": 1, "start_date": "2021-01-01", "end_date": "2021-01-01"}
+    before = api.get_data(params)
+    requests = server.requests
+    assert api.get_data(params) == before
+    assert server.requests == requests
+
+    api.insert_payment(datetime.date(2021, 1, 1), 1234, GENRE["category_id"], GENRE["id"])
+    after = api.get_data(params)
+    assert len(after) == len(before) + 1
+
+
+@pytest.mark.parametrize("url, base_url, expected", [
+    (
+        "https://api.zaim.net/v2/home/money/payment/12",
+        "https://api.zaim.net",
+        "https://api.zaim.net/v2/home/money",
+    ),
+    (
+        "https://host/zaim/v2/home/money/income/3",
+        "https://host/zaim",
+        "https://host/zaim/v2/home/money",
+    ),
+    (
+        "https://host/zaim/v2/home/money/transfer",
+        "https://host/zaim/",
+        "https://host/zaim/v2/home/money",
+    ),
+])
+def test_collection_url_keeps_base_path(url, base_url, expected):
+    assert _collection_url(url, base_url) == expected
+
+
+class CreateThenFailServer(StubZaimServer):
+    """server answering the first insert with 503 after creating the record.
+    """
+    failed = False
+
+    def handle(self, method, path, params, form):
+        status, body = super().handle(method, path, params, form)
+        if method == "POST" and not self.failed:
+            self.failed = True
+            return 503, {"message": "service unavailable"}
+        return status, body
+
+
+
+def test_bulk_insert_is_not_resent_after_a_server_error():
+    with CreateThenFailServer() as server:
+        [result] = make_api(server).bulk_insert([PAYMENT], backoff=0.01)
+        assert (result.ok, result.status_code, result.attempts) == (False, 503, 1)
+        assert len(server.money.records) == 1
+
+
+def test_bulk_insert_can_be_resent_after_a_server_error():
+    with CreateThenFailServer() as server:
+        [result] = make_api(server).bulk_insert([PAYMENT], backoff=0.01, methods=None)
+        assert (result.ok, result.attempts) == (True, 2)
+        # the record created by the failed request is duplicated
+        assert len(server.money.records) == 2
+
+
+def test_id_tables_can_be_assigned(api, server):
+    api.genre_stoi = {"custom": GENRE["id"]}
+    assert api.genre_stoi == {"custom": GENRE["id"]}
+    # the other tables are still fetched, and the assigned one is kept
+    assert api.genre_to_category[GENRE["id"]] == GENRE["category_id"]
+    assert api.genre_stoi == {"custom": GENRE["id"]}
+    api.insert_payment_simple(datetime.date(2021, 3, 1), 100, "custom")
+
+
+def test_unknown_names_do_not_refetch_fresh_id_tables(api, server):
+    for _ in range(5):
+        with pytest.raises(KeyError):
+            api.insert_payment_simple(datetime.date(2021, 3, 1), 100, "no such genre")
+    assert api.stats()["requests"]["GET /v2/home/genre"]["count"] == 1
+
+
+def test_throttled_bulk_writes_pause_the_shared_limiter():
+    limiter = TokenBucket(rate=1000, burst=10)
+    with StubZaimServer(throttle_every=2, retry_after=0.2) as server:
+        api = ZaimAPI(
+            "consumer-id", "consumer-secret", "access-token", "access-token-secret", "verifier",
+            base_url=server.base_url, transport=Transport(limiter=limiter),
+        )
+        api.verify()
+        start = time.monotonic()
+        [result] = api.bulk_insert([PAYMENT], max_workers=1)
+        assert result.ok and result.attempts == 2
+    # the other clients of the limiter wait for the Retry-After of the 429
+    assert limiter._paused_until >= start + 0.2
+
+
+def test_stats_and_hooks_see_every_attempt():
+    sent = []
+    events = []
+
+    def trace(method, url, kwargs):
+        kwargs["headers"] = dict(kwargs.get("headers") or {}, **{"X-Trace": str(len(sent))})
+        sent.append(kwargs["headers"])
+
+    with StubZaimServer(records=generate_records(250), throttle_every=3) as server:
+        api = make_api(server)
+        api.add_hook("pre", trace)
+        api.add_hook("post", events.append)
+        assert sum(1 for _ in api.iter_money()) == 250
+        requests = server.requests
+
+    stats = api.stats()["requests"]["GET /v2/home/money"]
+    assert stats["count"] == requests == len(events) == len(sent)
+    assert stats["statuses"] == {200: 3, 429: server.throttled}
+    assert stats["latency"]["count"] == requests
+    assert [e["status"] for e in events].count(429) == server.throttled
+    assert all(e["endpoint"] == "GET /v2/home/money" and e["error"] is None for e in events)
+
+    api.reset_stats()
+    assert api.stats()["requests"] == {}
@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+
+aiohttp = pytest.importorskip("aiohttp")
+
+from stub_server import StubZaimServer, generate_records  # noqa: E402
+
+from pyzaim import AsyncZaimAPI  # noqa: E402
+from pyzaim.transport import RetryPolicy  # noqa: E402
+
+
+def client(server, retry=None):
+    return AsyncZaimAPI(
+        "consumer-id", "consumer-secret", "access-token", "access-token-secret", "verifier",
+        base_url=server.base_url, retry=retry or RetryPolicy(max_retries=5, backoff=0.01),
+    )
+
+
+def test_throttled_requests_are_retried():
+    async def main(server):
+        async with client(server) as api:
+            pages = await asyncio.gather(*[
+                api.get_data({"page": page, "limit": 100}) for page in range(1, 4)
+            ])
+        return sum(map(len, pages))
+
+    with StubZaimServer(records=generate_records(300), throttle_every=2) as server:
+        assert asyncio.run(main(server)) == 300
+        assert server.throttled > 0
+
+
+def test_error_status_raises(server):
+    async def main():
+        async with client(server) as api:
+            await api.delete_payment(10 ** 9)
+
+    with pytest.raises(aiohttp.ClientResponseError) as info:
+        asyncio.run(main())
+    assert info.value.status == 404
+
+
+def test_throttling_beyond_the_retries_raises():
+    async def main(server):
+        async with client(server, RetryPolicy(max_retries=2, backoff=0.01)) as api:
+            await api.verify()
+
+    with StubZaimServer(throttle_every=1) as server:
+        with pytest.raises(aiohttp.ClientResponseError) as info:
+            asyncio.run(main(server))
+        assert info.value.status == 429
+        assert server.throttled == 3
@@ -0,0 +1,50 @@
+import datetime
+
+from stub_server import StubZaimServer
+
+from conftest import make_api
+
+
+def payments(server, n):
+    genre = server.genres[5]
+    return [
+        {"mode": "payment", "date": datetime.date(2021, 5, 1 + i % 28), "amount": 100 + i,
+         "genre": genre["name"], "from_account": server.accounts[0]["name"]}
+        for i in range(n)
+    ]
+
+
+def test_bulk_insert_retries_throttled_requests():
+    with StubZaimServer(throttle_every=5) as server:
+        api = make_api(server)
+        results = api.bulk_insert(payments(server, 40), max_workers=2, max_retries=10, backoff=0.01)
+        assert server.throttled > 0
+    assert [r.index for r in results] == list(range(40))
+    assert all(r.ok for r in results)
+    assert any(r.attempts > 1 for r in results)
+    amounts = sorted(r["amount"] for r in server.money.records.values())
+    assert amounts == [100 + i for i in range(40)]
+
+
+def test_bulk_update_and_delete(server):
+    api = make_api(server)
+    inserted = api.bulk_insert(payments(server, 5))
+    ids = [r.data["money"]["id"] for r in inserted]
+
+    updates = [dict(record, id=data_id, amount=1) for record, data_id in zip(payments(server, 5), ids)]
+    assert all(r.ok for r in api.bulk_update(updates))
+    assert {server.money.records[data_id]["amount"] for data_id in ids} == {1}
+
+    results = api.bulk_delete([{"mode": "payment", "id": data_id} for data_id in ids + [10 ** 9]])
+    assert [r.ok for r in results] == [True] * 5 + [False]
+    assert results[-1].status_code == 404
+    assert not set(ids) & set(server.money.records)
+
+
+def test_bulk_results_report_bad_records(server):
+    api = make_api(server)
+    good, = payments(server, 1)
+    results = api.bulk_insert([{"mode": "loan", "amount": 1}, good, dict(good, genre="no such genre")])
+    assert [r.ok for r in results] == [False, True, False]
+    assert isinstance(results[0].error, ValueError)
+    assert isinstance(results[2].error, KeyError)
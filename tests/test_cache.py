@@ -0,0 +1,93 @@
+import datetime
+import time
+
+from stub_server import StubZaimServer, generate_id_tables
+
+from pyzaim.cache import IdTableCache, MemoryIdTableCache, ResponseCache
+
+from conftest import make_api
+
+GENRE = generate_id_tables()[0][5]
+PARAMS = {"mapping": 1, "start_date": "2021-02-01", "end_date": "2021-02-01"}
+
+
+def tables(genre_name="genre"):
+    return {
+        "genres": [{"id": 1, "name": genre_name, "category_id": 10}],
+        "categories": [{"id": 10, "name": "category"}],
+        "accounts": [{"id": 100, "name": "account"}],
+    }
+
+
+def test_identical_tables_are_stored_once():
+    cache = MemoryIdTableCache()
+    cache.save("user1", tables())
+    cache.save("user2", tables())
+    cache.save("user3", tables("other"))
+    assert cache.load("user1") == tables()
+    assert cache.stats()["tables"] == 4
+
+    cache.clear("user3")
+    assert cache.load("user3") is None
+    assert cache.stats()["tables"] == 3
+
+
+def test_expired_tables_are_loaded_again(monkeypatch):
+    cache = MemoryIdTableCache(ttl=60)
+    cache.save("user", tables())
+    now = time.time()
+    monkeypatch.setattr("pyzaim.cache.time.time", lambda: now + 61)
+    assert cache.load("user") is None
+
+
+def test_tables_are_read_from_the_backend(tmp_path):
+    IdTableCache(str(tmp_path)).save("user", tables())
+    cache = MemoryIdTableCache(backend=IdTableCache(str(tmp_path)))
+    assert cache.load("user") == tables()
+    assert cache.stats()["misses"] == 1
+    assert cache.load("user") == tables()
+    assert cache.stats()["hits"] == 1
+
+
+def test_cached_responses_are_revalidated_with_etags():
+    cache = ResponseCache(ttl=0)
+    with StubZaimServer(etags=True) as server:
+        api = make_api(server, response_cache=cache)
+        first = api.get_data(PARAMS)
+        assert api.get_data(PARAMS) == first
+    assert cache.stats()["revalidated"] == 1
+
+
+def test_writes_invalidate_every_query_of_the_collection(tmp_path, server):
+    cache = ResponseCache(directory=str(tmp_path))
+    api = make_api(server, response_cache=cache)
+    api.get_data(PARAMS)
+    api.get_data(dict(PARAMS, mode="payment"))
+    assert cache.stats()["entries"] == 2
+
+    api.insert_payment(datetime.date(2021, 2, 1), 100, GENRE["category_id"], GENRE["id"])
+    assert cache.stats()["entries"] == 0
+    # the disk backend is emptied as well, so that a new client does not read stale pages
+    assert not [path for path in tmp_path.iterdir() if path.name.startswith("response-")]
+    assert len(api.get_data(PARAMS)) == 1
+
+
+def test_responses_of_invalidated_scopes_are_not_stored(tmp_path):
+    import requests
+
+    cache = ResponseCache(directory=str(tmp_path))
+    url = "https://api.zaim.net/v2/home/money"
+    key = ResponseCache.key("user", url, PARAMS)
+
+    def send(headers):
+        # a write to the collection finishes while the GET is in flight
+        cache.invalidate(ResponseCache.scope("user", url))
+        response = requests.Response()
+        response.status_code = 200
+        response.url = url
+        response._content = b'{"money": []}'
+        return response
+
+    assert cache.fetch(key, send).json() == {"money": []}
+    assert cache.stats()["entries"] == 0
+    assert cache.get(key) is None
@@ -0,0 +1,82 @@
+import datetime
+import json
+import os
+
+import pytest
+
+from pyzaim import cli
+
+
+def export(server, output, *options):
+    argv = [
+        "export", "--start", "2019-01-01", "--output", str(output),
+        "--base-url", server.base_url, "--quiet",
+    ]
+    return cli.main(argv + list(options))
+
+
+def read_checkpoint(output):
+    with open(os.path.join(str(output), cli.CHECKPOINT_NAME), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_checkpoint(output, state):
+    with open(os.path.join(str(output), cli.CHECKPOINT_NAME), "w", encoding="utf-8") as f:
+        json.dump(state, f)
+
+
+def exported_rows(output):
+    rows = 0
+    for name in os.listdir(str(output)):
+        if name.endswith(".jsonl"):
+            with open(os.path.join(str(output), name), encoding="utf-8") as f:
+                rows += sum(1 for _ in f)
+    return rows
+
+
+def test_split_shards():
+    shards = cli.split_shards(datetime.date(2019, 1, 15), datetime.date(2019, 3, 2))
+    assert [name for name, _, _ in shards] == ["2019-01", "2019-02", "2019-03"]
+    assert shards[0][1] == datetime.date(2019, 1, 15)
+    assert shards[-1][2] == datetime.date(2019, 3, 2)
+
+
+def test_export_resumes_unfinished_shards(credentials, server, tmp_path, capsys):
+    assert export(server, tmp_path, "--end", "2019-12-31") == 0
+    expected = sum(1 for r in server.money.records.values() if r["date"].startswith("2019"))
+    assert exported_rows(tmp_path) == expected
+
+    state = read_checkpoint(tmp_path)
+    del state["shards"]["2019-03"], state["shards"]["2019-11"]
+    write_checkpoint(tmp_path, state)
+    capsys.readouterr()
+    assert export(server, tmp_path, "--end", "2019-12-31") == 0
+    assert "in 2 shard(s)" in capsys.readouterr().err
+    assert exported_rows(tmp_path) == expected
+
+
+def test_export_with_other_settings_is_not_resumed(credentials, server, tmp_path):
+    assert export(server, tmp_path, "--end", "2019-02-28") == 0
+    with pytest.raises(SystemExit):
+        export(server, tmp_path, "--end", "2019-03-31")
+    assert export(server, tmp_path, "--end", "2019-03-31", "--restart") == 0
+
+
+def test_default_end_is_kept_by_the_checkpoint(credentials, server, tmp_path, capsys):
+    assert export(server, tmp_path) == 0
+    state = read_checkpoint(tmp_path)
+    assert "end" in state["job"]
+
+    # an export started on an earlier day is resumed with its own end date
+    state["job"]["end"] = "2019-06-30"
+    state["shards"] = {name: info for name, info in state["shards"].items() if name < "2019-06"}
+    write_checkpoint(tmp_path, state)
+    capsys.readouterr()
+    assert export(server, tmp_path) == 0
+    assert "in 1 shard(s)" in capsys.readouterr().err
+    assert read_checkpoint(tmp_path)["job"]["end"] == "2019-06-30"
+
+
+def test_unknown_extraction_is_rejected(credentials, server, tmp_path):
+    with pytest.raises(SystemExit):
+        export(server, tmp_path, "--source", "crawler", "--extraction", "css")
@@ -0,0 +1,61 @@
+import datetime
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from pyzaim.columnar import ColumnBuilder, to_columns  # noqa: E402
+
+
+def crawler_item(data_id, category, genre, amount=1000):
+    return {
+        "id": str(data_id), "type": "payment", "date": datetime.datetime(2020, 10, 1),
+        "category": category, "genre": genre, "amount": amount, "from_account": "account1",
+        "place": "shop", "name": "item", "comment": "",
+    }
+
+
+def test_api_records_are_dictionary_encoded(api):
+    money = list(api.iter_money())
+    columns = to_columns(money, api)
+    assert columns["amount"].tolist() == [r["amount"] for r in money]
+    assert columns["date"][0] == np.datetime64(money[0]["date"])
+    names = columns["dictionaries"]["genre"]
+    genres = [names[code] if code >= 0 else None for code in columns["genre_code"]]
+    assert genres == [api.genre_itos.get(r["genre_id"]) for r in money]
+    assert len(names) == len(set(names))
+
+
+def test_crawler_items_get_the_ids_of_their_names(api, server):
+    genre = server.genres[7]
+    category = api.category_itos[genre["category_id"]]
+    columns = to_columns([crawler_item(1, category, genre["name"])], api)
+    assert columns["genre_id"].tolist() == [genre["id"]]
+    assert columns["category_id"].tolist() == [genre["category_id"]]
+    assert columns["from_account_id"].tolist() == [api.account_stoi["account1"]]
+    assert columns["to_account_code"].tolist() == [-1]
+
+
+def test_pandas_and_arrow_conversions(api):
+    pytest.importorskip("pandas")
+    pytest.importorskip("pyarrow")
+    money = list(api.iter_money(mode="payment"))
+    builder = ColumnBuilder(api).extend(money)
+    frame = builder.to_pandas()
+    assert frame["genre"].tolist() == [api.genre_itos[r["genre_id"]] for r in money]
+    assert str(frame["genre"].dtype) == "category"
+    table = builder.to_arrow()
+    assert table.column("amount").to_pylist() == [r["amount"] for r in money]
+    assert table.column("genre").to_pylist() == frame["genre"].tolist()
+
+
+def test_write_parquet_in_batches(api, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    from pyzaim.columnar import write_parquet
+
+    path = str(tmp_path / "money.parquet")
+    money = list(api.iter_money())
+    assert write_parquet(iter(money), path, api, batch_size=64) == len(money)
+    table = pq.read_table(path)
+    assert table.column("id").to_pylist() == [r["id"] for r in money]
+    assert pq.ParquetFile(path).num_row_groups == -(-len(money) // 64)
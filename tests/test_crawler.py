@@ -0,0 +1,144 @@
+import time
+
+import pytest
+
+pytest.importorskip("selenium")
+
+from selenium.common.exceptions import WebDriverException  # noqa: E402
+
+from fake_webdriver import FakeWebDriver  # noqa: E402
+
+from pyzaim import ZaimCrawler  # noqa: E402
+
+
+class QuitRecordingDriver(FakeWebDriver):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.quit_called = False
+
+    def quit(self):
+        self.quit_called = True
+
+
+def crawler(rows=50, extraction="script", **kwargs):
+    return ZaimCrawler(
+        "user", "password", extraction=extraction,
+        driver_factory=lambda: QuitRecordingDriver(rows, window=20), **kwargs
+    )
+
+
+@pytest.mark.parametrize("extraction", ["script", "html", "webdriver"])
+def test_every_row_of_the_month_is_read(extraction):
+    if extraction == "html":
+        pytest.importorskip("lxml")
+    items = list(crawler(extraction=extraction).iter_data(2020, 10, progress=False))
+    assert len(items) == 50
+    assert len({item["id"] for item in items}) == 50
+    assert items[0]["date"] > items[-1]["date"]
+
+
+def test_end_of_the_list_waits_only_for_the_quiet_period():
+    c = crawler(scroll_timeout=5.0, scroll_quiet=0.2)
+    start = time.monotonic()
+    assert len(list(c.iter_data(2020, 10, progress=False))) == 50
+    assert time.monotonic() - start < 1.5
+
+
+def test_rows_loaded_slowly_are_not_dropped():
+    c = ZaimCrawler(
+        "user", "password", scroll_quiet=1.0,
+        driver_factory=lambda: FakeWebDriver(50, window=20, load_latency=0.3),
+    )
+    assert len(list(c.iter_data(2020, 10, progress=False))) == 50
+
+
+def test_close_quits_the_driver_when_saving_the_session_fails(tmp_path):
+    c = crawler()
+    c.cookie_path = str(tmp_path / "missing" / "cookies.json")
+    with pytest.raises(OSError):
+        c.close()
+    assert c.driver.quit_called
+
+
+class MonthFailingDriver(QuitRecordingDriver):
+    def get(self, url):
+        if "month=" in url:
+            raise WebDriverException("the browser crashed")
+        super().get(url)
+
+
+def test_failed_restart_leaves_no_stale_driver():
+    started = []
+
+    def factory():
+        started.append(len(started))
+        if len(started) == 1:
+            return MonthFailingDriver(50, window=20)
+        if len(started) == 2:
+            raise WebDriverException("cannot start the browser")
+        return QuitRecordingDriver(50, window=20)
+
+    c = ZaimCrawler("user", "password", driver_factory=factory)
+    first = c.driver
+    assert len(c.get_range((2020, 10), (2020, 10), retries=1, progress=False)) == 50
+    assert first.quit_called
+    assert c.driver is None
+
+    # the driver is started again on the next use
+    assert len(list(c.iter_data(2020, 11, progress=False))) == 50
+    c.close()
+    assert c.driver.quit_called
+
+
+class FlakyMonthDriver(QuitRecordingDriver):
+    """driver failing the first time each month in 'failures' is opened.
+    """
+
+    def __init__(self, failures, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.failures = failures
+
+    def get(self, url):
+        for month, left in list(self.failures.items()):
+            if "month={}".format(month) in url and left > 0:
+                self.failures[month] -= 1
+                raise WebDriverException("the page crashed")
+        super().get(url)
+
+
+def flaky_crawler(failures):
+    return ZaimCrawler(
+        "user", "password", scroll_quiet=0.05,
+        driver_factory=lambda: FlakyMonthDriver(failures, 30, window=20),
+    )
+
+
+def test_get_range_retries_failed_months_in_order():
+    c = flaky_crawler({"202011": 1})
+    items = c.get_range((2020, 10), (2020, 12), workers=2, progress=False)
+    assert len(items) == 90
+    dates = [item["date"] for item in items]
+    assert dates == sorted(dates)
+    assert [d.month for d in dates[::30]] == [10, 11, 12]
+    # the phases of the spawned worker are merged
+    phases = c.stats()["phases"]
+    assert phases["start_driver"]["count"] >= 2
+    assert phases["navigation"]["count"] >= 4
+    c.close()
+
+
+def test_get_range_reports_months_failing_every_retry():
+    c = flaky_crawler({"202011": 3})
+    with pytest.raises(RuntimeError, match="1 month"):
+        c.get_range((2020, 10), (2020, 12), retries=2, progress=False)
+    c.close()
+
+
+def test_session_is_saved_and_restored(tmp_path):
+    path = str(tmp_path / "cookies.json")
+    c = crawler(cookie_path=path)
+    c.close()
+    assert c.driver.quit_called
+    restored = crawler(cookie_path=path)
+    assert restored.driver._cookies
+    assert len(list(restored.iter_data(2020, 10, progress=False))) == 50
@@ -0,0 +1,160 @@
+import datetime
+import sqlite3
+import time
+
+import pytest
+
+from stub_server import StubZaimServer, generate_id_tables
+
+from pyzaim import Outbox
+from pyzaim.outbox import DONE, FAILED, INFLIGHT, PENDING
+
+from conftest import make_api
+
+GENRE = generate_id_tables()[0][5]
+# the generated records end in 2019, so the records of this date are those of the tests
+DATE = datetime.date(2020, 1, 1)
+
+
+@pytest.fixture
+def journal(tmp_path):
+    return str(tmp_path / "outbox.sqlite3")
+
+
+def insert(outbox, amount=100, **kwargs):
+    return outbox.insert_payment(DATE, amount, GENRE["category_id"], GENRE["id"], **kwargs)
+
+
+def update(outbox, data_id, amount, **kwargs):
+    return outbox.update_payment(
+        data_id, DATE, amount, GENRE["category_id"], GENRE["id"], **kwargs
+    )
+
+
+def test_identical_inserts_are_all_sent(api, server, journal):
+    n = len(server.money.records)
+    with Outbox(api, journal, interval=0.05) as outbox:
+        keys = [insert(outbox) for _ in range(3)]
+        assert outbox.flush(10)
+    assert len(set(keys)) == 3
+    assert len(server.money.records) == n + 3
+
+
+def test_dedupe_sends_identical_inserts_once(api, server, journal):
+    n = len(server.money.records)
+    with Outbox(api, journal, interval=0.05, dedupe=True) as outbox:
+        keys = [insert(outbox) for _ in range(3)]
+        assert outbox.flush(10)
+        # a sent insert is still not sent again, e.g. when an import is run twice
+        keys.append(insert(outbox))
+        assert outbox.flush(10)
+    assert len(set(keys)) == 1
+    assert len(server.money.records) == n + 1
+
+
+def test_explicit_keys_are_sent_once(api, server, journal):
+    n = len(server.money.records)
+    with Outbox(api, journal, interval=0.05) as outbox:
+        assert insert(outbox, key="row-1") == insert(outbox, key="row-1") == "row-1"
+        assert outbox.flush(10)
+    assert len(server.money.records) == n + 1
+
+
+def test_update_repeating_a_sent_one_is_sent_again(api, server, journal):
+    with Outbox(api, journal, interval=0.05, dedupe=True) as outbox:
+        key = insert(outbox)
+        assert outbox.flush(10)
+        data_id = outbox.status(key)["data_id"]
+        for amount in (1, 2, 1):
+            update(outbox, data_id, amount)
+            assert outbox.flush(10)
+        assert server.money.records[data_id]["amount"] == 1
+        assert outbox.stats()[DONE] == 4
+
+
+def test_update_repeating_a_queued_one_keeps_the_order(api, server, journal):
+    with Outbox(api, journal, interval=0.05, dedupe=True) as outbox:
+        key = insert(outbox)
+        assert outbox.flush(10)
+        data_id = outbox.status(key)["data_id"]
+        outbox.stop()
+        for amount in (5, 6, 5):
+            update(outbox, data_id, amount)
+        outbox.start()
+        assert outbox.flush(10)
+    assert server.money.records[data_id]["amount"] == 5
+
+
+def test_inserts_in_flight_are_looked_up_before_replay(api, server, journal):
+    # the process died after the first insert reached the server and before the second
+    landed = api.insert_payment(DATE, 777, GENRE["category_id"], GENRE["id"]).json()
+    outbox = Outbox(api, journal, interval=0.05, start=False)
+    keys = [insert(outbox, 777), insert(outbox, 888)]
+    with sqlite3.connect(journal) as connection:
+        connection.execute("UPDATE outbox SET state = ?", (INFLIGHT,))
+    n = len(server.money.records)
+
+    outbox.start()
+    assert outbox.flush(10)
+    entries = [outbox.status(key) for key in keys]
+    outbox.close()
+    assert [entry["state"] for entry in entries] == [DONE, DONE]
+    assert entries[0]["data_id"] == landed["money"]["id"]
+    assert len(server.money.records) == n + 1
+
+
+def test_transient_errors_fail_after_max_attempts(journal):
+    with StubZaimServer(throttle_every=1) as server:
+        api = make_api(server)
+        with Outbox(
+            api, journal, interval=0.02, max_retries=0, backoff=0.01, max_attempts=3
+        ) as outbox:
+            key = update(outbox, 1, 100)
+            assert outbox.flush(10)
+            entry = outbox.status(key)
+    assert entry["state"] == FAILED
+    assert entry["attempts"] == 3
+    assert entry["status_code"] == 429
+
+
+def test_close_gives_up_after_close_timeout(journal):
+    with StubZaimServer(throttle_every=1) as server:
+        api = make_api(server)
+        outbox = Outbox(
+            api, journal, interval=0.02, max_retries=0, backoff=0.01, max_attempts=None,
+            close_timeout=0.3,
+        )
+        key = update(outbox, 1, 100)
+        start = time.monotonic()
+        assert outbox.close() is False
+        assert time.monotonic() - start < 2
+    # the write is kept for the next outbox of the journal
+    with sqlite3.connect(journal) as connection:
+        state = connection.execute("SELECT state FROM outbox WHERE key = ?", (key,)).fetchone()[0]
+    assert state in (PENDING, INFLIGHT)
+
+
+class UnavailableServer(StubZaimServer):
+    """server answering every insert with 503 without creating the record.
+    """
+    posts = 0
+
+    def handle(self, method, path, params, form):
+        if method == "POST":
+            self.posts += 1
+            return 503, {"message": "service unavailable"}
+        return super().handle(method, path, params, form)
+
+
+def test_inserts_failing_with_server_errors_are_backed_off(journal):
+    with UnavailableServer() as server:
+        api = make_api(server)
+        with Outbox(
+            api, journal, interval=0.02, backoff=0.5, max_attempts=10, close_timeout=0.1
+        ) as outbox:
+            key = insert(outbox)
+            time.sleep(1.0)
+            entry = outbox.status(key)
+    # the insert not found on the server waits backoff * 2 ** attempts (1 s) before it is resent
+    assert entry["state"] in (PENDING, INFLIGHT)
+    assert server.posts <= 2
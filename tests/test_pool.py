@@ -0,0 +1,64 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from pyzaim import ZaimClientPool
+
+
+@pytest.fixture
+def cookie_server():
+    """server setting a cookie on every response and recording the cookies it receives.
+    """
+    received = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            received.append(self.headers.get("Cookie"))
+            body = b'{"me": {}}'
+            self.send_response(200)
+            self.send_header("Set-Cookie", "session=tenant{}; Path=/".format(len(received)))
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:{}".format(server.server_port), received
+    server.shutdown()
+    server.server_close()
+
+
+def test_cookies_are_not_shared_between_tenants(cookie_server):
+    base_url, received = cookie_server
+    with ZaimClientPool("consumer-id", "consumer-secret", base_url=base_url) as pool:
+        pool.client("token1", "secret1").verify()
+        pool.client("token2", "secret2").verify()
+        assert len(pool.session.cookies) == 0
+    assert received == [None, None]
+
+
+def test_clients_are_reused_and_evicted(server):
+    with ZaimClientPool(
+        "consumer-id", "consumer-secret", max_clients=2, base_url=server.base_url
+    ) as pool:
+        first = pool.client("token1", "secret1")
+        assert pool.client("token1", "secret1") is first
+        pool.client("token2", "secret2")
+        pool.client("token3", "secret3")
+        assert len(pool) == 2
+        assert pool.client("token1", "secret1") is not first
+
+
+def test_map_reports_each_tenant(server):
+    tenants = [("token1", "secret1"), ("token2", "secret2")]
+    with ZaimClientPool("consumer-id", "consumer-secret", base_url=server.base_url) as pool:
+        results = pool.map(lambda api: len(api.get_data({"limit": 5})), tenants)
+    assert [(r.access_token, r.ok, r.value) for r in results] == [
+        ("token1", True, 5), ("token2", True, 5),
+    ]
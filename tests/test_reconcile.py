@@ -0,0 +1,112 @@
+import datetime
+import types
+
+from pyzaim.reconcile import reconcile
+
+DATE = datetime.date(2020, 1, 1)
+
+
+def tables():
+    # 'その他' is a genre of two categories and the name of two categories
+    genres = {
+        10101: ("食料品", 101),
+        10102: ("その他", 101),
+        10201: ("電車", 102),
+        10202: ("その他", 102),
+        10301: ("その他", 103),
+    }
+    return types.SimpleNamespace(
+        genre_itos={i: name for i, (name, _) in genres.items()},
+        genre_to_category={i: category for i, (_, category) in genres.items()},
+        category_itos={101: "食費", 102: "交通", 103: "その他", 201: "その他"},
+        account_itos={1: "財布", 2: "銀行"},
+    )
+
+
+def api_record(data_id, amount, category_id=102, genre_id=10202, **fields):
+    record = {
+        "id": data_id,
+        "mode": "payment",
+        "date": "2020-01-01",
+        "amount": amount,
+        "category_id": category_id,
+        "genre_id": genre_id,
+        "from_account_id": 1,
+        "to_account_id": 0,
+        "name": "",
+        "place": "",
+        "comment": "",
+    }
+    record.update(fields)
+    return record
+
+
+def crawled(data_id, amount, category="交通", genre="その他", **fields):
+    item = {
+        "id": str(data_id) if data_id is not None else "",
+        "type": "payment",
+        "date": DATE,
+        "amount": amount,
+        "category": category,
+        "genre": genre,
+        "from_account": "財布",
+    }
+    item.update(fields)
+    return item
+
+
+def test_records_are_matched_by_id_fields_and_key():
+    records = [api_record(1, 100), api_record(2, 200), api_record(3, 300, comment="old")]
+    items = [crawled(1, 100), crawled(None, 200), crawled(None, 300, comment="new")]
+    result = reconcile(items, records, tables())
+    assert result.summary() == {
+        "matches": 2, "drifts": 1, "missing_in_api": 0, "missing_in_crawler": 0, "unresolved": 0,
+    }
+    assert result.drifts[0].fields == {"comment": ("new", "old")}
+    assert result.calls() == [("update_payment", {
+        "date": DATE, "amount": 300, "category_id": 102, "genre_id": 10202,
+        "from_account_id": 1, "comment": "new", "name": None, "place": None, "data_id": 3,
+    })]
+
+
+def test_missing_records_on_both_sides():
+    result = reconcile([crawled(None, 500)], [api_record(1, 100)], tables())
+    assert result.missing_in_api == [crawled(None, 500)]
+    assert result.missing_in_crawler == [api_record(1, 100)]
+    assert result.calls(update=False) == [("insert_payment", {
+        "date": DATE, "amount": 500, "category_id": 102, "genre_id": 10202,
+        "from_account_id": 1, "comment": None, "name": None, "place": None,
+    })]
+
+
+def test_shared_genre_name_is_resolved_within_its_category():
+    result = reconcile(
+        [crawled(1, 100, category="交通"), crawled(2, 200, category="その他")],
+        [api_record(1, 100), api_record(2, 200, category_id=103, genre_id=10301)],
+        tables(),
+    )
+    assert len(result.matches) == 2
+    assert not result.drifts
+    assert not result.unresolved
+
+
+def test_ambiguous_names_are_reported_instead_of_guessed():
+    items = [
+        crawled(1, 100, category=None),
+        {"id": "", "type": "income", "date": DATE, "amount": 7, "category": "その他",
+         "to_account": "財布"},
+    ]
+    result = reconcile(items, [api_record(1, 100)], tables())
+    assert [(field, name) for _, field, name in result.unresolved] == [
+        ("genre", "その他"), ("category", "その他"),
+    ]
+    # the unresolved genre is not a difference, and the income cannot be inserted
+    assert result.matches == [(items[0], api_record(1, 100))]
+    assert result.calls() == []
+
+
+def test_crawled_names_take_precedence_over_ids_filled_from_them():
+    # e.g. from_crawler filled the ID of the first 'その他' genre found
+    item = crawled(1, 100, category_id=101, genre_id=10102)
+    result = reconcile([item], [api_record(1, 100)], tables())
+    assert result.matches == [(item, api_record(1, 100))]
@@ -0,0 +1,44 @@
+from pyzaim import records
+from pyzaim.records import Payment, from_api, from_crawler
+
+
+def payment(data_id, genre_id):
+    return {"id": data_id, "mode": "payment", "date": "2021-01-01", "amount": 100,
+            "category_id": genre_id // 100, "genre_id": genre_id}
+
+
+def test_ids_are_shared_between_records():
+    # int() makes two distinct objects of the same value
+    first = from_api(payment(1, int("10101")))
+    second = from_api(payment(2, int("10101")))
+    assert isinstance(first, Payment)
+    assert first.genre_id is second.genre_id
+
+
+def test_shared_ids_are_bounded(monkeypatch):
+    monkeypatch.setattr(records, "_SHARED_INTS", {})
+    for genre_id in range(10 ** 6, 10 ** 6 + 3 * records._MAX_SHARED_INTS):
+        from_api(payment(genre_id, genre_id))
+    assert len(records._SHARED_INTS) == records._MAX_SHARED_INTS
+
+
+def test_api_records_behave_like_dicts(api, server):
+    money = api.get_data({"mapping": 1, "limit": 20})
+    compact = api.get_data({"mapping": 1, "limit": 20}, records=True)
+    for record, item in zip(money, compact):
+        assert item["mode"] == record["mode"]
+        assert item["amount"] == record["amount"]
+        assert item.get("genre") == api.genre_itos.get(record["genre_id"])
+        assert all(record[key] == value for key, value in item.items() if key in record)
+    payment = next(item for item in compact if item.mode == "payment")
+    assert "to_account" not in payment and payment.get("to_account") is None
+
+
+def test_crawler_items_get_the_ids_of_their_names(api, server):
+    genre = server.genres[7]
+    item = {"id": "1", "type": "payment", "date": "2020-10-01", "amount": 100,
+            "genre": genre["name"], "from_account": "account2", "count": "1"}
+    record = from_crawler(item, api)
+    assert isinstance(record, Payment)
+    assert (record.genre_id, record.from_account_id) == (genre["id"], api.account_stoi["account2"])
+    assert record.to_dict()["genre"] == genre["name"]
@@ -0,0 +1,87 @@
+import datetime
+
+import pytest
+
+from pyzaim import ZaimStore
+
+
+def add_payment(server, date, amount=1000, genre=None):
+    genre = genre or server.genres[5]
+    return server.money.insert("payment", {
+        "date": date.strftime("%Y-%m-%d"),
+        "amount": amount,
+        "category_id": genre["category_id"],
+        "genre_id": genre["id"],
+    })
+
+
+def test_records_dated_in_the_future_are_mirrored(api, server, tmp_path):
+    ahead = datetime.date.today() + datetime.timedelta(days=40)
+    record = add_payment(server, ahead)
+    with ZaimStore(str(tmp_path / "zaim.sqlite3"), api) as store:
+        store.sync()
+        assert [r["id"] for r in store.query(start_date=ahead)] == [record["id"]]
+
+        # and their deletion is detected by the next sync
+        server.money.delete("payment", record["id"])
+        store.sync()
+        assert store.query(start_date=ahead) == []
+
+
+def test_sync_stops_at_end_date(api, server, tmp_path):
+    ahead = datetime.date.today() + datetime.timedelta(days=40)
+    add_payment(server, ahead)
+    with ZaimStore(str(tmp_path / "zaim.sqlite3"), api) as store:
+        store.sync(end_date=datetime.date.today())
+        assert store.query(start_date=ahead) == []
+
+
+def test_genre_names_are_resolved_within_the_category(api, server, tmp_path):
+    first, second = server.genres[5], server.genres[10]
+    shared = dict(second, id=9999, name=first["name"])
+    server.genres.append(shared)
+    add_payment(server, datetime.date(2021, 4, 1), genre=first)
+    record = add_payment(server, datetime.date(2021, 4, 2), genre=shared)
+    with ZaimStore(str(tmp_path / "zaim.sqlite3"), api) as store:
+        store.sync()
+        with pytest.raises(ValueError):
+            store.query(genre=first["name"])
+        found = store.query(category=second["category_id"], genre=first["name"])
+        assert [r["id"] for r in found] == [record["id"]]
+
+
+def test_resync_mirrors_the_edits_on_the_server(api, server, tmp_path):
+    recent = datetime.date.today() - datetime.timedelta(days=5)
+    edited = add_payment(server, recent, amount=100)
+    deleted = add_payment(server, recent, amount=200)
+    with ZaimStore(str(tmp_path / "zaim.sqlite3"), api) as store:
+        assert store.sync() == len(server.money.records)
+        assert store.watermark == datetime.date.today()
+
+        server.money.update("payment", edited["id"], {"amount": "150"})
+        server.money.delete("payment", deleted["id"])
+        # created now with a date far before the lookback window
+        backdated = add_payment(server, datetime.date(2016, 3, 1), amount=300)
+        store.sync()
+
+        mirrored = {r["id"]: r for r in store.query()}
+        assert set(mirrored) == set(server.money.records)
+        assert mirrored[edited["id"]]["amount"] == 150
+        assert mirrored[backdated["id"]]["amount"] == 300
+
+
+def test_query_filters_the_local_records(api, server, tmp_path):
+    with ZaimStore(str(tmp_path / "zaim.sqlite3"), api) as store:
+        store.sync()
+        server.stop()
+        start, end = datetime.date(2017, 1, 1), datetime.date(2017, 12, 31)
+        account = server.accounts[2]
+        found = store.query(start_date=start, end_date=end, mode="payment", account=account["name"])
+        expected = [
+            r for r in server.money.records.values()
+            if r["mode"] == "payment" and "2017-01-01" <= r["date"] <= "2017-12-31"
+            and account["id"] in (r["from_account_id"], r["to_account_id"])
+        ]
+        assert sorted(r["id"] for r in found) == sorted(r["id"] for r in expected)
+        assert [r["date"] for r in found] == sorted((r["date"] for r in found), reverse=True)
+        assert store.id_tables()["account_itos"][account["id"]] == account["name"]